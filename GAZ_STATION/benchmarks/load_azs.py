@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест AZSCore: поток клиентов, пополнения и перекачки
+
+Клиенты приходят пуассоновским потоком с заданной частотой (--rate, 0 -
+без пауз), выбирают вид топлива по --fuel-mix и любую колонку с этим
+топливом, объём заправки берётся из распределения --liters. Когда цистерна
+опускается ниже --delivery-threshold своего объёма, приезжает бензовоз
+(refuel_tank), а доля --transfer-share операций - перекачки между
+цистернами одного вида топлива.
+
+Задержка считается от запланированного прихода клиента, поэтому очередь
+при перегрузке тоже попадает в перцентили. Байты на операцию - по счётчику
+записи процесса (/proc/self/io) и по росту директории данных. Результат
+сохраняется в JSON (--output) и может сравниваться с прошлым прогоном
+(--compare).
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.azs_core import AZSCore
+
+# Допустимый объём одной заправки, л
+MIN_LITERS = 1.0
+MAX_LITERS = 80.0
+
+
+def percentile(sorted_values, q: float) -> float:
+    """Перцентиль q (0..100) отсортированного списка"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def parse_fuel_mix(spec: str) -> dict:
+    """"АИ-92=0.35,АИ-95=0.4" -> {вид топлива: вес}"""
+    mix = {}
+    for part in spec.split(','):
+        fuel_type, weight = part.split('=')
+        fuel_type = fuel_type.strip()
+        if fuel_type not in config.FUEL_TYPES:
+            raise ValueError(f"Неизвестный вид топлива: {fuel_type}")
+        mix[fuel_type] = float(weight)
+    return mix
+
+
+def parse_liters(spec: str):
+    """Распределение объёма заправки: lognormal:медиана:sigma, normal:среднее:sd, uniform:от:до"""
+    name, a, b = spec.split(':')
+    a, b = float(a), float(b)
+    if name == 'lognormal':
+        draw = lambda rnd: rnd.lognormvariate(math.log(a), b)
+    elif name == 'normal':
+        draw = lambda rnd: rnd.gauss(a, b)
+    elif name == 'uniform':
+        draw = lambda rnd: rnd.uniform(a, b)
+    else:
+        raise ValueError(f"Неизвестное распределение: {name}")
+    return lambda rnd: round(min(MAX_LITERS, max(MIN_LITERS, draw(rnd))), 2)
+
+
+def bytes_written() -> int:
+    """Байт, переданных процессом в write() (0, если счётчик недоступен)"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def dir_size(path: str) -> int:
+    """Суммарный размер файлов директории"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def latency_summary(latencies: list) -> dict:
+    """Перцентили задержки в миллисекундах"""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'mean': sum(latencies) / len(latencies) * 1000,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': latencies[-1] * 1000,
+    }
+
+
+class LoadGenerator:
+    """Генератор операций для одной станции"""
+
+    def __init__(self, azs: AZSCore, args):
+        self.azs = azs
+        self.rnd = random.Random(args.seed)
+        self.mix = parse_fuel_mix(args.fuel_mix)
+        self.liters = parse_liters(args.liters)
+        self.threshold = args.delivery_threshold
+        self.transfer_share = args.transfer_share
+        self.fuel_columns = {}
+        for column, fuels in config.COLUMNS_CONFIG.items():
+            for fuel_type in fuels:
+                self.fuel_columns.setdefault(fuel_type, []).append(column)
+        self.fuels = [fuel for fuel in self.mix if fuel in self.fuel_columns]
+        self.weights = [self.mix[fuel] for fuel in self.fuels]
+        self.pairs = [
+            (a.id, b.id) for a in azs.tanks for b in azs.tanks
+            if a.id != b.id and a.fuel_type == b.fuel_type
+        ]
+
+    def next_operation(self):
+        """(тип операции, функция) очередного клиента или перекачки"""
+        if self.pairs and self.rnd.random() < self.transfer_share:
+            from_id, to_id = self.rnd.choice(self.pairs)
+            liters = round(self.rnd.uniform(50, 500), 1)
+            return 'transfer', lambda: self.azs.transfer_fuel(from_id, to_id, liters)
+        fuel_type = self.rnd.choices(self.fuels, self.weights)[0]
+        column = self.rnd.choice(self.fuel_columns[fuel_type])
+        liters = self.liters(self.rnd)
+        return 'sale', lambda: self.azs.serve_customer(column, fuel_type, liters)
+
+    def deliveries(self):
+        """Пополнения цистерн, опустившихся ниже порога: [(тип операции, функция)]"""
+        operations = []
+        for tank in self.azs.tanks:
+            if tank.current_volume < tank.max_volume * self.threshold:
+                liters = round(tank.max_volume * 0.9 - tank.current_volume, 1)
+                operations.append(('refuel', lambda tank=tank, liters=liters: self.azs.refuel_tank(tank.id, liters)))
+            if not tank.enabled and tank.check_level():
+                operations.append(('toggle', lambda tank=tank: self.azs.toggle_tank(tank.id, True)))
+        return operations
+
+
+def run(args) -> dict:
+    config.TRANSACTION_LOG_FORMAT = args.log_format
+    with tempfile.TemporaryDirectory() as data_dir:
+        azs = AZSCore(data_dir, persistence=args.persistence, flush_policy=args.policy,
+                      backend=args.backend, metrics=args.metrics)
+        generator = LoadGenerator(azs, args)
+        # Подготовка: включаем цистерны, в которых достаточно топлива
+        for _, operation in generator.deliveries():
+            operation()
+        azs.flush()
+
+        latencies = {}
+        failed = {}
+        size_before = dir_size(data_dir)
+        written_before = bytes_written()
+        interval = 1.0 / args.rate if args.rate > 0 else 0.0
+        started = time.perf_counter()
+        arrival = started
+        deadline = started + args.duration if args.duration else None
+        done = 0
+        queue = []
+        while done < args.operations:
+            if not queue:
+                queue = generator.deliveries() or [generator.next_operation()]
+            op_type, operation = queue.pop(0)
+            if interval:
+                arrival += generator.rnd.expovariate(1.0 / interval)
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                scheduled = arrival
+            else:
+                scheduled = time.perf_counter()
+            result = operation()
+            finished = time.perf_counter()
+            latencies.setdefault(op_type, []).append(finished - scheduled)
+            if not result[0]:
+                failed[op_type] = failed.get(op_type, 0) + 1
+            done += 1
+            if deadline is not None and finished >= deadline:
+                break
+        elapsed = time.perf_counter() - started
+
+        # Отложенная запись тоже относится к прогону
+        azs.close()
+        written = bytes_written() - written_before
+        growth = dir_size(data_dir) - size_before
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'benchmark': 'load_azs',
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'params': vars(args),
+        'operations': done,
+        'elapsed_s': elapsed,
+        'throughput_ops_s': done / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'all': latency_summary(all_latencies),
+            **{op_type: latency_summary(values) for op_type, values in sorted(latencies.items())}
+        },
+        'failed': failed,
+        'bytes_written_per_op': written / done if done else 0.0,
+        'data_growth_per_op': growth / done if done else 0.0,
+        'metrics': azs.get_metrics() if args.metrics else None,
+    }
+
+
+def print_result(result: dict):
+    print(f"Операций: {result['operations']} за {result['elapsed_s']:.2f} с - "
+          f"{result['throughput_ops_s']:,.0f} оп/с")
+    for op_type, summary in result['latency_ms'].items():
+        if not summary['count']:
+            continue
+        print(f"{op_type:9} ({summary['count']:6}): p50={summary['p50']:.3f} p95={summary['p95']:.3f} "
+              f"p99={summary['p99']:.3f} max={summary['max']:.3f} мс")
+    if result['failed']:
+        print("Отказов: " + ", ".join(f"{op_type}: {count}" for op_type, count in result['failed'].items()))
+    print(f"Записано: {result['bytes_written_per_op']:,.0f} байт/оп, "
+          f"рост данных: {result['data_growth_per_op']:,.0f} байт/оп")
+
+
+def print_comparison(old: dict, new: dict):
+    """Сравнение основных показателей с прошлым прогоном"""
+    rows = [
+        ('оп/с', old['throughput_ops_s'], new['throughput_ops_s']),
+        ('p50, мс', old['latency_ms']['all'].get('p50', 0.0), new['latency_ms']['all'].get('p50', 0.0)),
+        ('p95, мс', old['latency_ms']['all'].get('p95', 0.0), new['latency_ms']['all'].get('p95', 0.0)),
+        ('p99, мс', old['latency_ms']['all'].get('p99', 0.0), new['latency_ms']['all'].get('p99', 0.0)),
+        ('байт/оп', old['bytes_written_per_op'], new['bytes_written_per_op']),
+    ]
+    print("\nСравнение с прошлым прогоном:")
+    for name, before, after in rows:
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:10} {before:12,.3f} -> {after:12,.3f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест AZSCore")
+    parser.add_argument('--operations', type=int, default=5000)
+    parser.add_argument('--duration', type=float, default=None, help="ограничение по времени, с")
+    parser.add_argument('--rate', type=float, default=0.0, help="клиентов в секунду (0 - без пауз)")
+    parser.add_argument('--fuel-mix', default="АИ-92=0.35,АИ-95=0.4,АИ-98=0.05,ДТ=0.2")
+    parser.add_argument('--liters', default="lognormal:30:0.45",
+                        help="распределение литров: lognormal:медиана:sigma, normal:среднее:sd, uniform:от:до")
+    parser.add_argument('--delivery-threshold', type=float, default=0.2,
+                        help="доля объёма цистерны, ниже которой приезжает бензовоз")
+    parser.add_argument('--transfer-share', type=float, default=0.01, help="доля перекачек среди операций")
+    parser.add_argument('--persistence', choices=['full', 'wal'], default=config.PERSISTENCE_MODE)
+    parser.add_argument('--policy', choices=['immediate', 'interval', 'count'], default=config.FLUSH_POLICY)
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default=config.STORAGE_BACKEND)
+    parser.add_argument('--log-format', choices=['jsonl', 'binary'], default=config.TRANSACTION_LOG_FORMAT)
+    parser.add_argument('--metrics', action='store_true', help="включить встроенные метрики AZSCore")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', metavar='FILE', help="сохранить результат в JSON")
+    parser.add_argument('--compare', metavar='FILE', help="сравнить с результатом прошлого прогона")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_result(result)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(json.load(f), result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
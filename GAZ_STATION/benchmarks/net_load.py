@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест сетевого сервиса АЗС
+
+Запускает сервис во временной директории данных (или подключается к уже
+запущенному через --connect), создаёт N терминалов, каждый из которых держит
+до --pipeline запросов в полёте, и измеряет запросы/с и задержку
+(p50/p95/p99/max). Перед нагрузкой проверяет, что запрос длиннее MAX_LINE
+получает ответ с ошибкой, а соединение продолжает обслуживаться.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.azs_core import AZSCore
+from net.server import MAX_LINE, AZSServer
+from net.client import AZSClientPool
+
+
+def percentile(sorted_values, q: float) -> float:
+    """Перцентиль q (0..100) отсортированного списка"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def terminal(pool: AZSClientPool, requests: int, pipeline: int, seed: int, latencies: list):
+    """Один кассовый терминал: requests продаж, не более pipeline одновременно"""
+    rnd = random.Random(seed)
+    columns = list(config.COLUMNS_CONFIG)
+    slots = asyncio.Semaphore(pipeline)
+
+    async def one_sale():
+        column = rnd.choice(columns)
+        fuel_type = rnd.choice(config.COLUMNS_CONFIG[column])
+        liters = round(rnd.uniform(0.1, 2.0), 2)
+        async with slots:
+            started = time.perf_counter()
+            await pool.serve_customer(column, fuel_type, liters)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one_sale() for _ in range(requests)))
+
+
+async def check_oversized_line(host: str, port: int) -> bool:
+    """Слишком длинная строка: ответ с ошибкой, следующий запрос того же соединения выполняется"""
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+    try:
+        writer.write(b'{"id": 1, "method": "ping", "pad": "' + b'x' * (MAX_LINE + 1) + b'"}\n')
+        writer.write(b'{"id": 2, "method": "ping"}\n')
+        await writer.drain()
+        rejected = json.loads(await reader.readline())
+        answered = json.loads(await reader.readline())
+        return 'error' in rejected and answered == {'id': 2, 'result': 'pong'}
+    except (ConnectionError, ValueError):
+        return False
+    finally:
+        writer.close()
+
+
+async def run(args):
+    server = None
+    azs = None
+    tmp = None
+    host, port = args.host, args.port
+    if not args.connect:
+        tmp = tempfile.TemporaryDirectory()
+        azs = AZSCore(tmp.name, persistence=args.persistence, flush_policy=args.policy,
+                      concurrent=args.workers > 0)
+        server = AZSServer(azs, host, 0, args.workers)
+        await server.start()
+        port = server.port
+
+    oversized_ok = await check_oversized_line(host, port)
+
+    latencies = []
+    async with AZSClientPool(host, port, args.connections) as pool:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            terminal(pool, args.requests, args.pipeline, args.seed + i, latencies)
+            for i in range(args.terminals)
+        ))
+        elapsed = time.perf_counter() - started
+
+    if server is not None:
+        await server.stop()
+        azs.close()
+        tmp.cleanup()
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"Слишком длинный запрос: ответ с ошибкой, соединение обслуживается дальше: "
+          f"{'да' if oversized_ok else 'НЕТ'}")
+    print(f"Терминалов: {args.terminals}, соединений: {args.connections}, конвейер: {args.pipeline}")
+    print(f"Запросов: {total} за {elapsed:.2f} с - {total / elapsed:,.0f} запросов/с")
+    print("Задержка, мс: "
+          f"p50={percentile(latencies, 50) * 1000:.2f} "
+          f"p95={percentile(latencies, 95) * 1000:.2f} "
+          f"p99={percentile(latencies, 99) * 1000:.2f} "
+          f"max={latencies[-1] * 1000 if latencies else 0:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сетевого сервиса АЗС")
+    parser.add_argument('--connect', action='store_true', help="подключиться к запущенному сервису")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--terminals', type=int, default=16)
+    parser.add_argument('--connections', type=int, default=4, help="размер пула соединений")
+    parser.add_argument('--requests', type=int, default=500, help="продаж на терминал")
+    parser.add_argument('--pipeline', type=int, default=8, help="запросов в полёте на терминал")
+    parser.add_argument('--persistence', choices=['full', 'wal'], default='wal')
+    parser.add_argument('--policy', choices=['immediate', 'interval', 'count'], default='interval')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Скорость воспроизведения истории на других конфигурациях АЗС
+
+Строит в памяти историю за --days дней по правилам AZSCore: --sales-per-day
+продаж в день из первой включённой цистерны колонки, отключение цистерны
+ниже min_level, каждое утро пополнение цистерн, опустившихся ниже половины
+объёма, и ручное включение отключённых. Затем замеряет сборку колоночной
+истории и воспроизведение на текущей конфигурации и на нескольких
+вариантах (цены, пороги min_level, другая раскладка цистерн). Выручка
+текущей конфигурации должна совпасть с записанной.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import config
+from data.history_store import ColumnarHistory
+from planning.replay import Variant, replay
+
+
+def make_history(args) -> list:
+    """История продаж, пополнений и включений цистерн за --days дней"""
+    rnd = random.Random(args.seed)
+    tanks = [dict(tank) for tank in config.INITIAL_TANKS]
+    pairs = [(column, fuel_type) for column, fuels in config.COLUMNS_CONFIG.items() for fuel_type in fuels]
+    start = datetime(2025, 1, 1)
+    records = []
+
+    def record(trans_type: str, moment: datetime, details: dict):
+        records.append({'id': str(uuid.UUID(int=rnd.getrandbits(128), version=4)), 'type': trans_type,
+                        'timestamp': moment.isoformat(), 'details': details})
+
+    for day in range(args.days):
+        morning = start + timedelta(days=day, hours=6)
+        for tank in tanks:
+            if tank['current_volume'] < tank['max_volume'] / 2:
+                liters = float(int(tank['max_volume'] - tank['current_volume']))
+                tank['current_volume'] += liters
+                record('refuel', morning, {'tank_id': tank['id'], 'liters_added': liters,
+                                           'new_volume': tank['current_volume']})
+            if not tank['enabled'] and tank['current_volume'] >= tank['min_level']:
+                tank['enabled'] = True
+                record('tank_toggle', morning, {'tank_id': tank['id'], 'action': "включена",
+                                                'new_state': True, 'volume': tank['current_volume']})
+        step = 16 * 3600 / args.sales_per_day
+        for i in range(args.sales_per_day):
+            column, fuel_type = rnd.choice(pairs)
+            tank = next((tank for tank in tanks if tank['enabled'] and tank['fuel_type'] == fuel_type
+                         and column in tank['connected_to']), None)
+            liters = round(rnd.uniform(5, 60), 2)
+            if tank is None or liters > tank['current_volume']:
+                continue
+            price = config.FUEL_TYPES[fuel_type]
+            tank['current_volume'] -= liters
+            if tank['current_volume'] < tank['min_level']:
+                tank['enabled'] = False
+            record('sale', morning + timedelta(seconds=i * step),
+                   {'column': column, 'fuel_type': fuel_type, 'liters': liters, 'price_per_liter': price,
+                    'total_price': liters * price, 'tank_id': tank['id']})
+    return records
+
+
+def variants() -> list:
+    """Варианты для сравнения с текущей конфигурацией"""
+    small_tank = [dict(tank, max_volume=12000, current_volume=min(tank['current_volume'], 12000))
+                  if tank['id'] == "АИ-92_1" else dict(tank) for tank in config.INITIAL_TANKS]
+    return [
+        Variant.from_dict({'name': "АИ-95 +3%", 'prices': {"АИ-95": config.FUEL_TYPES["АИ-95"] * 1.03}}),
+        Variant.from_dict({'name': "min_level x6", 'min_levels': {
+            tank['id']: tank['min_level'] * 6 for tank in config.INITIAL_TANKS}}),
+        Variant.from_dict({'name': "АИ-92_1 на 12 000 л", 'tanks': small_tank}),
+    ]
+
+
+def run(args) -> dict:
+    started = time.perf_counter()
+    records = make_history(args)
+    generated = time.perf_counter()
+    history = ColumnarHistory.from_records(records)
+    built = time.perf_counter()
+    results = replay(history, variants())
+    replayed = time.perf_counter()
+    baseline = results[0]
+    return {
+        'benchmark': 'replay_azs',
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'params': vars(args),
+        'transactions': len(records),
+        'generate_s': generated - started,
+        'history_build_s': built - generated,
+        'replay_s': replayed - built,
+        'variants': len(results),
+        'baseline_matches_recorded': abs(baseline['revenue'] - baseline['recorded_revenue'])
+                                     <= 1e-6 * max(1.0, baseline['recorded_revenue']),
+        'results': results,
+    }
+
+
+def print_result(result: dict):
+    print(f"История: {result['transactions']} транзакций за {result['params']['days']} дн. "
+          f"(построена за {result['generate_s']:.1f} с)")
+    print(f"Колоночная история: {result['history_build_s']:.2f} с")
+    print(f"Воспроизведение {result['variants']} конфигураций: {result['replay_s']:.2f} с "
+          f"({result['replay_s'] / result['variants']:.2f} с на конфигурацию)")
+    print(f"Выручка текущей конфигурации совпадает с записанной: "
+          f"{'да' if result['baseline_matches_recorded'] else 'НЕТ'}")
+    for item in result['results']:
+        delta = item.get('delta')
+        change = f", разница {delta['revenue']:+,.0f} руб." if delta else ""
+        refused = sum(values['sales'] for values in item['refused'].values())
+        print(f"  {item['name']:20} выручка {item['revenue']:16,.0f} руб., отказов {refused:6d}, "
+              f"автоотключений {sum(item['auto_disables'].values()):4d}{change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость воспроизведения истории АЗС")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--sales-per-day', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', metavar='FILE', help="сохранить результат в JSON")
+    args = parser.parse_args()
+    result = run(args)
+    print_result(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Время запуска АЗС на большой истории транзакций
+
+Создаёт директорию данных с --transactions продажами и несколько раз
+запускает отдельный процесс, который делает то же, что main.py до показа
+меню: импортирует ui.menu, создаёт AZSCore и закрывает его. Первый запуск -
+холодный: после записи истории ещё нет статистики по интервалам (она
+строится по журналу) и индекса истории. Остальные --runs запусков - тёплые:
+всё уже на месте. Для каждого запуска выводится время импорта, создания
+AZSCore, закрытия, полное время процесса и файлы данных, которые запуск
+изменил (у тёплого запуска их быть не должно).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import config
+from data.models import Tank, Transaction
+from data.storage import create_storage
+
+
+def make_history(data_dir: str, args):
+    """Записать состояние цистерн и историю продаж за --days дней"""
+    storage = create_storage(data_dir, args.backend, args.log_format)
+    rnd = random.Random(args.seed)
+    tanks = [Tank(**tank) for tank in config.INITIAL_TANKS]
+    routes = [(column, tank) for tank in tanks for column in tank.connected_to]
+    start = datetime.now() - timedelta(days=args.days)
+    step = args.days * 86400 / max(args.transactions, 1)
+    try:
+        storage.save_tanks(tanks)
+        batch = []
+        for i in range(args.transactions):
+            column, tank = rnd.choice(routes)
+            liters = round(rnd.uniform(5, 60), 2)
+            price = config.FUEL_TYPES[tank.fuel_type]
+            batch.append(Transaction(
+                id=str(uuid.uuid4()),
+                type='sale',
+                timestamp=(start + timedelta(seconds=i * step)).isoformat(),
+                details={'column': column, 'fuel_type': tank.fuel_type, 'liters': liters,
+                         'price_per_liter': price, 'total_price': liters * price, 'tank_id': tank.id}
+            ))
+            if len(batch) >= 10000:
+                storage.save_transactions(batch)
+                batch = []
+        storage.save_transactions(batch)
+    finally:
+        storage.close()
+
+
+def file_states(data_dir: str) -> dict:
+    """Размер и время изменения файлов директории данных"""
+    states = {}
+    for name in os.listdir(data_dir):
+        info = os.stat(os.path.join(data_dir, name))
+        states[name] = (info.st_size, info.st_mtime_ns)
+    return states
+
+
+def child(args):
+    """Один запуск: как main.py до показа меню"""
+    config.TRANSACTION_LOG_FORMAT = args.log_format
+    started = time.perf_counter()
+    import ui.menu  # noqa: F401 - то же, что импортирует main.py
+    from core.azs_core import AZSCore
+    imported = time.perf_counter()
+    azs = AZSCore(args.child, persistence=args.persistence, backend=args.backend)
+    created = time.perf_counter()
+    azs.close()
+    closed = time.perf_counter()
+    print(json.dumps({'import_s': imported - started, 'init_s': created - imported, 'close_s': closed - created}))
+
+
+def launch(data_dir: str, args) -> dict:
+    """Запустить процесс и замерить его"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', data_dir,
+               '--backend', args.backend, '--log-format', args.log_format, '--persistence', args.persistence]
+    before = file_states(data_dir)
+    started = time.perf_counter()
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output)
+    result['process_s'] = time.perf_counter() - started
+    after = file_states(data_dir)
+    result['changed_files'] = sorted(name for name in after if before.get(name) != after[name])
+    return result
+
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as data_dir:
+        started = time.perf_counter()
+        make_history(data_dir, args)
+        prepared = time.perf_counter() - started
+        cold = launch(data_dir, args)
+        warm = [launch(data_dir, args) for _ in range(args.runs)]
+    return {
+        'benchmark': 'startup_azs',
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'params': vars(args),
+        'history_write_s': prepared,
+        'cold': cold,
+        'warm': warm,
+    }
+
+
+def print_result(result: dict):
+    print(f"История: {result['params']['transactions']} продаж, записана за {result['history_write_s']:.1f} с")
+    runs = [('холодный', result['cold'])] + [('тёплый', run) for run in result['warm']]
+    for name, run in runs:
+        changed = ", ".join(run['changed_files']) or "нет"
+        print(f"{name:9} импорт {run['import_s'] * 1000:7.1f} мс, AZSCore {run['init_s'] * 1000:8.1f} мс, "
+              f"закрытие {run['close_s'] * 1000:7.1f} мс, процесс {run['process_s'] * 1000:8.1f} мс; "
+              f"изменены: {changed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время запуска АЗС на большой истории")
+    parser.add_argument('--transactions', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=90, help="за сколько дней история")
+    parser.add_argument('--runs', type=int, default=5, help="тёплых запусков")
+    parser.add_argument('--persistence', choices=['full', 'wal'], default=config.PERSISTENCE_MODE)
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default=config.STORAGE_BACKEND)
+    parser.add_argument('--log-format', choices=['jsonl', 'binary'], default=config.TRANSACTION_LOG_FORMAT)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', metavar='FILE', help="сохранить результат в JSON")
+    parser.add_argument('--child', metavar='DIR', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+    result = run(args)
+    print_result(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Стресс-тест параллельного отпуска топлива
+
+Все колонки обслуживают клиентов одновременно, каждая в своём потоке, во
+временной директории данных. После прогона проверяются инварианты:
+  - расход топлива по каждому виду равен сумме литров успешных продаж;
+  - доход и число машин в статистике равны сумме успешных продаж;
+  - ни одна цистерна не ушла в минус и не осталась включённой ниже порога;
+  - состояние, перечитанное с диска, совпадает с состоянием в памяти.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.azs_core import AZSCore
+
+EPSILON = 1e-6
+
+
+def column_worker(azs: AZSCore, column: int, sales: int, seed: int, results: list):
+    """Поток одной колонки: sales продаж случайного топлива"""
+    rnd = random.Random(seed)
+    fuels = config.COLUMNS_CONFIG[column]
+    sold = []
+    for _ in range(sales):
+        fuel_type = rnd.choice(fuels)
+        liters = round(rnd.uniform(5, 60), 2)
+        success, _, price = azs.serve_customer(column, fuel_type, liters)
+        if success:
+            sold.append((fuel_type, liters, price))
+    results[column] = sold
+
+
+def emergency_worker(azs: AZSCore, stop: threading.Event, period: float):
+    """Поток аварий: периодически включает и снимает аварийный режим"""
+    while not stop.wait(period):
+        azs.trigger_emergency()
+        azs.deactivate_emergency()
+        for tank in azs.tanks:
+            azs.toggle_tank(tank.id, True)
+
+
+def fuel_volumes(tanks) -> dict:
+    """Суммарный объём по видам топлива"""
+    volumes = {}
+    for tank in tanks:
+        volumes[tank.fuel_type] = volumes.get(tank.fuel_type, 0.0) + tank.current_volume
+    return volumes
+
+
+def run(args) -> bool:
+    with tempfile.TemporaryDirectory() as data_dir:
+        azs = AZSCore(data_dir, persistence=args.persistence,
+                      flush_policy=args.policy, concurrent=not args.no_locks)
+        for tank in azs.tanks:
+            azs.refuel_tank(tank.id, tank.max_volume - tank.current_volume)
+            azs.toggle_tank(tank.id, True)
+
+        start_volumes = fuel_volumes(azs.tanks)
+        start_cars = azs.stats.total_cars
+        start_income = azs.stats.total_income
+
+        results = {}
+        threads = [
+            threading.Thread(target=column_worker,
+                             args=(azs, column, args.sales, args.seed + column, results))
+            for column in config.COLUMNS_CONFIG
+        ]
+        stop = threading.Event()
+        if args.emergency:
+            threads.append(threading.Thread(target=emergency_worker,
+                                            args=(azs, stop, args.emergency)))
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads[:len(config.COLUMNS_CONFIG)]:
+            thread.join()
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        sold = [sale for column_sales in results.values() for sale in column_sales]
+        sold_liters = {}
+        for fuel_type, liters, _ in sold:
+            sold_liters[fuel_type] = sold_liters.get(fuel_type, 0.0) + liters
+        sold_income = sum(price for _, _, price in sold)
+
+        errors = []
+        end_volumes = fuel_volumes(azs.tanks)
+        for fuel_type, volume in start_volumes.items():
+            spent = volume - end_volumes[fuel_type]
+            if abs(spent - sold_liters.get(fuel_type, 0.0)) > EPSILON:
+                errors.append(f"{fuel_type}: списано {spent:.3f} л, продано {sold_liters.get(fuel_type, 0.0):.3f} л")
+        if azs.stats.total_cars - start_cars != len(sold):
+            errors.append(f"машин в статистике {azs.stats.total_cars - start_cars}, продаж {len(sold)}")
+        if abs(azs.stats.total_income - start_income - sold_income) > EPSILON * max(1.0, sold_income):
+            errors.append(f"доход в статистике {azs.stats.total_income - start_income:.2f}, "
+                          f"по продажам {sold_income:.2f}")
+        for tank in azs.tanks:
+            if tank.current_volume < 0:
+                errors.append(f"{tank.id}: отрицательный объём {tank.current_volume}")
+            if tank.enabled and tank.current_volume < tank.min_level:
+                errors.append(f"{tank.id}: включена ниже минимального уровня")
+
+        memory_state = ([(t.id, t.current_volume, t.enabled) for t in azs.tanks], azs.stats.to_dict())
+        azs.close()
+        reloaded = AZSCore(data_dir, persistence=args.persistence)
+        disk_state = ([(t.id, t.current_volume, t.enabled) for t in reloaded.tanks], reloaded.stats.to_dict())
+        reloaded.close()
+        if memory_state != disk_state:
+            errors.append("состояние на диске не совпадает с состоянием в памяти")
+
+    total = args.sales * len(config.COLUMNS_CONFIG)
+    print(f"Колонок: {len(config.COLUMNS_CONFIG)}, попыток продаж: {total}, успешных: {len(sold)}")
+    print(f"Время: {elapsed:.2f} с, {total / elapsed:,.0f} операций/с")
+    if errors:
+        print("НАРУШЕНЫ ИНВАРИАНТЫ:")
+        for error in errors:
+            print(f" - {error}")
+        return False
+    print("Инварианты объёма и выручки выполнены")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sales', type=int, default=2000, help="продаж на колонку")
+    parser.add_argument('--persistence', choices=['full', 'wal'], default='wal')
+    parser.add_argument('--policy', choices=['immediate', 'interval', 'count'], default='interval')
+    parser.add_argument('--emergency', type=float, default=0.0, metavar='SECONDS',
+                        help="период включения аварийного режима (0 - без аварий)")
+    parser.add_argument('--switch-interval', type=float, default=1e-6,
+                        help="sys.setswitchinterval: частое переключение потоков выявляет гонки")
+    parser.add_argument('--no-locks', action='store_true', help="прогон без блокировок (для сравнения)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    sys.setswitchinterval(args.switch_interval)
+    sys.exit(0 if run(args) else 1)
+
+
+if __name__ == "__main__":
+    main()
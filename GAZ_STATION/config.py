@@ -69,4 +69,67 @@ COLUMNS_CONFIG = {
     6: ["АИ-92", "АИ-95", "АИ-98", "ДТ"],
     7: ["АИ-95", "ДТ"],
     8: ["АИ-95", "ДТ"]
-}
\ No newline at end of file
+}
+
+# Хранилище данных: "json" - файлы JSON в директории данных, "sqlite" - база azs.db
+STORAGE_BACKEND = "json"
+
+# Формат журнала транзакций для хранилища "json":
+#   "jsonl"  - строки JSON (transactions.jsonl)
+#   "binary" - компактный двоичный журнал (transactions.bin), чтение через mmap
+# При смене формата история переносится из журнала прежнего формата
+TRANSACTION_LOG_FORMAT = "jsonl"
+
+# Многоуровневое хранение истории транзакций (python main.py --compact, только хранилище "json"):
+# записи старше HISTORY_HOT_DAYS дней переносятся из журнала в сжатые сегменты архива (data/archive)
+HISTORY_HOT_DAYS = 31
+HISTORY_SEGMENT_PERIOD = "month"    # "day" или "month" - период одного сегмента
+HISTORY_COMPRESSION = "gzip"        # "gzip" или "lzma" (сильнее сжимает, медленнее)
+HISTORY_COLD_RETENTION_DAYS = None  # сколько дней хранить сегменты архива (None - всегда)
+
+# Статистика по интервалам: сколько последних интервалов хранить (None - все)
+ROLLUP_RETENTION = {
+    'hour': 24 * 31,
+    'day': 366 * 3,
+    'month': None
+}
+
+# Поставки топлива (план поставок по прогнозу расхода и моделирование)
+DELIVERY_TRUCK_CAPACITY = 15000  # л в одном бензовозе
+DELIVERY_LEAD_TIME = 8           # часов от заказа до приезда бензовоза
+DELIVERY_SAFETY_STOCK = 0.05     # страховой запас сверх min_level, доля объёма цистерны
+
+# Последних транзакций в снимке состояния для отчётов (AZSCore.snapshot)
+SNAPSHOT_HISTORY = 100
+
+# Живая панель состояния: секунд между обновлениями экрана
+DASHBOARD_REFRESH = 1.0
+
+# Метрики (счётчики операций, длительности, записи файлов, ожидание блокировок)
+METRICS_ENABLED = False
+# Файл, куда периодически выгружаются метрики в формате Prometheus (None - не выгружать)
+METRICS_FILE = None
+METRICS_DUMP_INTERVAL = 10  # секунд
+
+# Режим сохранения состояния:
+#   "full" - перезапись файлов состояния после каждой операции
+#   "wal"  - журнал изменений (state.wal) + периодические полные снимки
+PERSISTENCE_MODE = "full"
+
+# Количество операций между полными снимками в режиме "wal"
+SNAPSHOT_INTERVAL = 1000
+
+# Сбрасывать журнал изменений на диск (fsync) после каждой записи
+WAL_FSYNC = False
+
+# Политика записи состояния на диск:
+#   "immediate" - сразу после каждой операции
+#   "interval"  - фоновая запись не чаще раза в FLUSH_INTERVAL_MS мс
+#   "count"     - фоновая запись после каждых FLUSH_MAX_OPS операций
+FLUSH_POLICY = "immediate"
+FLUSH_INTERVAL_MS = 200
+FLUSH_MAX_OPS = 100
+
+# Параллельная работа колонок из нескольких потоков: продажи из разных цистерн
+# идут параллельно, из одной цистерны - по очереди, авария останавливает всё
+CONCURRENT_DISPENSING = False
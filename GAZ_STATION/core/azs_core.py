@@ -1,22 +1,62 @@
 """
 Основная логика системы управления АЗС
 """
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from contextlib import contextmanager
 from datetime import datetime
+import math
 import uuid
 from data.models import Tank, Transaction, Statistics
-from data.storage import DataStorage
+from data.storage import create_storage
+from data.history_store import ColumnarHistory
+from core.persistence import StateChanges, WriteBehindFlusher, create_persistence
+from core.routing import RoutingIndex
+from core.column_status import ColumnStatusCache
+from core.rollups import Period, StatsRollups
+from core.locks import NoLocks, StationLocks
+from core.metrics import MetricsDumper, create_metrics, instrumented
+from core.feed import EMERGENCY, TANK, TRANSACTION, ChangeFeed
+from core.snapshots import HistoryTail, LazyRecords, StationSnapshot
 import config
 
 class AZSCore:
     """Основной класс управления АЗС"""
     
-    def __init__(self):
-        self.storage = DataStorage()
+    def __init__(self, data_dir: str = "data", persistence: Optional[str] = None,
+                 flush_policy: Optional[str] = None, concurrent: Optional[bool] = None,
+                 backend: Optional[str] = None, metrics: Optional[bool] = None):
+        self.feed = ChangeFeed()
+        self.history: Optional[ColumnarHistory] = None  # история в памяти, строится по запросу
+        self.metrics = create_metrics(config.METRICS_ENABLED if metrics is None else metrics)
+        # Хранилищу и блокировкам выключенные метрики не передаём - там нет даже проверок
+        measured = self.metrics if self.metrics.enabled else None
+        self.storage = create_storage(data_dir, backend or config.STORAGE_BACKEND,
+                                      config.TRANSACTION_LOG_FORMAT, measured)
+        strategy = create_persistence(self.storage, persistence or config.PERSISTENCE_MODE)
         self.tanks = self._init_tanks()
         self.stats = self.storage.load_statistics()
         self.is_emergency = self.storage.load_emergency_state()
+        self.rollups = self._init_rollups()
+        strategy.recover(self)
+        self.routing = RoutingIndex(self.tanks)
+        self.column_status = ColumnStatusCache(self)
+        if concurrent is None:
+            concurrent = config.CONCURRENT_DISPENSING
+        self.locks = StationLocks((tank.id for tank in self.tanks), measured) if concurrent else NoLocks()
+        self.persistence = WriteBehindFlusher(
+            strategy, self,
+            policy=flush_policy or config.FLUSH_POLICY,
+            interval_ms=config.FLUSH_INTERVAL_MS,
+            max_ops=config.FLUSH_MAX_OPS
+        )
+        # Транзакции до запуска читаются при первом обращении читателя, а не при запуске
+        self._published = 0  # транзакций, добавленных в снимки после запуска
+        history = HistoryTail(config.SNAPSHOT_HISTORY, older=LazyRecords(self._load_startup_history))
+        self._snapshot = StationSnapshot.create(0, self.persistence.image, history)
         self._check_tank_levels()
+        self.metrics_dumper = None
+        if measured is not None and config.METRICS_FILE:
+            self.metrics_dumper = MetricsDumper(self.metrics, config.METRICS_FILE, config.METRICS_DUMP_INTERVAL)
     
     def _init_tanks(self) -> List[Tank]:
         """Инициализация цистерн"""
@@ -29,245 +69,464 @@ class AZSCore:
             self.storage.save_tanks(tanks)
         return tanks
     
+    def _init_rollups(self) -> StatsRollups:
+        """Инициализация статистики по интервалам (при первом запуске - по истории)"""
+        buckets = self.storage.load_rollups()
+        rollups = StatsRollups(buckets, config.ROLLUP_RETENTION)
+        if buckets is None:
+            tank_fuel = {tank.id: tank.fuel_type for tank in self.tanks}
+            for record in self.storage.iter_transactions():
+                rollups.add_transaction(record, tank_fuel)
+            self.storage.save_rollups(rollups.buckets)
+        return rollups
+    
     def _check_tank_levels(self):
-        """Проверка уровней всех цистерн"""
-        for tank in self.tanks:
-            tank.disable_if_low()
-        self._save_state()
-    
-    def _save_state(self):
-        """Сохранить состояние системы"""
-        self.storage.save_tanks(self.tanks)
-        self.storage.save_statistics(self.stats)
-        self.storage.save_emergency_state(self.is_emergency)
-    
-    def _log_transaction(self, trans_type: str, details: Dict):
-        """Записать транзакцию в историю"""
-        transaction = Transaction(
+        """Проверка уровней всех цистерн (сохраняются только отключённые сейчас)"""
+        disabled = [tank for tank in self.tanks if tank.enabled and tank.disable_if_low()]
+        if disabled:
+            self._save_state(disabled)
+    
+    def _save_state(self, tanks: List[Tank] = (), fuel_types: Iterable[str] = (),
+                    stats: bool = False, emergency: bool = False, periods: Iterable[Period] = (),
+                    transactions: Iterable[Transaction] = ()):
+        """Сохранить изменения состояния: изменённые цистерны, статистику, флаг аварии,
+        интервалы статистики; опубликовать снимок с транзакциями операции"""
+        transactions = list(transactions)
+        self.routing.refresh(tanks)
+        # Значения читаются под блокировкой ленты - событие не окажется старее опубликованного раньше
+        self.feed.publish_many(TANK, ((tank.id, tank.current_volume, tank.enabled) for tank in tanks))
+        if emergency:
+            self.feed.publish(EMERGENCY, self.is_emergency)
+        changes = StateChanges(
+            tanks={tank.id: tank for tank in tanks},
+            fuel_types=set(fuel_types),
+            stats=stats or bool(fuel_types),
+            emergency=emergency,
+            rollups=set(periods)
+        )
+        
+        def publish(image):
+            self._published += len(transactions)
+            previous = self._snapshot
+            self._snapshot = StationSnapshot.create(previous.version + 1, image,
+                                                    previous.history.push(transactions))
+        
+        self.persistence.commit(self, changes, lock=self.locks.state, on_image=publish)
+    
+    def _load_startup_history(self) -> List[Dict]:
+        """Последние транзакции, записанные до запуска (новые первыми)
+        
+        Операции на время чтения ждут, чтобы в хранилище были ровно те
+        транзакции, что уже попали в снимки: пропускаем добавленные после запуска.
+        """
+        with self.locks.exclusive():
+            published = self._published
+            return self.storage.load_recent_transactions(config.SNAPSHOT_HISTORY + published)[published:]
+    
+    def flush(self):
+        """Немедленно записать все отложенные изменения состояния"""
+        self.persistence.flush()
+    
+    def close(self):
+        """Завершить работу: записать отложенные изменения и полный снимок"""
+        self.persistence.close()
+        self.storage.close()
+        if self.metrics_dumper is not None:
+            self.metrics_dumper.stop()
+    
+    def get_metrics(self) -> Dict:
+        """Метрики работы: счётчики и гистограммы (пусто, если метрики выключены)"""
+        return self.metrics.snapshot()
+    
+    def _make_transaction(self, trans_type: str, details: Dict) -> Transaction:
+        """Создать запись транзакции"""
+        return Transaction(
             id=str(uuid.uuid4()),
             type=trans_type,
             timestamp=datetime.now().isoformat(),
             details=details
         )
-        self.storage.save_transaction(transaction)
+    
+    def _store_transactions(self, transactions: List[Transaction]):
+        """Записать транзакции в историю и в ленту изменений"""
+        self.storage.save_transactions(transactions)
+        self.feed.publish_many(TRANSACTION, transactions)
+        if self.history is not None:
+            self.history.extend({'id': t.id, 'type': t.type, 'timestamp': t.timestamp, 'details': t.details}
+                                for t in transactions)
+    
+    def _log_transaction(self, trans_type: str, details: Dict) -> Transaction:
+        """Записать транзакцию в историю"""
+        transaction = self._make_transaction(trans_type, details)
+        self._store_transactions([transaction])
+        return transaction
+    
+    def get_tank(self, tank_id: str) -> Optional[Tank]:
+        """Получить цистерну по id"""
+        return self.routing.get_tank(tank_id)
     
     def get_tank_by_fuel_and_column(self, fuel_type: str, column: int) -> Optional[Tank]:
         """Получить цистерну для типа топлива и колонки"""
-        for tank in self.tanks:
-            if (tank.fuel_type == fuel_type and 
-                column in tank.connected_to and
-                tank.enabled):
-                return tank
-        return None
+        return self.routing.get_active_tank(column, fuel_type)
     
     def get_available_fuels_for_column(self, column: int) -> Dict[str, Tank]:
         """Получить доступные виды топлива для колонки"""
-        available = {}
-        for tank in self.tanks:
-            if column in tank.connected_to:
-                available[tank.fuel_type] = tank
-        return available
+        return self.routing.get_column_fuels(column)
     
-    def serve_customer(self, column: int, fuel_type: str, liters: float) -> Tuple[bool, str, float]:
-        """Обслужить клиента"""
+    @contextmanager
+    def _sale_lock(self, column: int, fuel_type: str):
+        """Захватить цистерну, из которой колонка отпускает топливо
+        
+        Если пока ждали блокировку маршрут переключился на другую цистерну
+        (текущую отключили), захватываем новую.
+        """
+        while True:
+            tank = self.get_tank_by_fuel_and_column(fuel_type, column)
+            with self.locks.tanks(tank.id if tank else None):
+                if self.get_tank_by_fuel_and_column(fuel_type, column) is tank:
+                    yield tank
+                    return
+    
+    def _dispense(self, tank: Optional[Tank], column: int, fuel_type: str,
+                  liters: float) -> Tuple[str, Optional[Tank], float, float]:
+        """Проверить продажу и списать топливо из цистерны tank (уже захваченной)
+        
+        Возвращает (ошибка, цистерна, цена за литр, стоимость); при успехе ошибка пустая.
+        """
         if self.is_emergency:
-            return False, "Аварийный режим! Заправка остановлена.", 0.0
+            return self._reject('emergency', "Аварийный режим! Заправка остановлена.")
+        
+        if not (math.isfinite(liters) and liters > 0):
+            return self._reject('invalid_liters', "Количество должно быть положительным")
         
         # Проверяем доступность топлива
-        tank = self.get_tank_by_fuel_and_column(fuel_type, column)
         if not tank:
-            return False, f"Топливо {fuel_type} недоступно на колонке {column}", 0.0
+            return self._reject('unavailable', f"Топливо {fuel_type} недоступно на колонке {column}")
         
         # Проверяем наличие достаточного количества
         if liters > tank.current_volume:
-            return False, f"Недостаточно топлива в цистерне. Доступно: {tank.current_volume:.1f} л", 0.0
+            return self._reject('insufficient',
+                                f"Недостаточно топлива в цистерне. Доступно: {tank.current_volume:.1f} л")
         
         # Рассчитываем стоимость
         price_per_liter = config.FUEL_TYPES.get(fuel_type, 0)
         if price_per_liter == 0:
-            return False, f"Неизвестный тип топлива: {fuel_type}", 0.0
+            return self._reject('unknown_fuel', f"Неизвестный тип топлива: {fuel_type}")
         
         total_price = liters * price_per_liter
         
         # Списание топлива
         if not tank.remove_fuel(liters):
-            return False, "Ошибка при списании топлива", 0.0
+            return self._reject('remove_failed', "Ошибка при списании топлива")
         
-        # Обновление статистики
-        self.stats.total_cars += 1
-        self.stats.total_income += total_price
+        if not tank.enabled:
+            # Цистерна отключилась по минимальному уровню - следующие продажи пойдут мимо неё
+            self.routing.refresh([tank])
         
-        if fuel_type not in self.stats.fuel_stats:
-            self.stats.fuel_stats[fuel_type] = {'liters': 0.0, 'income': 0.0}
-        
-        self.stats.fuel_stats[fuel_type]['liters'] += liters
-        self.stats.fuel_stats[fuel_type]['income'] += total_price
-        
-        # Логирование
-        self._log_transaction('sale', {
-            'column': column,
-            'fuel_type': fuel_type,
-            'liters': liters,
-            'price_per_liter': price_per_liter,
-            'total_price': total_price,
-            'tank_id': tank.id
-        })
-        
-        self._save_state()
+        return "", tank, price_per_liter, total_price
+    
+    def _reject(self, reason: str, message: str) -> Tuple[str, None, float, float]:
+        """Отказ в продаже (учитывается в метриках по причине)"""
+        if self.metrics.enabled:
+            self.metrics.inc('azs_sales_rejected_total', reason=reason)
+        return message, None, 0.0, 0.0
+    
+    def _add_sales_to_stats(self, fuel_type: str, cars: int, liters: float, income: float):
+        """Учесть продажи в статистике"""
+        with self.locks.state:
+            self.stats.total_cars += cars
+            self.stats.total_income += income
+            
+            if fuel_type not in self.stats.fuel_stats:
+                self.stats.fuel_stats[fuel_type] = {'liters': 0.0, 'income': 0.0}
+            
+            self.stats.fuel_stats[fuel_type]['liters'] += liters
+            self.stats.fuel_stats[fuel_type]['income'] += income
+    
+    def _add_to_rollups(self, transactions: Iterable[Transaction]) -> Set[Period]:
+        """Учесть продажи и пополнения в статистике по интервалам"""
+        periods = set()
+        with self.locks.state:
+            for transaction in transactions:
+                details = transaction.details
+                if transaction.type == 'sale':
+                    periods |= self.rollups.add_sale(
+                        transaction.timestamp, details['column'], details['fuel_type'],
+                        details['tank_id'], details['liters'], details['total_price'])
+                elif transaction.type == 'refuel':
+                    tank = self.get_tank(details['tank_id'])
+                    periods |= self.rollups.add_delivery(
+                        transaction.timestamp, tank.fuel_type, tank.id, details['liters_added'])
+        return periods
+    
+    def get_rollups(self, granularity: str, dimension: str, key=None,
+                    since: Optional[str] = None, until: Optional[str] = None) -> List[Tuple[str, Dict]]:
+        """Статистика по интервалам: granularity - 'hour'/'day'/'month',
+        dimension - 'fuel'/'column'/'tank', key - вид топлива, колонка или цистерна"""
+        with self.locks.state:
+            return self.rollups.query(granularity, dimension, key, since, until)
+    
+    @instrumented('sale')
+    def serve_customer(self, column: int, fuel_type: str, liters: float) -> Tuple[bool, str, float]:
+        """Обслужить клиента"""
+        with self.locks.shared(), self._sale_lock(column, fuel_type) as tank:
+            error, tank, price_per_liter, total_price = self._dispense(tank, column, fuel_type, liters)
+            if error:
+                return False, error, 0.0
+            
+            transaction = self._make_transaction('sale', {
+                'column': column,
+                'fuel_type': fuel_type,
+                'liters': liters,
+                'price_per_liter': price_per_liter,
+                'total_price': total_price,
+                'tank_id': tank.id
+            })
+            
+            # Обновление статистики
+            self._add_sales_to_stats(fuel_type, 1, liters, total_price)
+            periods = self._add_to_rollups([transaction])
+            
+            # Логирование
+            self._store_transactions([transaction])
+            
+            self._save_state([tank], fuel_types=[fuel_type], periods=periods, transactions=[transaction])
         return True, "Операция выполнена успешно", total_price
     
+    @instrumented('sale_batch', outcomes=lambda results: (success for success, _, _ in results))
+    def serve_customers_batch(self, sales: Iterable[Tuple[int, str, float]]) -> List[Tuple[bool, str, float]]:
+        """Обслужить пачку клиентов (column, fuel_type, liters)
+        
+        Каждая продажа проверяется и списывается по очереди, как в serve_customer,
+        но статистика обновляется один раз на вид топлива, транзакции пишутся
+        в журнал одной записью, а состояние сохраняется один раз в конце.
+        Возвращает результаты в порядке продаж.
+        """
+        results = []
+        transactions = []
+        totals: Dict[str, List[float]] = {}  # fuel_type: [машин, литров, доход]
+        touched: Dict[str, Tank] = {}
+        
+        with self.locks.shared():
+            for column, fuel_type, liters in sales:
+                with self._sale_lock(column, fuel_type) as tank:
+                    error, tank, price_per_liter, total_price = self._dispense(tank, column, fuel_type, liters)
+                if error:
+                    results.append((False, error, 0.0))
+                    continue
+                
+                fuel_totals = totals.setdefault(fuel_type, [0, 0.0, 0.0])
+                fuel_totals[0] += 1
+                fuel_totals[1] += liters
+                fuel_totals[2] += total_price
+                touched[tank.id] = tank
+                
+                transactions.append(self._make_transaction('sale', {
+                    'column': column,
+                    'fuel_type': fuel_type,
+                    'liters': liters,
+                    'price_per_liter': price_per_liter,
+                    'total_price': total_price,
+                    'tank_id': tank.id
+                }))
+                results.append((True, "Операция выполнена успешно", total_price))
+            
+            if transactions:
+                for fuel_type, (cars, liters, income) in totals.items():
+                    self._add_sales_to_stats(fuel_type, cars, liters, income)
+                periods = self._add_to_rollups(transactions)
+                self._store_transactions(transactions)
+                self._save_state(list(touched.values()), fuel_types=totals, periods=periods,
+                                 transactions=transactions)
+        return results
+    
+    @instrumented('refuel')
     def refuel_tank(self, tank_id: str, liters: float) -> Tuple[bool, str]:
         """Пополнить цистерну"""
-        if self.is_emergency:
-            return False, "Аварийный режим! Операции невозможны."
-        
-        tank = next((t for t in self.tanks if t.id == tank_id), None)
-        if not tank:
-            return False, f"Цистерна {tank_id} не найдена"
-        
-        if not tank.add_fuel(liters):
-            return False, f"Нельзя добавить {liters} л. Максимум: {tank.max_volume - tank.current_volume:.1f} л"
-        
-        # Логирование
-        self._log_transaction('refuel', {
-            'tank_id': tank_id,
-            'liters_added': liters,
-            'new_volume': tank.current_volume
-        })
-        
-        self._save_state()
-        return True, f"Цистерна {tank_id} пополнена на {liters} л. Текущий объем: {tank.current_volume:.1f} л"
+        with self.locks.shared(), self.locks.tanks(tank_id):
+            if self.is_emergency:
+                return False, "Аварийный режим! Операции невозможны."
+            
+            if not (math.isfinite(liters) and liters > 0):
+                return False, "Количество должно быть положительным"
+            
+            tank = self.get_tank(tank_id)
+            if not tank:
+                return False, f"Цистерна {tank_id} не найдена"
+            
+            if not tank.add_fuel(liters):
+                return False, f"Нельзя добавить {liters} л. Максимум: {tank.max_volume - tank.current_volume:.1f} л"
+            
+            transaction = self._make_transaction('refuel', {
+                'tank_id': tank_id,
+                'liters_added': liters,
+                'new_volume': tank.current_volume
+            })
+            periods = self._add_to_rollups([transaction])
+            
+            # Логирование
+            self._store_transactions([transaction])
+            
+            self._save_state([tank], periods=periods, transactions=[transaction])
+            return True, f"Цистерна {tank_id} пополнена на {liters} л. Текущий объем: {tank.current_volume:.1f} л"
     
+    @instrumented('transfer')
     def transfer_fuel(self, from_tank_id: str, to_tank_id: str, liters: float) -> Tuple[bool, str]:
         """Перекачать топливо между цистернами"""
-        if self.is_emergency:
-            return False, "Аварийный режим! Операции невозможны."
-        
-        from_tank = next((t for t in self.tanks if t.id == from_tank_id), None)
-        to_tank = next((t for t in self.tanks if t.id == to_tank_id), None)
-        
-        if not from_tank or not to_tank:
-            return False, "Одна из цистерн не найдена"
-        
-        if from_tank.fuel_type != to_tank.fuel_type:
-            return False, "Нельзя перекачивать разные типы топлива"
-        
-        if not from_tank.enabled:
-            return False, f"Цистерна-источник {from_tank_id} отключена"
-        
-        if liters > from_tank.current_volume:
-            return False, f"Недостаточно топлива в цистерне-источнике"
-        
-        if to_tank.current_volume + liters > to_tank.max_volume:
-            return False, f"Цистерна-приемник не вмещает столько топлива"
-        
-        # Перекачка
-        from_tank.current_volume -= liters
-        to_tank.current_volume += liters
-        
-        # Проверка уровней после перекачки
-        from_tank.disable_if_low()
-        
-        # Логирование
-        self._log_transaction('transfer', {
-            'from_tank': from_tank_id,
-            'to_tank': to_tank_id,
-            'liters': liters,
-            'fuel_type': from_tank.fuel_type
-        })
-        
-        self._save_state()
-        return True, f"Перекачано {liters} л из {from_tank_id} в {to_tank_id}"
+        with self.locks.shared(), self.locks.tanks(from_tank_id, to_tank_id):
+            if self.is_emergency:
+                return False, "Аварийный режим! Операции невозможны."
+            
+            if not (math.isfinite(liters) and liters > 0):
+                return False, "Количество должно быть положительным"
+            
+            from_tank = self.get_tank(from_tank_id)
+            to_tank = self.get_tank(to_tank_id)
+            
+            if not from_tank or not to_tank:
+                return False, "Одна из цистерн не найдена"
+            
+            if from_tank.fuel_type != to_tank.fuel_type:
+                return False, "Нельзя перекачивать разные типы топлива"
+            
+            if not from_tank.enabled:
+                return False, f"Цистерна-источник {from_tank_id} отключена"
+            
+            if liters > from_tank.current_volume:
+                return False, f"Недостаточно топлива в цистерне-источнике"
+            
+            if to_tank.current_volume + liters > to_tank.max_volume:
+                return False, f"Цистерна-приемник не вмещает столько топлива"
+            
+            # Перекачка
+            from_tank.current_volume -= liters
+            to_tank.current_volume += liters
+            
+            # Проверка уровней после перекачки
+            from_tank.disable_if_low()
+            
+            # Логирование
+            transaction = self._log_transaction('transfer', {
+                'from_tank': from_tank_id,
+                'to_tank': to_tank_id,
+                'liters': liters,
+                'fuel_type': from_tank.fuel_type
+            })
+            
+            self._save_state([from_tank, to_tank], transactions=[transaction])
+            return True, f"Перекачано {liters} л из {from_tank_id} в {to_tank_id}"
     
+    @instrumented('tank_toggle')
     def toggle_tank(self, tank_id: str, enable: bool) -> Tuple[bool, str]:
         """Включить/отключить цистерну"""
-        tank = next((t for t in self.tanks if t.id == tank_id), None)
-        if not tank:
-            return False, f"Цистерна {tank_id} не найдена"
-        
-        if enable:
-            if not tank.check_level():
-                return False, f"Нельзя включить цистерну: уровень ниже минимального ({tank.min_level} л)"
-            tank.enabled = True
-            action = "включена"
-        else:
-            tank.enabled = False
-            action = "отключена"
-        
-        # Логирование
-        self._log_transaction('tank_toggle', {
-            'tank_id': tank_id,
-            'action': action,
-            'new_state': tank.enabled,
-            'volume': tank.current_volume
-        })
-        
-        self._save_state()
-        return True, f"Цистерна {tank_id} успешно {action}"
+        with self.locks.shared(), self.locks.tanks(tank_id):
+            tank = self.get_tank(tank_id)
+            if not tank:
+                return False, f"Цистерна {tank_id} не найдена"
+            
+            if enable:
+                if not tank.check_level():
+                    return False, f"Нельзя включить цистерну: уровень ниже минимального ({tank.min_level} л)"
+                tank.enabled = True
+                action = "включена"
+            else:
+                tank.enabled = False
+                action = "отключена"
+            
+            # Логирование
+            transaction = self._log_transaction('tank_toggle', {
+                'tank_id': tank_id,
+                'action': action,
+                'new_state': tank.enabled,
+                'volume': tank.current_volume
+            })
+            
+            self._save_state([tank], transactions=[transaction])
+            return True, f"Цистерна {tank_id} успешно {action}"
     
     def get_disabled_tanks(self) -> List[Tank]:
         """Получить список отключенных цистерн"""
         return [tank for tank in self.tanks if not tank.enabled]
     
     def get_column_status(self, column: int) -> Dict:
-        """Получить статус колонки"""
-        available_fuels = self.get_available_fuels_for_column(column)
-        
-        status = {
-            'column': column,
-            'available_fuels': {},
-            'disabled_pistols': []
-        }
-        
-        for fuel_type, tank in available_fuels.items():
-            status['available_fuels'][fuel_type] = {
-                'tank_id': tank.id,
-                'tank_enabled': tank.enabled,
-                'volume': tank.current_volume
-            }
-            
-            if not tank.enabled:
-                status['disabled_pistols'].append(fuel_type)
-        
-        return status
+        """Получить статус колонки (из кэша; пересчитывается после изменения её цистерн)"""
+        return self.column_status.get(column)
     
+    def get_changed_columns(self, since_version: int) -> Tuple[List[int], int]:
+        """Колонки, статус которых изменился после версии since_version, и текущая версия"""
+        return self.column_status.changed_since(since_version)
+    
+    @instrumented('emergency_on')
     def trigger_emergency(self) -> Tuple[bool, str]:
         """Активировать аварийный режим"""
-        if self.is_emergency:
-            return False, "Аварийный режим уже активен"
-        
-        self.is_emergency = True
-        
-        # Отключаем все цистерны
-        for tank in self.tanks:
-            tank.enabled = False
-        
-        # Логирование
-        self._log_transaction('emergency', {
-            'action': 'activated',
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        self._save_state()
-        return True, "Аварийный режим активирован! Все цистерны заблокированы. Вызываются аварийные службы..."
+        with self.locks.exclusive():
+            if self.is_emergency:
+                return False, "Аварийный режим уже активен"
+            
+            self.is_emergency = True
+            
+            # Отключаем все цистерны
+            for tank in self.tanks:
+                tank.enabled = False
+            
+            # Логирование
+            transaction = self._log_transaction('emergency', {
+                'action': 'activated',
+                'timestamp': datetime.now().isoformat()
+            })
+            
+            self._save_state(self.tanks, emergency=True, transactions=[transaction])
+            return True, "Аварийный режим активирован! Все цистерны заблокированы. Вызываются аварийные службы..."
     
+    @instrumented('emergency_off')
     def deactivate_emergency(self) -> Tuple[bool, str]:
         """Деактивировать аварийный режим"""
-        if not self.is_emergency:
-            return False, "Аварийный режим не активен"
-        
-        self.is_emergency = False
-        
-        # Логирование
-        self._log_transaction('emergency', {
-            'action': 'deactivated',
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        self._save_state()
-        return True, "Аварийный режим деактивирован. Цистерны остаются отключенными - включите их вручную."
+        with self.locks.exclusive():
+            if not self.is_emergency:
+                return False, "Аварийный режим не активен"
+            
+            self.is_emergency = False
+            
+            # Логирование
+            transaction = self._log_transaction('emergency', {
+                'action': 'deactivated',
+                'timestamp': datetime.now().isoformat()
+            })
+            
+            self._save_state(emergency=True, transactions=[transaction])
+            return True, "Аварийный режим деактивирован. Цистерны остаются отключенными - включите их вручную."
+    
+    def snapshot(self) -> StationSnapshot:
+        """Согласованный неизменяемый снимок состояния для отчётов (без блокировок)"""
+        return self._snapshot
+    
+    def get_history(self) -> ColumnarHistory:
+        """Вся история транзакций в памяти (колоночное хранилище)
+        
+        При первом вызове читается журнал целиком; пока он читается, операции
+        ждут, чтобы ни одна транзакция не потерялась и не попала дважды.
+        Дальше новые транзакции добавляются по мере записи.
+        """
+        if self.history is None:
+            with self.locks.exclusive():
+                if self.history is None:
+                    self.history = ColumnarHistory.from_records(self.storage.iter_transactions())
+        return self.history
     
     def get_recent_transactions(self, limit: int = 10) -> List[Dict]:
         """Получить последние транзакции"""
-        transactions = self.storage.load_transactions()
-        return list(reversed(transactions))[:limit]
\ No newline at end of file
+        return self.storage.load_recent_transactions(limit)
+    
+    def query_transactions(self, trans_type: Optional[str] = None, column: Optional[int] = None,
+                           tank_id: Optional[str] = None, fuel_type: Optional[str] = None,
+                           since: Optional[str] = None, until: Optional[str] = None,
+                           limit: Optional[int] = 50,
+                           cursor: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Поиск по истории транзакций (новые первыми)
+        
+        since/until - границы времени в формате ISO (until не включается).
+        Возвращает (транзакции, курсор); курсор передаётся в следующий вызов
+        для получения следующей страницы, None - страниц больше нет.
+        """
+        return self.storage.query_transactions(trans_type, tank_id, column, fuel_type,
+                                               since, until, limit, cursor)
\ No newline at end of file
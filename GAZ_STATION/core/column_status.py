@@ -0,0 +1,115 @@
+"""
+Кэш состояния колонок с версиями
+
+Состояние колонки (get_column_status) строится один раз и дальше отдаётся
+из кэша. Кэш читает ленту изменений AZSCore: колонка помечается
+изменившейся, только если у показанной на ней цистерны изменились объём или
+включённость, либо переключился аварийный режим. Версия колонки - номер
+события ленты, которое её изменило; changed_since(version) отдаёт колонки,
+изменившиеся после версии, которую клиент уже видел.
+"""
+import threading
+from typing import Dict, List, Tuple
+
+from core.feed import EMERGENCY, TANK
+
+
+class ColumnStatusCache:
+    """Состояния колонок, пересчитываемые только после изменения их цистерн"""
+
+    def __init__(self, core):
+        self.core = core
+        self.feed = core.feed
+        self._lock = threading.Lock()
+        self.seq = self.feed.seq
+        # Колонки показывают по одной цистерне на вид топлива (RoutingIndex.column_fuels)
+        self._fuels: Dict[int, Dict[str, str]] = {}
+        self._shown: Dict[str, List[int]] = {}   # цистерна -> колонки, где она показана
+        for column, fuels in core.routing.column_fuels.items():
+            self._fuels[column] = {fuel_type: tank.id for fuel_type, tank in fuels.items()}
+            for tank in fuels.values():
+                self._shown.setdefault(tank.id, []).append(column)
+        self._tanks: Dict[str, Tuple[float, bool]] = {}
+        self._reload()
+        self._status: Dict[int, Dict] = {}
+        self._versions = {column: self.seq for column in self._fuels}
+
+    @property
+    def version(self) -> int:
+        """Номер последнего учтённого события"""
+        with self._lock:
+            self._sync()
+            return self.seq
+
+    def _changed(self, columns, seq: int):
+        for column in columns:
+            self._versions[column] = seq
+            self._status.pop(column, None)
+
+    def _sync(self):
+        """Учесть новые события ленты"""
+        events, seq, lost = self.feed.since(self.seq)
+        if lost:
+            # Часть событий вытеснена: считаем изменившимися все колонки, значения берём заново
+            # (они не старее оставшихся событий, поэтому сами события уже не применяем)
+            self._reload()
+            self._changed(self._fuels, seq)
+            self.seq = seq
+            return
+        for event_seq, kind, data in events:
+            if kind == TANK:
+                tank_id, volume, enabled = data
+                if self._tanks.get(tank_id) != (volume, enabled):
+                    self._tanks[tank_id] = (volume, enabled)
+                    self._changed(self._shown.get(tank_id, ()), event_seq)
+            elif kind == EMERGENCY and data != self._emergency:
+                self._emergency = data
+                self._changed(self._fuels, event_seq)
+        self.seq = seq
+
+    def _reload(self):
+        """Прочитать текущие значения цистерн и аварийного режима"""
+        self._tanks = {tank.id: (tank.current_volume, tank.enabled) for tank in self.core.tanks}
+        self._emergency = self.core.is_emergency
+
+    def get(self, column: int) -> Dict:
+        """Состояние колонки (общий объект кэша - не изменять)"""
+        # Без блокировок: номер читается раньше состояния, а _sync меняет номер после сброса состояний
+        seq = self.seq
+        status = self._status.get(column)
+        if status is not None and seq == self.feed.seq:
+            return status
+        with self._lock:
+            self._sync()
+            status = self._status.get(column)
+            if status is None:
+                status = self._build(column)
+                if column in self._fuels:
+                    self._status[column] = status
+            return status
+
+    def _build(self, column: int) -> Dict:
+        status = {
+            'column': column,
+            'version': self._versions.get(column, self.seq),
+            'emergency': self._emergency,
+            'available_fuels': {},
+            'disabled_pistols': []
+        }
+        for fuel_type, tank_id in self._fuels.get(column, {}).items():
+            volume, enabled = self._tanks[tank_id]
+            status['available_fuels'][fuel_type] = {
+                'tank_id': tank_id,
+                'tank_enabled': enabled,
+                'volume': volume
+            }
+            if not enabled:
+                status['disabled_pistols'].append(fuel_type)
+        return status
+
+    def changed_since(self, version: int) -> Tuple[List[int], int]:
+        """Колонки, изменившиеся после version, и текущая версия"""
+        with self._lock:
+            self._sync()
+            changed = [column for column, column_version in self._versions.items() if column_version > version]
+            return changed, self.seq
@@ -0,0 +1,64 @@
+"""
+Лента изменений состояния АЗС в памяти
+
+AZSCore публикует в ленту каждое изменение: новое состояние цистерны,
+флаг аварийного режима, записанные транзакции. Подписчик (живая панель,
+кэши) запоминает номер последнего прочитанного события и забирает только
+более новые, не опрашивая хранилище. Лента ограничена по длине: если
+подписчик отстал больше чем на capacity событий, since() сообщает об этом,
+и подписчику нужно заново прочитать полное состояние.
+"""
+import threading
+from collections import deque
+from itertools import islice
+from typing import Any, Iterable, List, Tuple
+
+# Событие: (номер, вид, данные)
+Event = Tuple[int, str, Any]
+
+TANK = 'tank'                # (id цистерны, текущий объём, включена)
+EMERGENCY = 'emergency'      # флаг аварийного режима
+TRANSACTION = 'transaction'  # Transaction
+
+
+class ChangeFeed:
+    """Ограниченная по длине лента событий с последовательными номерами"""
+
+    def __init__(self, capacity: int = 4096):
+        self._events = deque(maxlen=capacity)
+        self._seq = 0
+        self._changed = threading.Condition()
+
+    @property
+    def seq(self) -> int:
+        """Номер последнего события"""
+        return self._seq
+
+    def publish(self, kind: str, data: Any):
+        """Добавить событие"""
+        with self._changed:
+            self._seq += 1
+            self._events.append((self._seq, kind, data))
+            self._changed.notify_all()
+
+    def publish_many(self, kind: str, items: Iterable[Any]):
+        """Добавить несколько событий одного вида"""
+        with self._changed:
+            for data in items:
+                self._seq += 1
+                self._events.append((self._seq, kind, data))
+            self._changed.notify_all()
+
+    def since(self, seq: int) -> Tuple[List[Event], int, bool]:
+        """События новее seq: (события, номер последнего, часть событий уже вытеснена)"""
+        with self._changed:
+            if seq >= self._seq:
+                return [], self._seq, False
+            first = self._events[0][0]
+            skip = seq + 1 - first
+            return list(islice(self._events, max(skip, 0), None)), self._seq, skip < 0
+
+    def wait(self, seq: int, timeout: float) -> bool:
+        """Дождаться событий новее seq (не дольше timeout секунд)"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._seq > seq, timeout)
@@ -0,0 +1,111 @@
+"""
+Блокировки для параллельного обслуживания колонок
+"""
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Optional
+
+
+class SharedExclusiveLock:
+    """Барьер: много совместных владельцев (продажи) или один исключительный (авария)
+
+    Исключительный захват имеет приоритет: пока его ждут, новые совместные
+    владельцы не допускаются.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class StationLocks:
+    """Блокировки АЗС: барьер аварийного режима, цистерны, общая статистика"""
+
+    def __init__(self, tank_ids: Iterable[str], metrics=None):
+        self.barrier = SharedExclusiveLock()
+        self.tank_locks = {tank_id: threading.Lock() for tank_id in tank_ids}
+        self.state = threading.RLock()
+        self.metrics = metrics  # None - ожидание блокировок не замеряется
+
+    @contextmanager
+    def _timed(self, lock, name: str):
+        """Захват с замером ожидания"""
+        started = time.perf_counter()
+        with lock:
+            self.metrics.observe('azs_lock_wait_seconds', time.perf_counter() - started, lock=name)
+            yield
+
+    def shared(self):
+        """Обычная операция: выполняется параллельно с другими"""
+        if self.metrics is not None:
+            return self._timed(self.barrier.shared(), 'shared')
+        return self.barrier.shared()
+
+    def exclusive(self):
+        """Операция над всей станцией: дожидается завершения остальных"""
+        if self.metrics is not None:
+            return self._timed(self.barrier.exclusive(), 'exclusive')
+        return self.barrier.exclusive()
+
+    @contextmanager
+    def tanks(self, *tank_ids: Optional[str]):
+        """Захватить блокировки цистерн (в порядке id, чтобы не было взаимоблокировок)"""
+        locks = [self.tank_locks[tank_id] for tank_id in sorted(set(filter(None, tank_ids)))
+                 if tank_id in self.tank_locks]
+        started = time.perf_counter() if self.metrics is not None else 0.0
+        for lock in locks:
+            lock.acquire()
+        if self.metrics is not None:
+            self.metrics.observe('azs_lock_wait_seconds', time.perf_counter() - started, lock='tanks')
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+class NoLocks:
+    """Заглушка для однопоточного режима: блокировки ничего не делают"""
+
+    state = nullcontext()
+
+    def shared(self):
+        return nullcontext()
+
+    def exclusive(self):
+        return nullcontext()
+
+    def tanks(self, *tank_ids: Optional[str]):
+        return nullcontext()
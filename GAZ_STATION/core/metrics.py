@@ -0,0 +1,213 @@
+"""
+Метрики работы АЗС: счётчики и гистограммы длительностей
+
+Metrics собирает значения в памяти, get_metrics() отдаёт их словарём, а
+render() - текстом в формате Prometheus. MetricsDumper периодически
+переписывает файл метрик. При выключенных метриках используется
+NullMetrics: операции проверяют metrics.enabled и сразу идут дальше, а
+хранилищу и блокировкам метрики в этом случае не передаются вовсе.
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Верхние границы корзин гистограмм, секунды
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Описания метрик для вывода в формате Prometheus
+HELP = {
+    'azs_operations_total': "Операции АЗС по типу и исходу",
+    'azs_operation_seconds': "Длительность операций АЗС",
+    'azs_sales_rejected_total': "Отклонённые продажи по причине",
+    'azs_lock_wait_seconds': "Ожидание блокировок",
+    'azs_file_writes_total': "Записи файлов данных",
+    'azs_file_write_bytes_total': "Записано байт (после сериализации)",
+    'azs_file_reads_total': "Чтения файлов данных",
+    'azs_json_encode_seconds': "Сериализация JSON",
+    'azs_json_decode_seconds': "Разбор JSON",
+    'azs_file_write_seconds': "Запись файлов на диск",
+    'azs_file_read_seconds': "Чтение файлов с диска",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class NullMetrics:
+    """Метрики выключены: все вызовы ничего не делают"""
+
+    enabled = False
+
+    def inc(self, name: str, value: float = 1, **labels):
+        pass
+
+    def observe(self, name: str, seconds: float, **labels):
+        pass
+
+    def timer(self, name: str, **labels):
+        return nullcontext()
+
+    def snapshot(self) -> Dict:
+        return {'counters': [], 'histograms': []}
+
+    def render(self) -> str:
+        return ""
+
+
+class Metrics(NullMetrics):
+    """Счётчики и гистограммы в памяти (потокобезопасно)"""
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List] = {}  # [счётчики корзин, сумма, количество]
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Увеличить счётчик"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Учесть длительность в гистограмме"""
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Замерить длительность блока кода"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict:
+        """Текущие значения: счётчики и гистограммы (корзины накопительные, как в Prometheus)"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = [(key, list(counts), total, count)
+                          for key, (counts, total, count) in sorted(self._histograms.items())]
+        result = {'counters': [], 'histograms': []}
+        for (name, labels), value in counters:
+            result['counters'].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), counts, total, count in histograms:
+            cumulative, buckets = 0, {}
+            for bound, bucket_count in zip(BUCKETS + (float('inf'),), counts):
+                cumulative += bucket_count
+                buckets['+Inf' if bound == float('inf') else repr(bound)] = cumulative
+            result['histograms'].append({'name': name, 'labels': dict(labels), 'count': count,
+                                         'sum': total, 'buckets': buckets})
+        return result
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        snapshot = self.snapshot()
+        lines = []
+        described = set()
+
+        def describe(name: str, kind: str):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for counter in snapshot['counters']:
+            describe(counter['name'], 'counter')
+            lines.append(f"{counter['name']}{_format_labels(counter['labels'])} {_format_value(counter['value'])}")
+        for histogram in snapshot['histograms']:
+            name, labels = histogram['name'], histogram['labels']
+            describe(name, 'histogram')
+            for bound, count in histogram['buckets'].items():
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']!r}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def instrumented(operation: str, outcomes: Callable[[object], Iterable[bool]] = lambda result: (result[0],)):
+    """Декоратор операции AZSCore: счётчик по исходу и гистограмма длительности
+
+    outcomes - успехи операции по её результату (для пачки продаж - по каждой).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return method(self, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception:
+                metrics.inc('azs_operations_total', operation=operation, outcome='exception')
+                raise
+            finally:
+                metrics.observe('azs_operation_seconds', time.perf_counter() - started, operation=operation)
+            for success in outcomes(result):
+                metrics.inc('azs_operations_total', operation=operation, outcome='ok' if success else 'error')
+            return result
+        return wrapper
+    return decorator
+
+
+class MetricsDumper:
+    """Фоновая периодическая запись метрик в файл"""
+
+    def __init__(self, metrics: Metrics, path: str, interval: float = 10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='azs-metrics', daemon=True)
+        self._thread.start()
+
+    def dump(self):
+        """Переписать файл метрик"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.dump()
+            except OSError:
+                pass  # метрики не должны мешать работе станции
+
+    def stop(self):
+        """Остановить поток и записать итоговые значения"""
+        self._stop.set()
+        self._thread.join()
+        self.dump()
+
+
+def create_metrics(enabled: bool):
+    """Метрики или заглушка"""
+    return Metrics() if enabled else NullMetrics()
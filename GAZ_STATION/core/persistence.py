@@ -0,0 +1,358 @@
+"""
+Стратегии сохранения состояния АЗС (цистерны, статистика, аварийный режим)
+"""
+import os
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+from data.models import Tank, Statistics
+from core.rollups import Period
+from data.storage import DataStorage
+from data.journal import WriteAheadLog
+import config
+
+
+@dataclass
+class StateChanges:
+    """Набор изменений состояния, накопленных с последней записи"""
+    tanks: Dict[str, Tank] = field(default_factory=dict)
+    fuel_types: Set[str] = field(default_factory=set)
+    stats: bool = False
+    emergency: bool = False
+    rollups: Set[Period] = field(default_factory=set)
+
+    def merge(self, other: 'StateChanges'):
+        """Объединить с более поздними изменениями"""
+        self.tanks.update(other.tanks)
+        self.fuel_types |= other.fuel_types
+        self.stats = self.stats or other.stats
+        self.emergency = self.emergency or other.emergency
+        self.rollups |= other.rollups
+
+    def __bool__(self):
+        return bool(self.tanks or self.stats or self.emergency or self.rollups)
+
+
+@dataclass
+class StateImage:
+    """Неизменяемая копия состояния, которую записывает стратегия сохранения"""
+    tanks: Dict[str, Tank]
+    stats: Statistics
+    is_emergency: bool
+    rollups: Dict[str, Dict[str, Dict]]  # корзины статистики по интервалам
+
+    @classmethod
+    def capture(cls, core) -> 'StateImage':
+        """Снять копию с текущего состояния АЗС"""
+        return cls(
+            tanks={tank.id: tank.copy() for tank in core.tanks},
+            stats=core.stats.copy(),
+            is_emergency=core.is_emergency,
+            rollups={
+                granularity: {period: core.rollups.get_period(granularity, period) for period in periods}
+                for granularity, periods in core.rollups.buckets.items()
+            }
+        )
+
+
+
+class FullStatePersistence:
+    """Перезапись файлов состояния, которые изменились"""
+
+    def __init__(self, storage: DataStorage):
+        self.storage = storage
+
+    def recover(self, core):
+        """Восстановить состояние после загрузки снимка (нечего восстанавливать)"""
+
+    def commit(self, image: StateImage, changes: StateChanges):
+        """Сохранить изменения"""
+        with self.storage.batch():
+            if changes.tanks:
+                self.storage.save_tanks(list(image.tanks.values()))
+            if changes.stats:
+                self.storage.save_statistics(image.stats)
+            if changes.emergency:
+                self.storage.save_emergency_state(image.is_emergency)
+            if changes.rollups:
+                self.storage.save_rollups(image.rollups, changes.rollups)
+
+    def snapshot(self, image: StateImage):
+        """Записать полный снимок состояния"""
+        with self.storage.batch():
+            self.storage.save_tanks(list(image.tanks.values()))
+            self.storage.save_statistics(image.stats)
+            self.storage.save_emergency_state(image.is_emergency)
+            self.storage.save_rollups(image.rollups)
+
+    def close(self, image: StateImage):
+        """Завершение работы"""
+
+
+class WalStatePersistence(FullStatePersistence):
+    """Снимок состояния + журнал изменений (write-ahead log)
+
+    Каждая запись дописывает в state.wal новые значения изменённых цистерн,
+    статистики и флага аварии. Значения абсолютные, поэтому повторное
+    применение записи безопасно. Полный снимок пишется раз в
+    snapshot_interval записей и при завершении работы, после чего журнал
+    очищается.
+    """
+
+    def __init__(self, storage: DataStorage, snapshot_interval: int = 1000,
+                 fsync: bool = False):
+        super().__init__(storage)
+        self.snapshot_interval = snapshot_interval
+        self.wal = WriteAheadLog(os.path.join(storage.data_dir, 'state.wal'), fsync=fsync,
+                                 metrics=storage.metrics)
+        self.pending = 0
+
+    @staticmethod
+    def make_record(image: StateImage, changes: StateChanges) -> Dict:
+        """Запись журнала изменений"""
+        record = {}
+        if changes.tanks:
+            record['tanks'] = {
+                tank_id: [image.tanks[tank_id].current_volume, image.tanks[tank_id].enabled]
+                for tank_id in changes.tanks
+            }
+        if changes.stats:
+            record['totals'] = [image.stats.total_cars, image.stats.total_income]
+            record['fuel_stats'] = {
+                fuel: image.stats.fuel_stats[fuel]
+                for fuel in changes.fuel_types if fuel in image.stats.fuel_stats
+            }
+        if changes.emergency:
+            record['is_emergency'] = image.is_emergency
+        if changes.rollups:
+            record['rollups'] = [
+                [granularity, period, image.rollups[granularity].get(period)]
+                for granularity, period in sorted(changes.rollups)
+            ]
+        return record
+
+    @staticmethod
+    def apply_record(core, record: Dict):
+        """Применить запись журнала изменений к состоянию"""
+        WriteAheadLog.apply_state(record, {tank.id: tank for tank in core.tanks}, core.stats)
+        if 'is_emergency' in record:
+            core.is_emergency = record['is_emergency']
+        for granularity, period, bucket in record.get('rollups', ()):
+            core.rollups.set_period(granularity, period, bucket)
+
+    def recover(self, core):
+        """Доприменить к снимку все записи журнала изменений"""
+        for record in self.wal.read():
+            self.apply_record(core, record)
+            self.pending += 1
+
+    def commit(self, image: StateImage, changes: StateChanges):
+        """Дописать изменения в журнал; периодически делать снимок"""
+        self.wal.append(self.make_record(image, changes))
+        self.pending += 1
+        if self.pending >= self.snapshot_interval:
+            self.snapshot(image)
+
+    def snapshot(self, image: StateImage):
+        """Записать полный снимок и очистить журнал изменений"""
+        super().snapshot(image)
+        self.wal.truncate()
+        self.pending = 0
+
+    def close(self, image: StateImage):
+        """Снимок при завершении работы"""
+        if self.pending:
+            self.snapshot(image)
+        self.wal.close()
+
+
+class WriteBehindFlusher:
+    """Отложенная запись состояния с объединением изменений
+
+    Операции АЗС передают сюда только изменённые цистерны и поля статистики.
+    Флашер держит собственную копию состояния, поэтому фоновая запись никогда
+    не видит наполовину выполненную операцию. Политики:
+      immediate - запись сразу, в вызывающем потоке;
+      interval  - фоновая запись не чаще раза в interval_ms миллисекунд;
+      count     - фоновая запись после каждых max_ops операций.
+    Ошибка фоновой записи не отменяет изменения: они остаются в очереди,
+    запись повторяется с растущей паузой, а ошибка, если повтор ещё не
+    удался, пробрасывается из flush() и close().
+    """
+
+    POLICIES = ('immediate', 'interval', 'count')
+    RETRY_MIN = 0.05   # пауза перед повтором после ошибки записи, с
+    RETRY_MAX = 5.0
+
+    def __init__(self, strategy: FullStatePersistence, core, policy: str = 'immediate',
+                 interval_ms: int = 200, max_ops: int = 100):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Неизвестная политика записи: {policy}")
+        self.strategy = strategy
+        self.policy = policy
+        self.interval = interval_ms / 1000
+        self.max_ops = max_ops
+
+        self._image = StateImage.capture(core)
+        self._pending = StateChanges()
+        self._pending_ops = 0
+        self._first_change = 0.0
+        self._error: Optional[BaseException] = None
+        self._retry_delay = 0.0
+        self._retry_at = 0.0
+        self._closed = False
+
+        self._lock = threading.Lock()          # копия состояния и накопленные изменения
+        self._io_lock = threading.Lock()       # одна запись на диск в каждый момент
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        if policy != 'immediate':
+            self._thread = threading.Thread(target=self._run, name='azs-flusher', daemon=True)
+            self._thread.start()
+
+    def commit(self, core, changes: StateChanges, lock=None,
+               on_image: Optional[Callable[[StateImage], None]] = None):
+        """Принять изменения после операции
+
+        lock - блокировка, под которой меняется статистика АЗС: копия снимается
+        под ней, чтобы не увидеть наполовину обновлённые счётчики.
+        on_image - вызывается с новой копией состояния под теми же блокировками.
+        """
+        with lock or nullcontext(), self._lock:
+            image = self._image
+            tanks, stats, is_emergency, rollups = image.tanks, image.stats, image.is_emergency, image.rollups
+            # Копия-на-запись: меняем ссылки, а не объекты, которые может читать запись
+            if changes.tanks:
+                tanks = dict(tanks)
+                for tank_id, tank in changes.tanks.items():
+                    tanks[tank_id] = tank.copy()
+            if changes.stats:
+                stats = core.stats.copy()
+            if changes.emergency:
+                is_emergency = core.is_emergency
+            if changes.rollups:
+                # Копируются только изменённые интервалы и словари их гранулярностей
+                rollups = dict(rollups)
+                for granularity in {granularity for granularity, _ in changes.rollups}:
+                    rollups[granularity] = dict(rollups[granularity])
+                for granularity, period in changes.rollups:
+                    bucket = core.rollups.get_period(granularity, period)
+                    if bucket is None:
+                        rollups[granularity].pop(period, None)
+                    else:
+                        rollups[granularity][period] = bucket
+            self._image = StateImage(tanks, stats, is_emergency, rollups)
+            if on_image is not None:
+                on_image(self._image)
+
+            if not self._pending:
+                self._first_change = time.monotonic()
+            self._pending.merge(changes)
+            self._pending_ops += 1
+
+            if self.policy == 'count' and self._pending_ops >= self.max_ops:
+                self._wakeup.notify()
+
+        if self.policy == 'immediate':
+            self.flush()
+
+    @property
+    def image(self) -> StateImage:
+        """Текущая копия состояния (не изменяется, подменяется целиком)"""
+        return self._image
+
+    def _take_pending(self):
+        """Забрать накопленные изменения вместе с копией состояния"""
+        with self._lock:
+            changes = self._pending
+            self._pending = StateChanges()
+            self._pending_ops = 0
+            return self._image, changes
+
+    def flush(self):
+        """Записать все накопленные изменения"""
+        with self._io_lock:
+            image, changes = self._take_pending()
+            if changes:
+                self._write(image, changes)
+        self._raise_error()
+
+    def _write(self, image: StateImage, changes: StateChanges):
+        """Передать изменения стратегии; при ошибке вернуть их в очередь"""
+        try:
+            self.strategy.commit(image, changes)
+        except Exception as e:
+            with self._lock:
+                changes.merge(self._pending)
+                self._pending = changes
+                self._error = e
+                self._retry_delay = min(max(self._retry_delay * 2, self.interval, self.RETRY_MIN),
+                                        self.RETRY_MAX)
+                self._retry_at = time.monotonic() + self._retry_delay
+        else:
+            with self._lock:
+                # Повтор удался - изменения на диске, сообщать больше не о чем
+                self._retry_delay = 0.0
+                self._error = None
+
+    def _raise_error(self):
+        """Пробросить ошибку фоновой записи вызывающему коду"""
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _due(self) -> bool:
+        """Пора ли записывать накопленные изменения"""
+        if not self._pending:
+            return False
+        now = time.monotonic()
+        if self._retry_delay and now < self._retry_at:
+            return False
+        if self.policy == 'count':
+            return self._pending_ops >= self.max_ops
+        return now - self._first_change >= self.interval
+
+    def _timeout(self) -> Optional[float]:
+        """Сколько ждать до следующей проверки _due()"""
+        now = time.monotonic()
+        if self._retry_delay and self._pending and now < self._retry_at:
+            return self._retry_at - now
+        if self.policy == 'interval' and self._pending:
+            return max(0.0, self._first_change + self.interval - now)
+        if self.policy == 'interval':
+            return self.interval
+        return None
+
+    def _run(self):
+        """Цикл фонового потока записи"""
+        while True:
+            with self._lock:
+                while not self._closed and not self._due():
+                    self._wakeup.wait(self._timeout())
+                if self._closed:
+                    return
+            with self._io_lock:
+                image, changes = self._take_pending()
+                if changes:
+                    self._write(image, changes)
+
+    def close(self):
+        """Остановить фоновый поток, записать остаток и закрыть стратегию"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self.strategy.close(self._image)
+
+
+def create_persistence(storage: DataStorage, mode: str):
+    """Создать стратегию сохранения по названию режима"""
+    if mode == 'full':
+        return FullStatePersistence(storage)
+    if mode == 'wal':
+        return WalStatePersistence(storage, config.SNAPSHOT_INTERVAL, config.WAL_FSYNC)
+    raise ValueError(f"Неизвестный режим сохранения: {mode}")
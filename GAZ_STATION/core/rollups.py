@@ -0,0 +1,144 @@
+"""
+Статистика по интервалам времени (часы, дни, месяцы)
+
+Каждая продажа и приёмка топлива добавляется в корзину своего интервала
+сразу в трёх срезах: вид топлива, колонка, цистерна. Вопросы вида
+"сколько литров АИ-95 продано по часам вчера" решаются перебором корзин,
+без чтения истории транзакций.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+
+# Интервал задаётся префиксом ISO-времени транзакции этой длины
+GRANULARITIES = {'hour': 13, 'day': 10, 'month': 7}
+# Дополнение префикса до ISO-времени начала интервала
+PERIOD_START = {'hour': ':00:00', 'day': 'T00:00:00', 'month': '-01T00:00:00'}
+DIMENSIONS = ('fuel', 'column', 'tank')
+EMPTY_METRICS = {'sales': 0, 'liters': 0.0, 'income': 0.0, 'delivered': 0.0}
+
+Period = Tuple[str, str]  # (гранулярность, интервал)
+
+
+class StatsRollups:
+    """Корзины статистики: buckets[гранулярность][интервал][срез][ключ] = метрики
+
+    Метрики: sales - число продаж, liters и income - продано литров и выручка,
+    delivered - принято литров при пополнении цистерн. Ключи срезов - строки
+    (номер колонки тоже), как после загрузки из JSON.
+    """
+
+    def __init__(self, buckets: Optional[Dict] = None,
+                 retention: Optional[Dict[str, Optional[int]]] = None):
+        self.buckets: Dict[str, Dict[str, Dict]] = {granularity: {} for granularity in GRANULARITIES}
+        for granularity, periods in (buckets or {}).items():
+            if granularity in self.buckets:
+                self.buckets[granularity].update(periods)
+        # Сколько последних интервалов хранить по каждой гранулярности (None - все)
+        self.retention = retention or {}
+
+    def _add(self, timestamp: str, keys: Dict[str, str], values: Dict[str, float]) -> Set[Period]:
+        """Прибавить значения метрик к корзинам всех гранулярностей; вернуть изменённые интервалы"""
+        touched = set()
+        for granularity, length in GRANULARITIES.items():
+            period = timestamp[:length]
+            periods = self.buckets[granularity]
+            bucket = periods.get(period)
+            if bucket is None:
+                bucket = periods[period] = {}
+                touched |= self._prune(granularity)
+            for dimension, key in keys.items():
+                slices = bucket.setdefault(dimension, {})
+                metrics = slices.get(key)
+                if metrics is None:
+                    metrics = slices[key] = dict(EMPTY_METRICS)
+                for metric, value in values.items():
+                    metrics[metric] += value
+            touched.add((granularity, period))
+        return touched
+
+    def _prune(self, granularity: str) -> Set[Period]:
+        """Удалить интервалы старше срока хранения"""
+        keep = self.retention.get(granularity)
+        periods = self.buckets[granularity]
+        if not keep or len(periods) <= keep:
+            return set()
+        expired = sorted(periods)[:-keep]
+        for period in expired:
+            del periods[period]
+        return {(granularity, period) for period in expired}
+
+    def add_sale(self, timestamp: str, column: int, fuel_type: str, tank_id: str,
+                 liters: float, income: float) -> Set[Period]:
+        """Учесть продажу"""
+        return self._add(
+            timestamp,
+            {'fuel': fuel_type, 'column': str(column), 'tank': tank_id},
+            {'sales': 1, 'liters': liters, 'income': income}
+        )
+
+    def add_delivery(self, timestamp: str, fuel_type: str, tank_id: str, liters: float) -> Set[Period]:
+        """Учесть пополнение цистерны"""
+        return self._add(timestamp, {'fuel': fuel_type, 'tank': tank_id}, {'delivered': liters})
+
+    def add_transaction(self, record: Dict, tank_fuel: Dict[str, str]) -> Set[Period]:
+        """Учесть запись истории транзакций (для восстановления корзин по истории)"""
+        details = record['details']
+        if record['type'] == 'sale':
+            return self.add_sale(record['timestamp'], details['column'], details['fuel_type'],
+                                 details['tank_id'], details['liters'], details['total_price'])
+        if record['type'] == 'refuel' and details['tank_id'] in tank_fuel:
+            return self.add_delivery(record['timestamp'], tank_fuel[details['tank_id']],
+                                     details['tank_id'], details['liters_added'])
+        return set()
+
+    def get_period(self, granularity: str, period: str) -> Optional[Dict]:
+        """Копия корзины интервала (None, если интервала нет)"""
+        bucket = self.buckets[granularity].get(period)
+        if bucket is None:
+            return None
+        return {
+            dimension: {key: dict(metrics) for key, metrics in slices.items()}
+            for dimension, slices in bucket.items()
+        }
+
+    def set_period(self, granularity: str, period: str, bucket: Optional[Dict]):
+        """Заменить корзину интервала (None - удалить)"""
+        if bucket is None:
+            self.buckets[granularity].pop(period, None)
+        else:
+            self.buckets[granularity][period] = bucket
+
+    def query(self, granularity: str, dimension: str, key=None,
+              since: Optional[str] = None, until: Optional[str] = None) -> List[Tuple[str, Dict]]:
+        """Метрики по интервалам [(интервал, метрики)] в порядке времени
+
+        key - ключ среза (None - сумма по всем ключам). since/until - границы
+        времени в формате ISO: берутся интервалы, начало которых попадает в
+        [since, until).
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Неизвестная гранулярность: {granularity}")
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Неизвестный срез: {dimension}")
+        suffix = PERIOD_START[granularity]
+        periods = self.buckets[granularity]
+        result = []
+        for period in sorted(periods):
+            start = period + suffix
+            if since is not None and start < since:
+                continue
+            if until is not None and start >= until:
+                break
+            slices = periods[period].get(dimension)
+            if not slices:
+                continue
+            if key is not None:
+                metrics = slices.get(str(key))
+                if metrics is not None:
+                    result.append((period, dict(metrics)))
+                continue
+            total = dict(EMPTY_METRICS)
+            for metrics in slices.values():
+                for metric, value in metrics.items():
+                    total[metric] += value
+            result.append((period, total))
+        return result
@@ -0,0 +1,59 @@
+"""
+Индекс маршрутизации: цистерны по id и по паре (колонка, топливо)
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from data.models import Tank
+import config
+
+
+class RoutingIndex:
+    """Предрасчитанные таблицы поиска цистерн
+
+    Строится один раз по списку цистерн и COLUMNS_CONFIG. Для каждой пары
+    (колонка, топливо) хранит упорядоченный список цистерн-кандидатов и первую
+    включённую из них. После изменения цистерны достаточно вызвать refresh -
+    пересчитываются только пары, к которым она подключена.
+    """
+
+    def __init__(self, tanks: List[Tank], columns_config: Dict[int, List[str]] = None):
+        if columns_config is None:
+            columns_config = config.COLUMNS_CONFIG
+        self.tanks_by_id: Dict[str, Tank] = {}
+        self.candidates: Dict[Tuple[int, str], List[Tank]] = {}
+        self.active: Dict[Tuple[int, str], Optional[Tank]] = {}
+        self.column_fuels: Dict[int, Dict[str, Tank]] = {column: {} for column in columns_config}
+        self._lock = threading.Lock()
+
+        for tank in tanks:
+            self.tanks_by_id[tank.id] = tank
+            for column in tank.connected_to:
+                self.candidates.setdefault((column, tank.fuel_type), []).append(tank)
+                # Как и раньше, при нескольких цистернах одного топлива колонка показывает последнюю
+                self.column_fuels.setdefault(column, {})[tank.fuel_type] = tank
+
+        for key in self.candidates:
+            self._update_route(key)
+
+    def _update_route(self, key: Tuple[int, str]):
+        """Пересчитать активную цистерну для пары (колонка, топливо)"""
+        self.active[key] = next((tank for tank in self.candidates[key] if tank.enabled), None)
+
+    def refresh(self, tanks: Iterable[Tank]):
+        """Обновить маршруты после изменения состояния цистерн"""
+        with self._lock:
+            for tank in tanks:
+                for column in tank.connected_to:
+                    self._update_route((column, tank.fuel_type))
+
+    def get_tank(self, tank_id: str) -> Optional[Tank]:
+        """Цистерна по id"""
+        return self.tanks_by_id.get(tank_id)
+
+    def get_active_tank(self, column: int, fuel_type: str) -> Optional[Tank]:
+        """Включённая цистерна, из которой колонка отпускает топливо"""
+        return self.active.get((column, fuel_type))
+
+    def get_column_fuels(self, column: int) -> Dict[str, Tank]:
+        """Цистерны, подключённые к колонке, по видам топлива"""
+        return dict(self.column_fuels.get(column, {}))
@@ -0,0 +1,131 @@
+"""
+Согласованные снимки состояния АЗС для читателей
+
+Снимок (StationSnapshot) - неизменяемый вид цистерн, статистики, флага
+аварии и последних транзакций на момент завершения операции. Он строится
+из копии состояния, которую WriteBehindFlusher и так ведёт по принципу
+копирования при записи: изменённая операция цистерна или статистика
+копируются, всё остальное - общие объекты предыдущего снимка. Последние
+транзакции хранятся неизменяемым односвязным списком, новые транзакции
+добавляются в голову, а хвост остаётся общим со старыми снимками.
+Транзакции, записанные до запуска, читаются из хранилища только при первом
+обращении к ним, чтобы запуск не зависел от размера истории.
+
+Снимок подменяется одной ссылкой, поэтому читатель берёт его без
+блокировок, а операции никогда не ждут читателей.
+
+Снимок совпадает с состоянием, которое записывается на диск. Когда
+операции идут по одной, это состояние на границе операции. При параллельной
+работе колонок (CONCURRENT_DISPENSING) каждый объект снимка цел, но в
+статистику может уже попасть продажа из другого потока, цистерна которой
+войдёт только в следующий снимок.
+"""
+import threading
+from dataclasses import dataclass
+from itertools import islice
+from types import MappingProxyType
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from data.models import Statistics, Tank, Transaction
+
+
+def _transaction(record: Dict) -> Transaction:
+    return Transaction(record.get('id'), record.get('type'), record.get('timestamp'), record.get('details'))
+
+
+class LazyRecords:
+    """Транзакции, которые читаются из хранилища при первом обращении (новые первыми)"""
+
+    __slots__ = ('_load', '_transactions', '_lock')
+
+    def __init__(self, load: Callable[[], List[Dict]]):
+        self._load = load
+        self._transactions: Optional[List[Transaction]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> List[Transaction]:
+        if self._transactions is None:
+            with self._lock:
+                if self._transactions is None:
+                    self._transactions = [_transaction(record) for record in self._load()]
+                    self._load = None
+        return self._transactions
+
+
+class HistoryTail:
+    """Последние транзакции: неизменяемый список с общими узлами
+
+    older - транзакции старше цепочки (записанные до запуска), читаются лениво.
+    """
+
+    __slots__ = ('head', 'length', 'limit', 'older')
+
+    def __init__(self, limit: int, head: Optional[Tuple] = None, length: int = 0,
+                 older: Optional[LazyRecords] = None):
+        self.limit = limit
+        self.head = head        # (транзакция, следующий узел) - от новых к старым
+        self.length = length    # узлов в цепочке (может быть больше limit)
+        self.older = older
+
+    @classmethod
+    def from_records(cls, records: List[Dict], limit: int) -> 'HistoryTail':
+        """Хвост из словарей транзакций (новые первыми, как load_recent_transactions)"""
+        return cls(limit).push(_transaction(record) for record in reversed(records[:limit]))
+
+    def push(self, transactions: Iterable[Transaction]) -> 'HistoryTail':
+        """Новый хвост с добавленными транзакциями (старый не меняется)"""
+        head, length, older = self.head, self.length, self.older
+        for transaction in transactions:
+            head = (transaction, head)
+            length += 1
+        if length > 2 * self.limit:
+            # Цепочка выросла вдвое: пересобираем последние limit узлов, старые уйдут со снимками
+            latest = list(self._walk(head, self.limit))
+            head = None
+            for transaction in reversed(latest):
+                head = (transaction, head)
+            length = len(latest)
+            older = None  # в цепочке уже limit транзакций - более старые не понадобятся
+        return HistoryTail(self.limit, head, length, older)
+
+    @staticmethod
+    def _walk(head: Optional[Tuple], limit: int) -> Iterator[Transaction]:
+        while head is not None and limit > 0:
+            transaction, head = head
+            limit -= 1
+            yield transaction
+
+    def __iter__(self) -> Iterator[Transaction]:
+        yield from self._walk(self.head, self.limit)
+        if self.length < self.limit and self.older is not None:
+            yield from self.older.get()[:self.limit - self.length]
+
+    def __len__(self) -> int:
+        if self.length < self.limit and self.older is not None:
+            return min(self.length + len(self.older.get()), self.limit)
+        return min(self.length, self.limit)
+
+
+@dataclass(frozen=True)
+class StationSnapshot:
+    """Неизменяемый вид состояния АЗС (объекты снимка не изменять)"""
+    version: int                # номер: растёт на единицу с каждой сохранённой операцией
+    tanks: Mapping[str, Tank]   # копии цистерн по id, в порядке AZSCore.tanks
+    stats: Statistics
+    is_emergency: bool
+    history: HistoryTail
+
+    @classmethod
+    def create(cls, version: int, image, history: HistoryTail) -> 'StationSnapshot':
+        """Снимок из копии состояния WriteBehindFlusher (StateImage)"""
+        return cls(version, MappingProxyType(image.tanks), image.stats, image.is_emergency, history)
+
+    def get_tank(self, tank_id: str) -> Optional[Tank]:
+        return self.tanks.get(tank_id)
+
+    def get_disabled_tanks(self) -> List[Tank]:
+        return [tank for tank in self.tanks.values() if not tank.enabled]
+
+    def recent_transactions(self, limit: Optional[int] = None) -> List[Dict]:
+        """Последние транзакции словарями, новые первыми (не больше limit)"""
+        return [transaction.to_dict() for transaction in islice(self.history, limit)]
@@ -0,0 +1,385 @@
+"""
+Компактный двоичный журнал транзакций
+
+Формат файла: заголовок MAGIC, затем записи подряд. Каждая запись:
+  тип (1 байт) | тело фиксированной структуры | длина записи (4 байта)
+Длина в конце записи позволяет читать журнал с конца. Типовые транзакции
+(sale, refuel, transfer, tank_toggle, emergency) хранятся в упакованном
+виде: время - целое число микросекунд, id - 16 байт UUID, id цистерн, виды
+топлива и действия - коды из таблицы строк. Таблица строк дописывается в
+тот же файл записями STRING перед первым использованием кода. Всё, что не
+укладывается в типовую структуру, хранится записью JSON.
+
+Чтение идёт через mmap: read() раскодирует записи по одной, scan() отдаёт
+сырые кортежи полей без построения словарей - для массовых подсчётов.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b'AZSLOG1\n'
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+KIND_STRING = 0
+KIND_SALE = 1
+KIND_REFUEL = 2
+KIND_TRANSFER = 3
+KIND_TOGGLE = 4
+KIND_EMERGENCY = 5
+KIND_JSON = 6
+
+KIND_NAMES = {
+    KIND_SALE: 'sale',
+    KIND_REFUEL: 'refuel',
+    KIND_TRANSFER: 'transfer',
+    KIND_TOGGLE: 'tank_toggle',
+    KIND_EMERGENCY: 'emergency',
+}
+KIND_BY_TYPE = {name: kind for kind, name in KIND_NAMES.items()}
+
+# Общая часть типовых записей: время (мкс) и id транзакции
+HEAD = '<q16s'
+BODIES = {
+    KIND_SALE: struct.Struct(HEAD + 'HHHddd'),      # колонка, топливо, цистерна, литры, цена, сумма
+    KIND_REFUEL: struct.Struct(HEAD + 'Hdd'),       # цистерна, литры, новый объём
+    KIND_TRANSFER: struct.Struct(HEAD + 'HHHd'),    # откуда, куда, топливо, литры
+    KIND_TOGGLE: struct.Struct(HEAD + 'HH?d'),      # цистерна, действие, новое состояние, объём
+    KIND_EMERGENCY: struct.Struct(HEAD + 'Hq'),     # действие, время события (мкс)
+}
+# Поля details каждого типа - запись упаковывается, только если набор совпадает
+DETAIL_KEYS = {
+    KIND_SALE: {'column', 'fuel_type', 'liters', 'price_per_liter', 'total_price', 'tank_id'},
+    KIND_REFUEL: {'tank_id', 'liters_added', 'new_volume'},
+    KIND_TRANSFER: {'from_tank', 'to_tank', 'liters', 'fuel_type'},
+    KIND_TOGGLE: {'tank_id', 'action', 'new_state', 'volume'},
+    KIND_EMERGENCY: {'action', 'timestamp'},
+}
+KIND = struct.Struct('<B')
+LENGTH = struct.Struct('<I')
+STRING_HEAD = struct.Struct('<HH')
+JSON_HEAD = struct.Struct('<I')
+
+
+def to_micros(timestamp: str) -> int:
+    """ISO-время (без часового пояса) -> микросекунды от 1970-01-01"""
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is not None:
+        raise ValueError("время с часовым поясом")
+    if dt.isoformat() != timestamp:
+        raise ValueError("время не в форме datetime.isoformat()")
+    return (dt - EPOCH) // MICROSECOND
+
+
+def from_micros(micros: int) -> str:
+    """Микросекунды от 1970-01-01 -> ISO-время"""
+    return (EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+def _format_uuid(raw: bytes) -> str:
+    """16 байт -> каноническая строка UUID (быстрее, чем через uuid.UUID)"""
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+class BinaryTransactionLog:
+    """Двоичный журнал транзакций с тем же интерфейсом, что и TransactionJournal"""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = None
+        self._codes: Dict[str, int] = {}
+        self._strings: List[str] = []
+        self._end: Optional[int] = None     # конец последней целой записи (None - не загружено)
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        """Существует ли файл журнала"""
+        return os.path.exists(self.filepath)
+
+    # --- Запись ---
+
+    def _load(self):
+        """Один раз прочитать таблицу строк и найти конец последней целой записи"""
+        if self._end is not None:
+            return
+        self._codes, self._strings = {}, []
+        end = len(MAGIC)
+        if self.exists() and os.path.getsize(self.filepath) > 0:
+            with open(self.filepath, 'rb') as f, self._map(f) as data:
+                if data[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{self.filepath}: не является двоичным журналом АЗС")
+                for kind, offset, end in self._records(data):
+                    if kind == KIND_STRING:
+                        self._add_string(self._decode_string(data, offset)[1])
+        self._end = end
+
+    def _handle(self):
+        """Открыть файл на дозапись, отрезав недописанный хвост"""
+        if self._file is not None and not self._file.closed:
+            return self._file
+        self._load()
+        if self.exists() and os.path.getsize(self.filepath) > 0:
+            self._file = open(self.filepath, 'r+b')
+            self._file.truncate(self._end)
+            self._file.seek(self._end)
+        else:
+            self._file = open(self.filepath, 'wb')
+            self._file.write(MAGIC)
+        return self._file
+
+    def _add_string(self, value: str) -> int:
+        code = len(self._strings)
+        self._strings.append(value)
+        self._codes[value] = code
+        return code
+
+    def _code(self, value: str, out: List[bytes]) -> int:
+        """Код строки; новую строку сначала объявляем записью STRING"""
+        code = self._codes.get(value)
+        if code is None:
+            code = self._add_string(value)
+            raw = value.encode('utf-8')
+            body = STRING_HEAD.pack(code, len(raw)) + raw
+            out.append(self._frame(KIND_STRING, body))
+        return code
+
+    @staticmethod
+    def _frame(kind: int, body: bytes) -> bytes:
+        size = KIND.size + len(body) + LENGTH.size
+        return KIND.pack(kind) + body + LENGTH.pack(size)
+
+    def _encode(self, record: Dict, out: List[bytes]):
+        """Закодировать транзакцию (и нужные ей строки) в out"""
+        kind = KIND_BY_TYPE.get(record.get('type'))
+        details = record.get('details')
+        packed = None
+        if kind is not None and isinstance(details, dict) and set(details) == DETAIL_KEYS[kind]:
+            mark = len(self._strings)
+            try:
+                packed = self._pack(kind, record, details, out)
+            except (ValueError, TypeError, AttributeError, KeyError, struct.error):
+                # Забываем строки, объявленные для неудавшейся упаковки: они не попали в файл
+                for value in self._strings[mark:]:
+                    del self._codes[value]
+                del self._strings[mark:]
+                packed = None
+        if packed is None:
+            raw = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            out.append(self._frame(KIND_JSON, JSON_HEAD.pack(len(raw)) + raw))
+        else:
+            out.append(self._frame(kind, packed))
+
+    def _pack(self, kind: int, record: Dict, d: Dict, out: List[bytes]) -> bytes:
+        strings: List[bytes] = []
+        head = (to_micros(record['timestamp']), uuid.UUID(record['id']).bytes)
+        if str(uuid.UUID(bytes=head[1])) != record['id']:
+            raise ValueError("id не в канонической форме UUID")
+        code = lambda value: self._code(value, strings)
+        if kind == KIND_SALE:
+            fields = (d['column'], code(d['fuel_type']), code(d['tank_id']),
+                      d['liters'], d['price_per_liter'], d['total_price'])
+        elif kind == KIND_REFUEL:
+            fields = (code(d['tank_id']), d['liters_added'], d['new_volume'])
+        elif kind == KIND_TRANSFER:
+            fields = (code(d['from_tank']), code(d['to_tank']), code(d['fuel_type']), d['liters'])
+        elif kind == KIND_TOGGLE:
+            if not isinstance(d['new_state'], bool):
+                raise TypeError("new_state")
+            fields = (code(d['tank_id']), code(d['action']), d['new_state'], d['volume'])
+        else:
+            fields = (code(d['action']), to_micros(d['timestamp']))
+        body = BODIES[kind].pack(*head, *fields)
+        out.extend(strings)
+        return body
+
+    def append(self, record: Dict) -> int:
+        """Дописать транзакцию; вернуть число записанных байт"""
+        return self.append_many([record])
+
+    def append_many(self, records: List[Dict]) -> int:
+        """Дописать несколько транзакций одной записью в файл; вернуть число записанных байт"""
+        if not records:
+            return 0
+        with self._lock:
+            f = self._handle()
+            out: List[bytes] = []
+            for record in records:
+                self._encode(record, out)
+            data = b''.join(out)
+            f.write(data)
+            f.flush()
+            self._end += len(data)
+        return len(data)
+
+    def close(self):
+        """Закрыть файл журнала"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._end = None
+
+    # --- Чтение ---
+
+    @staticmethod
+    def _map(f):
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def _records(data, offset: int = len(MAGIC)) -> Iterator[Tuple[int, int, int]]:
+        """(тип, начало тела, конец записи) для всех целых записей начиная с offset"""
+        size = len(data)
+        while offset < size:
+            kind = data[offset]
+            body = offset + 1
+            if kind in BODIES:
+                end = body + BODIES[kind].size + LENGTH.size
+            elif kind == KIND_STRING and body + STRING_HEAD.size <= size:
+                end = body + STRING_HEAD.size + STRING_HEAD.unpack_from(data, body)[1] + LENGTH.size
+            elif kind == KIND_JSON and body + JSON_HEAD.size <= size:
+                end = body + JSON_HEAD.size + JSON_HEAD.unpack_from(data, body)[0] + LENGTH.size
+            else:
+                return
+            if end > size:
+                return  # недописанная запись
+            yield kind, body, end
+            offset = end
+
+    @staticmethod
+    def _decode_string(data, offset: int) -> Tuple[int, str]:
+        code, length = STRING_HEAD.unpack_from(data, offset)
+        start = offset + STRING_HEAD.size
+        return code, bytes(data[start:start + length]).decode('utf-8')
+
+    def _materialize(self, kind: int, fields: tuple, strings: List[str]) -> Dict:
+        """Собрать словарь транзакции из полей записи"""
+        if kind == KIND_JSON:
+            return fields[0]
+        micros, raw_id = fields[0], fields[1]
+        f = fields[2:]
+        if kind == KIND_SALE:
+            details = {'column': f[0], 'fuel_type': strings[f[1]], 'liters': f[3],
+                       'price_per_liter': f[4], 'total_price': f[5], 'tank_id': strings[f[2]]}
+        elif kind == KIND_REFUEL:
+            details = {'tank_id': strings[f[0]], 'liters_added': f[1], 'new_volume': f[2]}
+        elif kind == KIND_TRANSFER:
+            details = {'from_tank': strings[f[0]], 'to_tank': strings[f[1]],
+                       'liters': f[3], 'fuel_type': strings[f[2]]}
+        elif kind == KIND_TOGGLE:
+            details = {'tank_id': strings[f[0]], 'action': strings[f[1]],
+                       'new_state': f[2], 'volume': f[3]}
+        else:
+            details = {'action': strings[f[0]], 'timestamp': from_micros(f[1])}
+        return {
+            'id': _format_uuid(raw_id),
+            'type': KIND_NAMES[kind],
+            'timestamp': from_micros(micros),
+            'details': details
+        }
+
+    def scan(self, types: Optional[List[str]] = None) -> Iterator[Tuple[str, tuple, List[str]]]:
+        """Сырые записи: (тип, кортеж полей, таблица строк) без построения словарей
+
+        Коды строк в полях раскрываются через таблицу строк: strings[code].
+        Записи JSON отдаются как ('json', (словарь,), strings).
+        """
+        if not self.exists() or os.path.getsize(self.filepath) <= len(MAGIC):
+            return
+        wanted = None
+        if types is not None:
+            wanted = {KIND_BY_TYPE[t] for t in types if t in KIND_BY_TYPE} | {KIND_JSON}
+        strings: List[str] = []
+        with open(self.filepath, 'rb') as f, self._map(f) as data:
+            for kind, offset, _ in self._records(data):
+                if kind == KIND_STRING:
+                    strings.append(self._decode_string(data, offset)[1])
+                elif wanted is not None and kind not in wanted:
+                    continue
+                elif kind == KIND_JSON:
+                    length = JSON_HEAD.unpack_from(data, offset)[0]
+                    start = offset + JSON_HEAD.size
+                    record = json.loads(bytes(data[start:start + length]))
+                    if types is None or record.get('type') in types:
+                        yield 'json', (record,), strings
+                else:
+                    yield KIND_NAMES[kind], BODIES[kind].unpack_from(data, offset), strings
+
+    def read(self) -> Iterator[Dict]:
+        """Прочитать транзакции от старых к новым"""
+        for name, fields, strings in self.scan():
+            kind = KIND_JSON if name == 'json' else KIND_BY_TYPE[name]
+            yield self._materialize(kind, fields, strings)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.read()
+
+    def _strings_snapshot(self) -> Tuple[List[str], int]:
+        """Копия таблицы строк и конец журнала (загружаются один раз и ведутся при дозаписи)"""
+        with self._lock:
+            self._load()
+            return list(self._strings), self._end
+
+    def _decode_at(self, data, start: int, strings: List[str]) -> Optional[Dict]:
+        """Раскодировать транзакцию, запись которой начинается с позиции start"""
+        kind = data[start]
+        if kind == KIND_JSON:
+            length = JSON_HEAD.unpack_from(data, start + 1)[0]
+            body = start + 1 + JSON_HEAD.size
+            return json.loads(bytes(data[body:body + length]))
+        if kind in BODIES:
+            return self._materialize(kind, BODIES[kind].unpack_from(data, start + 1), strings)
+        return None
+
+    def read_from(self, offset: int = 0) -> Iterator[Tuple[int, int, Dict]]:
+        """Прочитать транзакции начиная с позиции offset: (начало записи, конец записи, транзакция)"""
+        if not self.exists() or os.path.getsize(self.filepath) <= len(MAGIC):
+            return
+        strings, _ = self._strings_snapshot()
+        with open(self.filepath, 'rb') as f, self._map(f) as data:
+            for kind, body, end in self._records(data, max(offset, len(MAGIC))):
+                if kind == KIND_STRING:
+                    code, value = self._decode_string(data, body)
+                    if code == len(strings):
+                        strings.append(value)
+                    continue
+                record = self._decode_at(data, body - 1, strings)
+                if record is not None:
+                    yield body - 1, end, record
+
+    def read_at(self, offsets: Iterable[int]) -> Iterator[Optional[Dict]]:
+        """Прочитать транзакции по позициям в файле"""
+        strings, _ = self._strings_snapshot()
+        with open(self.filepath, 'rb') as f, self._map(f) as data:
+            for offset in offsets:
+                yield self._decode_at(data, offset, strings) if offset < len(data) else None
+
+    def read_reversed(self) -> Iterator[Dict]:
+        """Прочитать транзакции от новых к старым (по длинам в конце записей)"""
+        if not self.exists() or os.path.getsize(self.filepath) <= len(MAGIC):
+            return
+        strings, end = self._strings_snapshot()
+        with open(self.filepath, 'rb') as f, self._map(f) as data:
+            while end > len(MAGIC):
+                size = LENGTH.unpack_from(data, end - LENGTH.size)[0]
+                start = end - size
+                record = self._decode_at(data, start, strings)
+                if record is not None:
+                    yield record
+                end = start
+
+    def tail(self, limit: int) -> List[Dict]:
+        """Последние limit транзакций (новые первыми)"""
+        result = []
+        if limit <= 0:
+            return result
+        for record in self.read_reversed():
+            result.append(record)
+            if len(result) >= limit:
+                break
+        return result
@@ -0,0 +1,231 @@
+"""
+Индекс истории транзакций для журналов в файлах
+
+Записи журнала нумеруются по порядку. Индекс хранит позицию каждой записи
+в файле, разреженный индекс времени (наибольшее время среди записей до
+каждой SPARSE_STEP-й) и списки номеров записей по типу, колонке, цистерне
+и виду топлива. Выборка пересекает списки, сужает их по времени и читает
+с диска только подходящие записи.
+
+Индекс достраивается по новым записям журнала перед каждой выборкой и
+сохраняется в файл рядом с журналом, чтобы не перечитывать историю после
+перезапуска. Файл индекса читается при первой выборке, а не при запуске.
+"""
+import base64
+import json
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+INDEX_VERSION = 1
+SPARSE_STEP = 64
+READ_CHUNK = 256
+
+# Фильтр выборки -> поле индекса
+FILTER_FIELDS = {'trans_type': 'type', 'column': 'column', 'tank_id': 'tank', 'fuel_type': 'fuel'}
+
+
+def index_keys(record: Dict) -> Iterator[Tuple[str, str]]:
+    """Ключи (поле, значение), по которым запись попадает в индекс"""
+    details = record.get('details') or {}
+    yield 'type', record.get('type')
+    if 'column' in details:
+        yield 'column', str(details['column'])
+    for field in ('tank_id', 'from_tank', 'to_tank'):
+        if field in details:
+            yield 'tank', details[field]
+    if 'fuel_type' in details:
+        yield 'fuel', details['fuel_type']
+
+
+def _encode_array(values: array) -> str:
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+
+def _decode_array(typecode: str, data: str) -> array:
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    return values
+
+
+class HistoryIndex:
+    """Индекс журнала транзакций (TransactionJournal или BinaryTransactionLog)"""
+
+    def __init__(self, journal, path: Optional[str] = None):
+        self.journal = journal
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+        self._loaded = path is None     # файл индекса читается при первой выборке
+
+    def _reset(self):
+        self.offsets = array('Q')                       # номер записи -> позиция в журнале
+        self.postings: Dict[Tuple[str, str], array] = {}  # (поле, значение) -> номера записей
+        self.sample_times: List[str] = []               # наибольшее время до каждой SPARSE_STEP-й записи
+        self.max_time = ''
+        self.monotonic = True                           # время записей не убывает
+        self.end = 0                                    # до этой позиции журнал проиндексирован
+        self.first_id = None
+        self.dirty = False
+
+    # --- Построение ---
+
+    def _add(self, offset: int, record: Dict):
+        seq = len(self.offsets)
+        self.offsets.append(offset)
+        if seq == 0:
+            self.first_id = record.get('id')
+        for key in set(index_keys(record)):
+            postings = self.postings.get(key)
+            if postings is None:
+                postings = self.postings[key] = array('L')
+            postings.append(seq)
+        timestamp = record.get('timestamp') or ''
+        if timestamp < self.max_time:
+            self.monotonic = False
+        else:
+            self.max_time = timestamp
+        if seq % SPARSE_STEP == 0:
+            self.sample_times.append(self.max_time)
+
+    def _catch_up(self):
+        """Дочитать в индекс записи, появившиеся в журнале с прошлого раза"""
+        if not self._loaded:
+            self._loaded = True
+            self._load()
+        if not self.journal.exists():
+            return
+        for offset, end, record in self.journal.read_from(self.end):
+            self._add(offset, record)
+            self.end = end
+            self.dirty = True
+
+    # --- Выборка ---
+
+    def _seq_range(self, since: Optional[str], until: Optional[str]) -> Tuple[int, int]:
+        """Диапазон номеров записей [lo, hi), в котором могут быть записи из [since, until)"""
+        lo, hi = 0, len(self.offsets)
+        if since is not None:
+            k = bisect_left(self.sample_times, since)
+            lo = max(0, (k - 1) * SPARSE_STEP)
+        if until is not None and self.monotonic:
+            k = bisect_left(self.sample_times, until)
+            if k < len(self.sample_times):
+                hi = k * SPARSE_STEP
+        return lo, hi
+
+    @staticmethod
+    def _contains(postings: array, seq: int) -> bool:
+        i = bisect_left(postings, seq)
+        return i < len(postings) and postings[i] == seq
+
+    def _candidates(self, keys: List[Tuple[str, str]], lo: int, hi: int) -> Iterator[int]:
+        """Номера записей с нужными ключами из [lo, hi), от новых к старым"""
+        if not keys:
+            yield from range(hi - 1, lo - 1, -1)
+            return
+        lists = []
+        for key in keys:
+            postings = self.postings.get(key)
+            if postings is None:
+                return
+            lists.append(postings)
+        # Перебираем самый короткий список, остальные проверяем двоичным поиском
+        lists.sort(key=len)
+        driver, others = lists[0], lists[1:]
+        for i in range(bisect_left(driver, hi) - 1, -1, -1):
+            seq = driver[i]
+            if seq < lo:
+                return
+            if all(self._contains(postings, seq) for postings in others):
+                yield seq
+
+    def query(self, trans_type: Optional[str] = None, tank_id: Optional[str] = None,
+              column: Optional[int] = None, fuel_type: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None,
+              limit: Optional[int] = None, cursor: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Выборка транзакций (новые первыми) и курсор следующей страницы (None - больше нет)"""
+        if limit is not None and limit <= 0:
+            return [], None
+        filters = {'trans_type': trans_type, 'tank_id': tank_id, 'column': column, 'fuel_type': fuel_type}
+        keys = [(FILTER_FIELDS[name], str(value)) for name, value in filters.items() if value is not None]
+        wanted = set(keys)
+        results = []
+        with self._lock:
+            self._catch_up()
+            lo, hi = self._seq_range(since, until)
+            if cursor is not None:
+                hi = min(hi, cursor)
+            candidates = self._candidates(keys, lo, hi)
+            while True:
+                chunk = list(islice(candidates, READ_CHUNK))
+                if not chunk:
+                    return results, None
+                records = self.journal.read_at([self.offsets[seq] for seq in chunk])
+                for seq, record in zip(chunk, records):
+                    if record is None or not wanted.issubset(index_keys(record)):
+                        continue
+                    timestamp = record.get('timestamp') or ''
+                    if (since is not None and timestamp < since) or (until is not None and timestamp >= until):
+                        continue
+                    results.append(record)
+                    if limit is not None and len(results) >= limit:
+                        return results, seq
+
+    # --- Файл индекса ---
+
+    def _load(self):
+        """Загрузить сохранённый индекс, если он соответствует журналу"""
+        if not os.path.exists(self.path) or not self.journal.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data['version'] != INDEX_VERSION or data['byteorder'] != sys.byteorder:
+                return
+            if data['end'] > os.path.getsize(self.journal.filepath):
+                return
+            offsets = _decode_array('Q', data['offsets'])
+            if offsets:
+                # Журнал тот же: первая запись совпадает, последняя читается
+                first, last = self.journal.read_at([offsets[0], offsets[-1]])
+                if first is None or last is None or first.get('id') != data['first_id']:
+                    return
+            self.offsets = offsets
+            self.postings = {
+                (field, value): _decode_array('L', encoded) for field, value, encoded in data['postings']
+            }
+            self.sample_times = data['sample_times']
+            self.max_time = data['max_time']
+            self.monotonic = data['monotonic']
+            self.end = data['end']
+            self.first_id = data['first_id']
+        except (OSError, ValueError, KeyError, TypeError):
+            self._reset()
+
+    def save(self):
+        """Сохранить индекс, если он изменился"""
+        with self._lock:
+            if self.path is None or not self.dirty:
+                return
+            data = {
+                'version': INDEX_VERSION,
+                'byteorder': sys.byteorder,
+                'end': self.end,
+                'first_id': self.first_id,
+                'max_time': self.max_time,
+                'monotonic': self.monotonic,
+                'sample_times': self.sample_times,
+                'offsets': _encode_array(self.offsets),
+                'postings': [[field, value, _encode_array(postings)]
+                             for (field, value), postings in self.postings.items()],
+            }
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
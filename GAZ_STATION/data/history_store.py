@@ -0,0 +1,358 @@
+"""
+Колоночное хранилище истории транзакций в памяти
+
+История держится не списком словарей, а набором типизированных массивов
+(array) одинаковой длины - по элементу на транзакцию: тип, время в
+микросекундах, 16 байт UUID, колонка, коды цистерн, топлива и действия,
+литры, цена, сумма. Строки (id цистерн, виды топлива, действия, типы)
+хранятся один раз в таблице строк, в колонках - их коды. Раскладка полей
+по типам та же, что у двоичного журнала (data.binlog): запись, которая в
+неё не укладывается, хранится словарём отдельно.
+
+Строка истории (TransactionRow) - лёгкое представление над колонками,
+словарь или Transaction собираются только по запросу. Подсчёты (суммы
+продаж, число транзакций по типам) идут прямо по колонкам.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .binlog import (DETAIL_KEYS, EPOCH, KIND_BY_TYPE, KIND_NAMES, KIND_REFUEL, KIND_SALE, KIND_TOGGLE,
+                     KIND_TRANSFER, MICROSECOND, _format_uuid, from_micros, to_micros)
+from .models import Transaction
+
+NONE = 0xFFFF          # код отсутствующей строки
+KIND_OTHER = 0         # запись хранится словарём в extras
+
+# Поле details -> колонка, по которой считаются итоги продаж
+SALE_KEYS = {'fuel_type': 'fuel', 'tank_id': 'tank', 'column': 'column'}
+
+
+def _number(value) -> float:
+    if type(value) is float:
+        return value
+    if type(value) is not int:
+        raise TypeError("ожидается число")
+    return float(value)
+
+
+def _micros(moment: Optional[str]) -> Optional[int]:
+    """Граница времени в формате ISO (можно без времени) -> микросекунды"""
+    if moment is None:
+        return None
+    return (datetime.fromisoformat(moment) - EPOCH) // MICROSECOND
+
+
+class TransactionRow:
+    """Транзакция в колоночном хранилище (без копирования полей)"""
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store: 'ColumnarHistory', index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def type(self) -> str:
+        return self.store.type_at(self.index)
+
+    @property
+    def timestamp(self) -> str:
+        return self.store.timestamp_at(self.index)
+
+    @property
+    def id(self) -> str:
+        return self.store.id_at(self.index)
+
+    @property
+    def details(self) -> Dict:
+        return self.store.details_at(self.index)
+
+    def to_dict(self) -> Dict:
+        """Словарь в том же виде, что Transaction.to_dict()"""
+        return self.store.record(self.index)
+
+    def to_transaction(self) -> Transaction:
+        record = self.to_dict()
+        return Transaction(record['id'], record['type'], record['timestamp'], record['details'])
+
+    def __repr__(self):
+        return f"TransactionRow({self.index}, {self.type}, {self.timestamp})"
+
+
+class ColumnarHistory:
+    """История транзакций в типизированных колонках"""
+
+    def __init__(self):
+        self.kinds = array('B')        # KIND_* из data.binlog, KIND_OTHER - запись в extras
+        self.times = array('q')        # время, мкс от 1970-01-01
+        self.ids = bytearray()         # по 16 байт UUID на запись
+        self.columns = array('H')      # номер колонки (0 - нет)
+        self.fuels = array('H')        # код вида топлива
+        self.tanks = array('H')        # код цистерны (для перекачки - откуда)
+        self.targets = array('H')      # код цистерны-приёмника перекачки
+        self.actions = array('H')      # код действия (включение, авария)
+        self.liters = array('d')       # литры (пополнение - добавлено)
+        self.prices = array('d')       # цена за литр
+        self.amounts = array('d')      # сумма продажи / новый объём / объём / время события аварии (мкс)
+        self.flags = array('b')        # новое состояние цистерны
+        self.extras: Dict[int, Dict] = {}
+        self.monotonic = True          # время записей не убывает - границы ищутся бинарным поиском
+        self._codes: Dict[str, int] = {}
+        self._strings: List[str] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> 'ColumnarHistory':
+        """Собрать хранилище из словарей транзакций (например, storage.iter_transactions())"""
+        store = cls()
+        store.extend(records)
+        return store
+
+    # --- Добавление ---
+
+    def _code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            if not isinstance(value, str) or len(self._strings) >= NONE:
+                raise ValueError("строку нельзя закодировать")
+            code = self._codes[value] = len(self._strings)
+            self._strings.append(value)
+        return code
+
+    def _pack(self, record: Dict) -> Tuple:
+        """Поля записи для колонок; ValueError/TypeError/KeyError - запись не укладывается в раскладку"""
+        kind = KIND_BY_TYPE.get(record.get('type'))
+        d = record.get('details')
+        if kind is None or not isinstance(d, dict) or set(d) != DETAIL_KEYS[kind]:
+            raise ValueError("нетиповая запись")
+        raw_id = bytes.fromhex(record['id'].replace('-', ''))
+        if len(raw_id) != 16 or _format_uuid(raw_id) != record['id']:
+            raise ValueError("id не в канонической форме UUID")
+        code, number = self._code, _number
+        # Все значения проверяются здесь: добавление в колонки уже не может упасть на середине
+        # kind, время, id, колонка, топливо, цистерна, приёмник, действие, литры, цена, сумма, флаг
+        if kind == KIND_SALE:
+            if type(d['column']) is not int or not 0 < d['column'] < NONE:
+                raise TypeError("column")
+            fields = (d['column'], code(d['fuel_type']), code(d['tank_id']), NONE, NONE,
+                      number(d['liters']), number(d['price_per_liter']), number(d['total_price']), 0)
+        elif kind == KIND_REFUEL:
+            fields = (0, NONE, code(d['tank_id']), NONE, NONE, number(d['liters_added']), 0.0,
+                      number(d['new_volume']), 0)
+        elif kind == KIND_TRANSFER:
+            fields = (0, code(d['fuel_type']), code(d['from_tank']), code(d['to_tank']), NONE,
+                      number(d['liters']), 0.0, 0.0, 0)
+        elif kind == KIND_TOGGLE:
+            if not isinstance(d['new_state'], bool):
+                raise TypeError("new_state")
+            fields = (0, NONE, code(d['tank_id']), NONE, code(d['action']), 0.0, 0.0, number(d['volume']),
+                      d['new_state'])
+        else:
+            fields = (0, NONE, NONE, NONE, code(d['action']), 0.0, 0.0, float(to_micros(d['timestamp'])), 0)
+        return (kind, to_micros(record['timestamp']), raw_id) + fields
+
+    def _append(self, kind: int, micros: int, raw_id: bytes, column: int, fuel: int, tank: int,
+                target: int, action: int, liters: float, price: float, amount: float, flag: int):
+        if self.times and micros < self.times[-1]:
+            self.monotonic = False
+        self.kinds.append(kind)
+        self.times.append(micros)
+        self.ids += raw_id
+        self.columns.append(column)
+        self.fuels.append(fuel)
+        self.tanks.append(tank)
+        self.targets.append(target)
+        self.actions.append(action)
+        self.liters.append(liters)
+        self.prices.append(price)
+        self.amounts.append(amount)
+        self.flags.append(flag)
+
+    def append(self, record: Dict):
+        """Добавить транзакцию (словарь, как Transaction.to_dict())"""
+        self.extend([record])
+
+    def extend(self, records: Iterable[Dict]):
+        """Добавить транзакции по порядку"""
+        with self._lock:
+            for record in records:
+                mark = len(self._strings)
+                try:
+                    self._append(*self._pack(record))
+                    continue
+                except (ValueError, TypeError, KeyError, AttributeError, OverflowError):
+                    # Забываем строки, заведённые для неудавшейся упаковки
+                    for value in self._strings[mark:]:
+                        del self._codes[value]
+                    del self._strings[mark:]
+                try:
+                    micros = to_micros(record['timestamp'])
+                except (ValueError, TypeError, KeyError):
+                    # Время не разобрать: берём время предыдущей записи, фильтры по времени смотрят в словарь
+                    micros = self.times[-1] if self.times else 0
+                self.extras[len(self.kinds)] = record
+                self._append(KIND_OTHER, micros, bytes(16), 0, NONE, NONE, NONE, NONE, 0.0, 0.0, 0.0, 0)
+
+    # --- Чтение строк ---
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> TransactionRow:
+        if index < 0:
+            index += len(self.kinds)
+        if not 0 <= index < len(self.kinds):
+            raise IndexError(index)
+        return TransactionRow(self, index)
+
+    def __iter__(self) -> Iterator[TransactionRow]:
+        return (TransactionRow(self, index) for index in range(len(self.kinds)))
+
+    def string(self, code: int) -> Optional[str]:
+        return None if code == NONE else self._strings[code]
+
+    def type_at(self, index: int) -> str:
+        kind = self.kinds[index]
+        return self.extras[index].get('type') if kind == KIND_OTHER else KIND_NAMES[kind]
+
+    def timestamp_at(self, index: int) -> str:
+        if self.kinds[index] == KIND_OTHER:
+            return self.extras[index].get('timestamp')
+        return from_micros(self.times[index])
+
+    def id_at(self, index: int) -> str:
+        if self.kinds[index] == KIND_OTHER:
+            return self.extras[index].get('id')
+        return _format_uuid(bytes(self.ids[index * 16:index * 16 + 16]))
+
+    def details_at(self, index: int) -> Dict:
+        """details транзакции (новый словарь, ключи в том же порядке, что пишет AZSCore)"""
+        kind = self.kinds[index]
+        if kind == KIND_OTHER:
+            return self.extras[index].get('details')
+        s = self.string
+        if kind == KIND_SALE:
+            return {'column': self.columns[index], 'fuel_type': s(self.fuels[index]),
+                    'liters': self.liters[index], 'price_per_liter': self.prices[index],
+                    'total_price': self.amounts[index], 'tank_id': s(self.tanks[index])}
+        if kind == KIND_REFUEL:
+            return {'tank_id': s(self.tanks[index]), 'liters_added': self.liters[index],
+                    'new_volume': self.amounts[index]}
+        if kind == KIND_TRANSFER:
+            return {'from_tank': s(self.tanks[index]), 'to_tank': s(self.targets[index]),
+                    'liters': self.liters[index], 'fuel_type': s(self.fuels[index])}
+        if kind == KIND_TOGGLE:
+            return {'tank_id': s(self.tanks[index]), 'action': s(self.actions[index]),
+                    'new_state': bool(self.flags[index]), 'volume': self.amounts[index]}
+        return {'action': s(self.actions[index]), 'timestamp': from_micros(int(self.amounts[index]))}
+
+    def record(self, index: int) -> Dict:
+        """Транзакция словарём"""
+        if self.kinds[index] == KIND_OTHER:
+            return self.extras[index]
+        return {'id': self.id_at(index), 'type': self.type_at(index),
+                'timestamp': self.timestamp_at(index), 'details': self.details_at(index)}
+
+    def records(self, since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Dict]:
+        """Транзакции словарями, от старых к новым"""
+        lo, hi = self._bounds(since, until)
+        since_us, until_us = _micros(since), _micros(until)
+        for index in range(lo, hi):
+            if self._in_range(index, since_us, until_us, since, until):
+                yield self.record(index)
+
+    # --- Подсчёты по колонкам ---
+
+    def _bounds(self, since: Optional[str], until: Optional[str]) -> Tuple[int, int]:
+        """Диапазон номеров записей, где могут быть записи из [since, until)"""
+        lo, hi = 0, len(self.kinds)
+        if self.monotonic:
+            if since is not None:
+                lo = bisect_left(self.times, _micros(since))
+            if until is not None:
+                hi = bisect_left(self.times, _micros(until), lo)
+        return lo, hi
+
+    def _in_range(self, index: int, since_us: Optional[int], until_us: Optional[int],
+                  since: Optional[str], until: Optional[str]) -> bool:
+        if self.kinds[index] == KIND_OTHER:
+            timestamp = self.extras[index].get('timestamp') or ''
+            return (since is None or timestamp >= since) and (until is None or timestamp < until)
+        micros = self.times[index]
+        return (since_us is None or micros >= since_us) and (until_us is None or micros < until_us)
+
+    def count_by_type(self, since: Optional[str] = None, until: Optional[str] = None) -> Dict[str, int]:
+        """Число транзакций каждого типа за [since, until)"""
+        lo, hi = self._bounds(since, until)
+        since_us, until_us = _micros(since), _micros(until)
+        counts = [0] * (max(KIND_NAMES) + 1)
+        if self.monotonic:
+            for kind in self.kinds[lo:hi]:
+                counts[kind] += 1
+        else:
+            for kind, micros in zip(self.kinds[lo:hi], self.times[lo:hi]):
+                if (since_us is None or micros >= since_us) and (until_us is None or micros < until_us):
+                    counts[kind] += 1
+        result = {KIND_NAMES[kind]: count for kind, count in enumerate(counts) if count and kind != KIND_OTHER}
+        for index, record in self._extras_in(lo, hi, since, until):
+            trans_type = record.get('type')
+            result[trans_type] = result.get(trans_type, 0) + 1
+        return result
+
+    def sales_totals(self, by: str = 'fuel_type', since: Optional[str] = None,
+                     until: Optional[str] = None) -> Dict:
+        """Итоги продаж за [since, until) по виду топлива, цистерне или колонке:
+        {ключ: {'cars', 'liters', 'income'}}"""
+        if by not in SALE_KEYS:
+            raise ValueError(f"Неизвестный разрез: {by}")
+        lo, hi = self._bounds(since, until)
+        since_us, until_us = _micros(since), _micros(until)
+        keys = getattr(self, SALE_KEYS[by] + 's')[lo:hi]
+        totals: Dict[int, List[float]] = {}
+        check_time = not self.monotonic
+        for kind, key, micros, liters, income in zip(self.kinds[lo:hi], keys, self.times[lo:hi],
+                                                     self.liters[lo:hi], self.amounts[lo:hi]):
+            if kind != KIND_SALE:
+                continue
+            if check_time and not ((since_us is None or micros >= since_us)
+                                   and (until_us is None or micros < until_us)):
+                continue
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = [0, 0.0, 0.0]
+            total[0] += 1
+            total[1] += liters
+            total[2] += income
+        result = {}
+        for key, (cars, liters, income) in totals.items():
+            name = key if by == 'column' else self.string(key)
+            result[name] = {'cars': cars, 'liters': liters, 'income': income}
+        for _, record in self._extras_in(lo, hi, since, until):
+            details = record.get('details') or {}
+            if record.get('type') != 'sale' or by not in details:
+                continue
+            total = result.setdefault(details[by], {'cars': 0, 'liters': 0.0, 'income': 0.0})
+            total['cars'] += 1
+            total['liters'] += details.get('liters', 0.0)
+            total['income'] += details.get('total_price', 0.0)
+        return result
+
+    def _extras_in(self, lo: int, hi: int, since: Optional[str], until: Optional[str]) -> Iterator[Tuple[int, Dict]]:
+        for index, record in self.extras.items():
+            if lo <= index < hi and self._in_range(index, None, None, since, until):
+                yield index, record
+
+    def columns_snapshot(self, names: Iterable[str]) -> Tuple[Dict[str, array], List[str]]:
+        """Копии колонок names одной длины и таблица строк (для расчётов по всей истории)"""
+        with self._lock:
+            count = len(self.kinds)
+            return {name: getattr(self, name)[:count] for name in names}, list(self._strings)
+
+    def memory_bytes(self) -> int:
+        """Размер колонок в байтах (без таблицы строк и нетиповых записей)"""
+        columns = (self.kinds, self.times, self.columns, self.fuels, self.tanks, self.targets,
+                   self.actions, self.liters, self.prices, self.amounts, self.flags)
+        return len(self.ids) + sum(column.itemsize * len(column) for column in columns)
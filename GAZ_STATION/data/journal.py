@@ -0,0 +1,216 @@
+"""
+Журналы с дозаписью (append-only)
+
+Каждая запись хранится отдельной строкой JSON. Запись новой транзакции
+только дописывает строку в конец файла, история не перезаписывается и не
+обрезается. Исключение - недописанная после аварийного завершения
+последняя строка: она отрезается при первом открытии на дозапись. Журнал
+изменений состояния (WAL) устроен так же, но очищается после каждого
+полного снимка.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class TransactionJournal:
+    """Журнал транзакций: одна JSON-запись на строку"""
+
+    def __init__(self, filepath: str, block_size: int = 64 * 1024):
+        self.filepath = filepath
+        self.block_size = block_size
+        self._file = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def encode(record: Dict) -> bytes:
+        """Закодировать запись в строку журнала"""
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        return (line + '\n').encode('utf-8')
+
+    @staticmethod
+    def decode(line: bytes) -> Optional[Dict]:
+        """Раскодировать строку журнала (None для пустой или повреждённой строки)"""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            # Недописанная строка после аварийного завершения
+            return None
+
+    def exists(self) -> bool:
+        """Существует ли файл журнала"""
+        return os.path.exists(self.filepath)
+
+    def _handle(self):
+        """Открыть файл на дозапись, отрезав недописанную последнюю строку"""
+        if self._file is not None and not self._file.closed:
+            return self._file
+        if self.exists():
+            self._file = open(self.filepath, 'r+b')
+            self._file.truncate(self._complete_size(self._file))
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(self.filepath, 'ab')
+        return self._file
+
+    def _complete_size(self, f) -> int:
+        """Размер файла до конца последней целой строки (после последнего перевода строки)"""
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            size = min(self.block_size, position)
+            position -= size
+            f.seek(position)
+            newline = f.read(size).rfind(b'\n')
+            if newline >= 0:
+                return position + newline + 1
+        return 0
+
+    def append(self, record: Dict) -> int:
+        """Дописать запись в конец журнала; вернуть число записанных байт"""
+        data = self.encode(record)
+        with self._lock:
+            f = self._handle()
+            f.write(data)
+            f.flush()
+        return len(data)
+
+    def append_many(self, records: List[Dict]) -> int:
+        """Дописать несколько записей одной операцией записи; вернуть число записанных байт"""
+        if not records:
+            return 0
+        data = b''.join(self.encode(record) for record in records)
+        with self._lock:
+            f = self._handle()
+            f.write(data)
+            f.flush()
+        return len(data)
+
+    def close(self):
+        """Закрыть файл журнала"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.read()
+
+    def read(self) -> Iterator[Dict]:
+        """Прочитать записи от старых к новым"""
+        if not self.exists():
+            return
+        with open(self.filepath, 'rb') as f:
+            for line in f:
+                record = self.decode(line)
+                if record is not None:
+                    yield record
+
+    def read_from(self, offset: int = 0) -> Iterator[Tuple[int, int, Dict]]:
+        """Прочитать записи начиная с позиции offset: (начало записи, конец записи, запись)"""
+        if not self.exists():
+            return
+        with open(self.filepath, 'rb') as f:
+            f.seek(offset)
+            end = offset
+            for line in f:
+                start, end = end, end + len(line)
+                if not line.endswith(b'\n'):
+                    return  # недописанная строка
+                record = self.decode(line)
+                if record is not None:
+                    yield start, end, record
+
+    def read_at(self, offsets: Iterable[int]) -> Iterator[Optional[Dict]]:
+        """Прочитать записи по позициям в файле (None - записи по позиции нет)"""
+        with open(self.filepath, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                yield self.decode(f.readline())
+
+    def read_reversed(self) -> Iterator[Dict]:
+        """Прочитать записи от новых к старым, блоками с конца файла"""
+        if not self.exists():
+            return
+        with open(self.filepath, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b''
+            while position > 0:
+                size = min(self.block_size, position)
+                position -= size
+                f.seek(position)
+                block = f.read(size) + remainder
+                lines = block.split(b'\n')
+                # Первая строка блока может быть неполной - дочитаем её со следующим блоком
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    record = self.decode(line)
+                    if record is not None:
+                        yield record
+            record = self.decode(remainder)
+            if record is not None:
+                yield record
+
+    def tail(self, limit: int) -> List[Dict]:
+        """Последние limit записей (новые первыми)"""
+        result = []
+        if limit <= 0:
+            return result
+        for record in self.read_reversed():
+            result.append(record)
+            if len(result) >= limit:
+                break
+        return result
+
+
+class WriteAheadLog(TransactionJournal):
+    """Журнал изменений состояния (write-ahead log) с усечением после снимка"""
+
+    def __init__(self, filepath: str, fsync: bool = False, metrics=None):
+        super().__init__(filepath)
+        self.fsync = fsync
+        self.metrics = metrics  # None - без замеров
+
+    def append(self, record: Dict) -> int:
+        """Дописать запись и (при необходимости) сбросить её на диск"""
+        data = self.encode(record)
+        started = time.perf_counter()
+        with self._lock:
+            f = self._handle()
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        if self.metrics is not None:
+            filename = os.path.basename(self.filepath)
+            self.metrics.observe('azs_file_write_seconds', time.perf_counter() - started, file=filename)
+            self.metrics.inc('azs_file_writes_total', file=filename)
+            self.metrics.inc('azs_file_write_bytes_total', len(data), file=filename)
+        return len(data)
+
+    @staticmethod
+    def apply_state(record: Dict, tanks: Dict, stats):
+        """Применить запись к цистернам (tanks - по id) и статистике
+
+        Флаг аварии и корзины статистики по интервалам применяет вызывающий код.
+        """
+        for tank_id, (volume, enabled) in record.get('tanks', {}).items():
+            tank = tanks.get(tank_id)
+            if tank:
+                tank.current_volume = volume
+                tank.enabled = enabled
+        if 'totals' in record:
+            stats.total_cars, stats.total_income = record['totals']
+            stats.fuel_stats.update(record['fuel_stats'])
+
+    def truncate(self):
+        """Очистить журнал после полного снимка состояния"""
+        self.close()
+        with open(self.filepath, 'wb') as f:
+            if self.fsync:
+                os.fsync(f.fileno())
@@ -1,7 +1,7 @@
 """
 Модели данных для системы АЗС
 """
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, replace
 from typing import List, Dict, Optional
 from datetime import datetime
 import json
@@ -24,6 +24,10 @@ class Tank:
     def from_dict(cls, data: dict):
         return cls(**data)
     
+    def copy(self) -> 'Tank':
+        """Независимая копия цистерны"""
+        return replace(self, connected_to=list(self.connected_to))
+    
     def check_level(self) -> bool:
         """Проверка минимального уровня"""
         return self.current_volume >= self.min_level
@@ -75,4 +79,12 @@ class Statistics:
     fuel_stats: Dict[str, Dict]  # fuel_type: {'liters': float, 'income': float}
     
     def to_dict(self):
-        return asdict(self)
\ No newline at end of file
+        return asdict(self)
+    
+    def copy(self) -> 'Statistics':
+        """Независимая копия статистики"""
+        return Statistics(
+            total_cars=self.total_cars,
+            total_income=self.total_income,
+            fuel_stats={fuel: dict(values) for fuel, values in self.fuel_stats.items()}
+        )
\ No newline at end of file
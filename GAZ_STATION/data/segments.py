@@ -0,0 +1,339 @@
+"""
+Архив истории транзакций: сжатые сегменты холодного уровня
+
+История хранится в два уровня. Горячий уровень - журнал транзакций
+(transactions.jsonl / transactions.bin) с индексом HistoryIndex: последние
+записи, несжатые и полностью проиндексированные. Холодный уровень - архив:
+записи старше окна горячего уровня запечатываются в сегменты по дням или по
+месяцам, по одному файлу на период (2026-10.jsonl.gz, 2026-10-18.jsonl.xz).
+
+Формат сегмента:
+  сжатые строки JSON (gzip или lzma) | оглавление JSON | длина оглавления (4 байта) | MAGIC
+Оглавление хранит число записей, диапазон времени, счётчики по типам и
+значения колонок, цистерн и видов топлива. Выборка читает только оглавления
+и распаковывает лишь сегменты, в которых могут быть подходящие записи.
+
+Записи архива нумеруются по порядку от старых к новым. Курсор выборки по
+архиву - отрицательное число -1 - номер (курсоры горячего уровня
+неотрицательны), поэтому постраничная выборка переходит из журнала в архив
+без изменения интерфейса query_transactions.
+"""
+import json
+import lzma
+import os
+import struct
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .history_index import FILTER_FIELDS, index_keys
+from .journal import TransactionJournal
+
+MAGIC = b'AZSSEG1\n'
+TRAILER = struct.Struct('<I')
+FOOTER_VERSION = 1
+READ_BLOCK = 256 * 1024
+
+# Период сегмента -> длина префикса ISO-времени, задающего период
+PERIODS = {'day': 10, 'month': 7}
+# Сжатие -> расширение файла
+CODECS = {'gzip': '.jsonl.gz', 'lzma': '.jsonl.xz'}
+
+
+def _compressor(codec: str):
+    if codec == 'gzip':
+        return zlib.compressobj(9, zlib.DEFLATED, 31)
+    return lzma.LZMACompressor(preset=6)
+
+
+def _decompressor(codec: str):
+    if codec == 'gzip':
+        return zlib.decompressobj(31)
+    return lzma.LZMADecompressor()
+
+
+def period_start(moment: datetime, period: str) -> str:
+    """Начало периода, в который попадает moment, в формате ISO"""
+    if period == 'month':
+        return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0).isoformat()
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+
+
+def seal_cutoff(now: datetime, hot_days: int, period: str) -> str:
+    """Граница горячего уровня: записи раньше неё уходят в архив целыми периодами"""
+    return period_start(now - timedelta(days=hot_days), period)
+
+
+class Segment:
+    """Файл сегмента и его оглавление"""
+
+    __slots__ = ('key', 'path', 'footer', 'payload_size')
+
+    def __init__(self, key: str, path: str, footer: Dict, payload_size: int):
+        self.key = key                      # период: '2026-10' или '2026-10-18'
+        self.path = path
+        self.footer = footer
+        self.payload_size = payload_size    # байт сжатых данных в начале файла
+
+    @property
+    def count(self) -> int:
+        return self.footer['count']
+
+    def may_contain(self, filters: Dict, since: Optional[str], until: Optional[str]) -> bool:
+        """Могут ли в сегменте быть записи, подходящие под выборку (по оглавлению)"""
+        footer = self.footer
+        if not footer['count']:
+            return False
+        if since is not None and footer['last_time'] < since:
+            return False
+        if until is not None and footer['first_time'] >= until:
+            return False
+        for name, value in filters.items():
+            if value is None:
+                continue
+            field = FILTER_FIELDS[name]
+            if field == 'type':
+                if not footer['types'].get(value):
+                    return False
+            elif str(value) not in footer['keys'].get(field, ()):
+                return False
+        return True
+
+    def read(self) -> Iterator[Dict]:
+        """Записи сегмента по порядку (распаковка потоком)"""
+        decompressor = _decompressor(self.footer['codec'])
+        rest = b''
+        with open(self.path, 'rb') as f:
+            remaining = self.payload_size
+            while remaining > 0:
+                block = f.read(min(READ_BLOCK, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                lines = (rest + decompressor.decompress(block)).split(b'\n')
+                rest = lines.pop()
+                for line in lines:
+                    record = TransactionJournal.decode(line)
+                    if record is not None:
+                        yield record
+        record = TransactionJournal.decode(rest)
+        if record is not None:
+            yield record
+
+
+class SegmentArchive:
+    """Холодный уровень истории: директория сжатых сегментов"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[Tuple[int, int], Segment]] = {}   # путь -> (размер, mtime), сегмент
+
+    # --- Чтение ---
+
+    def segments(self) -> List[Segment]:
+        """Сегменты архива от старых к новым (оглавления читаются один раз)"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        with self._lock:
+            for name in sorted(os.listdir(self.directory)):
+                key = self._key(name)
+                if key is None:
+                    continue
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                cached = self._cache.get(path)
+                if cached is None or cached[0] != (stat.st_size, stat.st_mtime_ns):
+                    cached = (stat.st_size, stat.st_mtime_ns), self._open(key, path)
+                    self._cache[path] = cached
+                found.append(cached[1])
+        return found
+
+    @staticmethod
+    def _key(name: str) -> Optional[str]:
+        for extension in CODECS.values():
+            if name.endswith(extension):
+                return name[:-len(extension)]
+        return None
+
+    @staticmethod
+    def _open(key: str, path: str) -> Segment:
+        """Прочитать оглавление сегмента с конца файла"""
+        tail = TRAILER.size + len(MAGIC)
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size < tail:
+                raise ValueError(f"{path}: не является сегментом архива АЗС")
+            f.seek(size - tail)
+            trailer = f.read(tail)
+            if trailer[TRAILER.size:] != MAGIC:
+                raise ValueError(f"{path}: не является сегментом архива АЗС")
+            footer_size = TRAILER.unpack(trailer[:TRAILER.size])[0]
+            f.seek(size - tail - footer_size)
+            footer = json.loads(f.read(footer_size))
+        return Segment(key, path, footer, size - tail - footer_size)
+
+    def count(self) -> int:
+        """Записей в архиве"""
+        return sum(segment.count for segment in self.segments())
+
+    def read(self) -> Iterator[Dict]:
+        """Все записи архива от старых к новым"""
+        return chain.from_iterable(segment.read() for segment in self.segments())
+
+    def read_reversed(self) -> Iterator[Dict]:
+        """Все записи архива от новых к старым (сегмент распаковывается целиком)"""
+        for segment in reversed(self.segments()):
+            yield from reversed(list(segment.read()))
+
+    def tail(self, limit: int) -> List[Dict]:
+        """Последние limit записей архива (новые первыми)"""
+        records = []
+        for record in self.read_reversed():
+            if len(records) >= limit:
+                break
+            records.append(record)
+        return records
+
+    def query(self, trans_type: Optional[str] = None, tank_id: Optional[str] = None,
+              column: Optional[int] = None, fuel_type: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None,
+              limit: Optional[int] = None, cursor: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Выборка из архива (новые первыми) и курсор следующей страницы (None - больше нет)
+
+        cursor - отрицательный курсор архива из прошлой выборки (None - с самых новых записей).
+        """
+        if limit is not None and limit <= 0:
+            return [], None
+        filters = {'trans_type': trans_type, 'tank_id': tank_id, 'column': column, 'fuel_type': fuel_type}
+        wanted = {(FILTER_FIELDS[name], str(value)) for name, value in filters.items() if value is not None}
+        segments = self.segments()
+        end = sum(segment.count for segment in segments)
+        hi = end if cursor is None else -1 - cursor     # выбираем записи с номерами меньше hi
+        results = []
+        for segment in reversed(segments):
+            base = end - segment.count
+            end = base
+            if base >= hi or not segment.may_contain(filters, since, until):
+                continue
+            records = list(segment.read())
+            for i in range(min(len(records), hi - base) - 1, -1, -1):
+                record = records[i]
+                timestamp = record.get('timestamp') or ''
+                if (since is not None and timestamp < since) or (until is not None and timestamp >= until):
+                    continue
+                if not wanted.issubset(index_keys(record)):
+                    continue
+                results.append(record)
+                if limit is not None and len(results) >= limit:
+                    return results, -1 - (base + i)
+        return results, None
+
+    # --- Запечатывание и хранение ---
+
+    def seal(self, records: Iterable[Dict], period: str = 'month', codec: str = 'gzip') -> Dict[str, int]:
+        """Записать записи в сегменты по периодам ('day' или 'month'); вернуть {период: добавлено записей}
+
+        Записи одного периода копятся, пока период не сменится (журнал обычно
+        упорядочен по времени). Если сегмент периода уже есть, записи
+        объединяются с ним без повторов по id.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Неизвестный период сегментов: {period}")
+        if codec not in CODECS:
+            raise ValueError(f"Неизвестное сжатие сегментов: {codec}")
+        width = PERIODS[period]
+        sealed: Dict[str, int] = {}
+        key, batch = None, []
+        for record in records:
+            record_key = (record.get('timestamp') or '')[:width]
+            if record_key != key:
+                if batch:
+                    sealed[key] = sealed.get(key, 0) + self._write(key, batch, codec)
+                key, batch = record_key, []
+            batch.append(record)
+        if batch:
+            sealed[key] = sealed.get(key, 0) + self._write(key, batch, codec)
+        return sealed
+
+    def _write(self, key: str, records: List[Dict], codec: str) -> int:
+        """Записать сегмент периода key (с записями существующего сегмента); вернуть число новых записей"""
+        os.makedirs(self.directory, exist_ok=True)
+        existing = [segment for segment in self.segments() if segment.key == key]
+        merged, seen = [], set()
+        for record in chain(*(segment.read() for segment in existing), records):
+            record_id = record.get('id')
+            if record_id is not None:
+                if record_id in seen:
+                    continue
+                seen.add(record_id)
+            merged.append(record)
+        added = len(merged) - sum(segment.count for segment in existing)
+        if not added:
+            return 0
+        merged.sort(key=lambda record: record.get('timestamp') or '')
+
+        path = os.path.join(self.directory, key + CODECS[codec])
+        tmp_path = path + '.tmp'
+        compressor = _compressor(codec)
+        types, keys = Counter(), {}
+        with open(tmp_path, 'wb') as f:
+            for record in merged:
+                f.write(compressor.compress(TransactionJournal.encode(record)))
+                types[record.get('type')] += 1
+                for field, value in index_keys(record):
+                    if field != 'type':
+                        keys.setdefault(field, set()).add(value)
+            f.write(compressor.flush())
+            footer = json.dumps({
+                'version': FOOTER_VERSION,
+                'codec': codec,
+                'count': len(merged),
+                'first_time': merged[0].get('timestamp') or '',
+                'last_time': merged[-1].get('timestamp') or '',
+                'types': dict(types),
+                'keys': {field: sorted(values) for field, values in keys.items()},
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            f.write(footer)
+            f.write(TRAILER.pack(len(footer)))
+            f.write(MAGIC)
+        os.replace(tmp_path, path)
+        for segment in existing:
+            if segment.path != path:
+                os.remove(segment.path)     # сегмент периода был сжат другим способом
+        return added
+
+    def expire(self, before: str) -> List[str]:
+        """Удалить сегменты, все записи которых раньше before; вернуть их периоды"""
+        removed = []
+        for segment in self.segments():
+            if segment.footer['last_time'] < before:
+                os.remove(segment.path)
+                removed.append(segment.key)
+        with self._lock:
+            self._cache = {path: cached for path, cached in self._cache.items() if os.path.exists(path)}
+        return removed
+
+
+def tiered_query(hot_query: Callable[[Optional[int]], Tuple[List[Dict], Optional[int]]],
+                 archive: SegmentArchive, filters: Dict, since: Optional[str], until: Optional[str],
+                 limit: Optional[int], cursor: Optional[int]) -> Tuple[List[Dict], Optional[int]]:
+    """Выборка сначала по горячему уровню, затем продолжение по архиву
+
+    hot_query(cursor) - выборка по журналу с теми же фильтрами и limit.
+    """
+    results = []
+    if cursor is None or cursor >= 0:
+        results, next_cursor = hot_query(cursor)
+        if next_cursor is not None:
+            return results, next_cursor
+        cursor = None
+    remaining = None if limit is None else limit - len(results)
+    if remaining is not None and remaining <= 0:
+        return results, None
+    cold, next_cursor = archive.query(since=since, until=until, limit=remaining, cursor=cursor, **filters)
+    return results + cold, next_cursor
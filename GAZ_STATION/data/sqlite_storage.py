@@ -0,0 +1,370 @@
+"""
+Хранилище данных АЗС в SQLite
+
+Альтернатива DataStorage с тем же набором методов. Все данные станции лежат
+в одном файле azs.db; история транзакций проиндексирована по времени, типу,
+цистерне и колонке, поэтому выборки не требуют чтения всей истории.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from .models import Tank, Transaction, Statistics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tanks (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    fuel_type TEXT NOT NULL,
+    max_volume REAL NOT NULL,
+    current_volume REAL NOT NULL,
+    min_level REAL NOT NULL,
+    enabled INTEGER NOT NULL,
+    connected_to TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    column_no INTEGER,
+    tank_id TEXT,
+    fuel_type TEXT,
+    details TEXT NOT NULL,
+    to_tank TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_timestamp ON transactions (timestamp);
+CREATE INDEX IF NOT EXISTS transactions_type ON transactions (type, seq);
+CREATE INDEX IF NOT EXISTS transactions_tank ON transactions (tank_id, seq);
+CREATE INDEX IF NOT EXISTS transactions_column ON transactions (column_no, seq);
+CREATE TABLE IF NOT EXISTS statistics (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total_cars INTEGER NOT NULL,
+    total_income REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fuel_stats (
+    fuel_type TEXT PRIMARY KEY,
+    liters REAL NOT NULL,
+    income REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    PRIMARY KEY (granularity, period)
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Запросы держим константами: sqlite3 кэширует подготовленные выражения по тексту
+SQL_UPSERT_TANK = (
+    "INSERT OR REPLACE INTO tanks (id, position, fuel_type, max_volume, current_volume, "
+    "min_level, enabled, connected_to) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+# Индекс по цистерне-приёмнику создаётся после добавления столбца в старые базы
+SQL_INDEX_TO_TANK = "CREATE INDEX IF NOT EXISTS transactions_to_tank ON transactions (to_tank, seq)"
+SQL_INSERT_TRANSACTION = (
+    "INSERT INTO transactions (id, type, timestamp, column_no, tank_id, fuel_type, details, to_tank) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_UPSERT_STATS = "INSERT OR REPLACE INTO statistics (id, total_cars, total_income) VALUES (1, ?, ?)"
+SQL_UPSERT_FUEL_STATS = "INSERT OR REPLACE INTO fuel_stats (fuel_type, liters, income) VALUES (?, ?, ?)"
+SQL_UPSERT_ROLLUP = "INSERT OR REPLACE INTO rollups (granularity, period, bucket) VALUES (?, ?, ?)"
+SQL_DELETE_ROLLUP = "DELETE FROM rollups WHERE granularity = ? AND period = ?"
+SQL_UPSERT_STATE = "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)"
+
+
+class SQLiteStorage:
+    """Хранилище данных АЗС в базе SQLite (режим WAL)"""
+
+    def __init__(self, data_dir: str = "data", filename: str = "azs.db", metrics=None):
+        self.data_dir = data_dir
+        self.metrics = metrics  # None - без замеров
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        self.path = os.path.join(data_dir, filename)
+        # Соединение используется и потоком фоновой записи состояния
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._depth = 0
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        """Довести схему базы, созданной прежней версией, до текущей"""
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(transactions)")}
+        if 'to_tank' not in columns:
+            # Цистерна-приёмник перекачки раньше хранилась только в details
+            with self.conn:
+                self.conn.execute("ALTER TABLE transactions ADD COLUMN to_tank TEXT")
+                self.conn.execute("UPDATE transactions SET to_tank = json_extract(details, '$.to_tank') "
+                                  "WHERE type = 'transfer'")
+        self.conn.execute(SQL_INDEX_TO_TANK)
+
+    @contextmanager
+    def batch(self):
+        """Выполнить несколько сохранений одной транзакцией базы (вложенные вызовы объединяются)"""
+        with self._lock:
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                if self._depth == 1:
+                    self.conn.rollback()
+                raise
+            else:
+                if self._depth == 1:
+                    self._commit()
+            finally:
+                self._depth -= 1
+
+    def _commit(self):
+        """Зафиксировать транзакцию базы (с замером, если метрики включены)"""
+        if self.metrics is None:
+            self.conn.commit()
+            return
+        started = time.perf_counter()
+        self.conn.commit()
+        filename = os.path.basename(self.path)
+        self.metrics.observe('azs_file_write_seconds', time.perf_counter() - started, file=filename)
+        self.metrics.inc('azs_file_writes_total', file=filename)
+
+    def close(self):
+        """Закрыть соединение с базой"""
+        with self._lock:
+            self.conn.close()
+
+    # --- Цистерны ---
+
+    def save_tanks(self, tanks: List[Tank]):
+        """Сохранить состояние цистерн"""
+        rows = [
+            (tank.id, position, tank.fuel_type, tank.max_volume, tank.current_volume,
+             tank.min_level, int(tank.enabled), json.dumps(tank.connected_to))
+            for position, tank in enumerate(tanks)
+        ]
+        with self.batch():
+            self.conn.executemany(SQL_UPSERT_TANK, rows)
+
+    def load_tanks(self) -> List[Tank]:
+        """Загрузить состояние цистерн"""
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM tanks ORDER BY position").fetchall()
+        return [
+            Tank(
+                id=row['id'],
+                fuel_type=row['fuel_type'],
+                max_volume=row['max_volume'],
+                current_volume=row['current_volume'],
+                min_level=row['min_level'],
+                enabled=bool(row['enabled']),
+                connected_to=json.loads(row['connected_to'])
+            )
+            for row in rows
+        ]
+
+    # --- Транзакции ---
+
+    @staticmethod
+    def _transaction_row(record: Dict) -> tuple:
+        """Строка таблицы transactions с вынесенными в индексируемые поля деталями"""
+        details = record['details']
+        return (
+            record['id'],
+            record['type'],
+            record['timestamp'],
+            details.get('column'),
+            details.get('tank_id') or details.get('from_tank'),
+            details.get('fuel_type'),
+            json.dumps(details, ensure_ascii=False, separators=(',', ':')),
+            details.get('to_tank')
+        )
+
+    @staticmethod
+    def _transaction_record(row: sqlite3.Row) -> Dict:
+        return {
+            'id': row['id'],
+            'type': row['type'],
+            'timestamp': row['timestamp'],
+            'details': json.loads(row['details'])
+        }
+
+    def save_transaction(self, transaction: Transaction):
+        """Сохранить транзакцию"""
+        with self.batch():
+            self.conn.execute(SQL_INSERT_TRANSACTION, self._transaction_row(transaction.to_dict()))
+
+    def save_transactions(self, transactions: List[Transaction]):
+        """Сохранить несколько транзакций одной транзакцией базы"""
+        rows = [self._transaction_row(transaction.to_dict()) for transaction in transactions]
+        with self.batch():
+            self.conn.executemany(SQL_INSERT_TRANSACTION, rows)
+
+    def load_transactions(self) -> List[Dict]:
+        """Загрузить историю транзакций"""
+        return list(self.iter_transactions())
+
+    def iter_transactions(self, reverse: bool = False, batch_size: int = 1000) -> Iterator[Dict]:
+        """Потоково прочитать историю транзакций (порциями по batch_size)"""
+        order, compare = ("DESC", "<") if reverse else ("ASC", ">")
+        sql = f"SELECT * FROM transactions WHERE seq {compare} ? ORDER BY seq {order} LIMIT ?"
+        last = 2 ** 63 - 1 if reverse else 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(sql, (last, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._transaction_record(row)
+            last = rows[-1]['seq']
+
+    def load_recent_transactions(self, limit: int) -> List[Dict]:
+        """Загрузить последние транзакции (новые первыми)"""
+        return self.query_transactions(limit=limit)[0]
+
+    def query_transactions(self, trans_type: Optional[str] = None, tank_id: Optional[str] = None,
+                           column: Optional[int] = None, fuel_type: Optional[str] = None,
+                           since: Optional[str] = None, until: Optional[str] = None,
+                           limit: Optional[int] = None,
+                           cursor: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Выборка транзакций по индексам (новые первыми) и курсор следующей страницы
+
+        since/until - границы времени в формате ISO (until не включается).
+        cursor - значение, возвращённое предыдущей выборкой (None - с начала).
+        """
+        conditions, params = [], []
+        for field, value in (('type', trans_type), ('column_no', column), ('fuel_type', fuel_type)):
+            if value is not None:
+                conditions.append(f"{field} = ?")
+                params.append(value)
+        if cursor is not None:
+            conditions.append("seq < ?")
+            params.append(cursor)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        order = " ORDER BY seq DESC"
+        if limit is not None:
+            order += " LIMIT ?"
+        if tank_id is None:
+            sql = "SELECT * FROM transactions"
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            sql += order
+        else:
+            # Перекачка относится и к цистерне-приёмнику. Две выборки вместо OR:
+            # каждая идёт по своему индексу и останавливается на limit
+            where = "".join(f" AND {condition}" for condition in conditions)
+            sql = (f"SELECT * FROM (SELECT * FROM transactions WHERE tank_id = ?{where}{order})"
+                   f" UNION ALL SELECT * FROM (SELECT * FROM transactions"
+                   f" WHERE to_tank = ? AND tank_id IS NOT ?{where}{order}){order}")
+            branch = params + ([limit] if limit is not None else [])
+            params = [tank_id] + branch + [tank_id, tank_id] + branch
+        if limit is not None:
+            params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        next_cursor = rows[-1]['seq'] if limit is not None and rows and len(rows) >= limit else None
+        return [self._transaction_record(row) for row in rows], next_cursor
+
+    # --- Статистика ---
+
+    def save_statistics(self, stats: Statistics):
+        """Сохранить статистику"""
+        with self.batch():
+            self.conn.execute(SQL_UPSERT_STATS, (stats.total_cars, stats.total_income))
+            self.conn.executemany(SQL_UPSERT_FUEL_STATS, [
+                (fuel_type, values['liters'], values['income'])
+                for fuel_type, values in stats.fuel_stats.items()
+            ])
+
+    def load_statistics(self) -> Statistics:
+        """Загрузить статистику"""
+        with self._lock:
+            totals = self.conn.execute("SELECT total_cars, total_income FROM statistics").fetchone()
+            fuel_rows = self.conn.execute("SELECT * FROM fuel_stats").fetchall()
+        if totals is None:
+            # Начальная статистика
+            return Statistics(
+                total_cars=0,
+                total_income=0.0,
+                fuel_stats={
+                    fuel_type: {'liters': 0.0, 'income': 0.0}
+                    for fuel_type in ["АИ-92", "АИ-95", "АИ-98", "ДТ"]
+                }
+            )
+        return Statistics(
+            total_cars=totals['total_cars'],
+            total_income=totals['total_income'],
+            fuel_stats={
+                row['fuel_type']: {'liters': row['liters'], 'income': row['income']}
+                for row in fuel_rows
+            }
+        )
+
+    # --- Статистика по интервалам ---
+
+    def save_rollups(self, rollups: Dict, periods=None):
+        """Сохранить статистику по интервалам
+
+        periods - изменённые интервалы (гранулярность, интервал); без него
+        таблица переписывается целиком.
+        """
+        if periods is None:
+            rows = [
+                (granularity, period, json.dumps(bucket, ensure_ascii=False))
+                for granularity, buckets in rollups.items()
+                for period, bucket in buckets.items()
+            ]
+            with self.batch():
+                self.conn.execute("DELETE FROM rollups")
+                self.conn.executemany(SQL_UPSERT_ROLLUP, rows)
+                # Отметка, что корзины уже есть (иначе при запуске их строят по истории)
+                self.conn.execute(SQL_UPSERT_STATE, ('rollups', 'true'))
+            return
+        with self.batch():
+            for granularity, period in periods:
+                bucket = rollups.get(granularity, {}).get(period)
+                if bucket is None:
+                    self.conn.execute(SQL_DELETE_ROLLUP, (granularity, period))
+                else:
+                    self.conn.execute(SQL_UPSERT_ROLLUP,
+                                      (granularity, period, json.dumps(bucket, ensure_ascii=False)))
+
+    def load_rollups(self) -> Optional[Dict]:
+        """Загрузить статистику по интервалам (None - ещё не сохранялась)"""
+        with self._lock:
+            saved = self.conn.execute("SELECT value FROM state WHERE key = 'rollups'").fetchone()
+            rows = self.conn.execute("SELECT granularity, period, bucket FROM rollups").fetchall()
+        if saved is None:
+            return None
+        rollups: Dict[str, Dict] = {}
+        for row in rows:
+            rollups.setdefault(row['granularity'], {})[row['period']] = json.loads(row['bucket'])
+        return rollups
+
+    # --- Аварийный режим ---
+
+    def save_emergency_state(self, is_emergency: bool):
+        """Сохранить состояние аварийного режима"""
+        with self.batch():
+            self.conn.execute(SQL_UPSERT_STATE, ('is_emergency', json.dumps(is_emergency)))
+
+    def load_emergency_state(self) -> bool:
+        """Загрузить состояние аварийного режима"""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM state WHERE key = 'is_emergency'").fetchone()
+        return json.loads(row['value']) if row else False
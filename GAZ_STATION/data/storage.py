@@ -3,22 +3,75 @@
 """
 import json
 import os
-from typing import Dict, List, Any
-from datetime import datetime
+import time
+from contextlib import nullcontext
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple, Any
+from datetime import datetime, timedelta
 from .models import Tank, Transaction, Statistics
+from .journal import TransactionJournal
+from .binlog import BinaryTransactionLog
+from .history_index import HistoryIndex
+from .segments import PERIODS, SegmentArchive, seal_cutoff, tiered_query
+
+# Форматы журнала транзакций: имя файла и класс журнала
+LOG_FORMATS = {
+    'jsonl': ('transactions.jsonl', TransactionJournal),
+    'binary': ('transactions.bin', BinaryTransactionLog),
+}
+
+# Статистика по интервалам хранится в rollups/ файлами-кусками: часовые
+# корзины одного дня, дневные одного месяца, месячные одного года.
+# Длина префикса интервала, по которому корзины собираются в кусок:
+ROLLUP_CHUNKS = {'hour': 10, 'day': 7, 'month': 4}
+ROLLUPS_DIR = 'rollups'
 
 class DataStorage:
     """Класс для работы с файловым хранилищем"""
     
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", log_format: str = "jsonl", metrics=None):
         self.data_dir = data_dir
+        self.metrics = metrics  # None - без замеров
         self._ensure_data_dir()
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"Неизвестный формат журнала: {log_format}")
+        self.log_format = log_format
+        self.journal = self._open_journal(log_format)
+        self._migrate_legacy_transactions()
+        self.history = HistoryIndex(self.journal, self.journal.filepath + '.idx')
+        # Холодный уровень истории: сжатые сегменты, запечатанные compact()
+        self.archive = SegmentArchive(os.path.join(data_dir, 'archive'))
     
     def _ensure_data_dir(self):
         """Создать директорию для данных если её нет"""
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
     
+    def _open_journal(self, log_format: str):
+        filename, journal_class = LOG_FORMATS[log_format]
+        return journal_class(os.path.join(self.data_dir, filename))
+    
+    def _migrate_legacy_transactions(self):
+        """Перенести историю в журнал из журнала другого формата или старого transactions.json"""
+        if self.journal.exists():
+            return
+        for log_format in LOG_FORMATS:
+            if log_format == self.log_format:
+                continue
+            other = self._open_journal(log_format)
+            if other.exists():
+                batch = []
+                for record in other.read():
+                    batch.append(record)
+                    if len(batch) >= 10000:
+                        self.journal.append_many(batch)
+                        batch = []
+                self.journal.append_many(batch)
+                return
+        legacy = self._load_json('transactions.json')
+        if legacy:
+            self.journal.append_many(legacy)
+    
     def save_tanks(self, tanks: List[Tank]):
         """Сохранить состояние цистерн"""
         data = [tank.to_dict() for tank in tanks]
@@ -36,14 +89,113 @@ class DataStorage:
         return tanks
     
     def save_transaction(self, transaction: Transaction):
-        """Сохранить транзакцию"""
-        transactions = self.load_transactions()
-        transactions.append(transaction.to_dict())
-        self._save_json('transactions.json', transactions[-100:])  # Храним последние 100
+        """Сохранить транзакцию (дозапись в журнал)"""
+        self.save_transactions([transaction])
+    
+    def save_transactions(self, transactions: List[Transaction]):
+        """Сохранить несколько транзакций одной дозаписью в журнал"""
+        records = [transaction.to_dict() for transaction in transactions]
+        if self.metrics is None:
+            self.journal.append_many(records)
+            return
+        started = time.perf_counter()
+        written = self.journal.append_many(records)
+        filename = os.path.basename(self.journal.filepath)
+        self.metrics.observe('azs_file_write_seconds', time.perf_counter() - started, file=filename)
+        self.metrics.inc('azs_file_writes_total', file=filename)
+        self.metrics.inc('azs_file_write_bytes_total', written, file=filename)
     
     def load_transactions(self) -> List[Dict]:
         """Загрузить историю транзакций"""
-        return self._load_json('transactions.json') or []
+        return list(self.iter_transactions())
+    
+    def iter_transactions(self, reverse: bool = False) -> Iterator[Dict]:
+        """Потоково прочитать историю транзакций (архив и журнал)"""
+        if reverse:
+            return chain(self.journal.read_reversed(), self.archive.read_reversed())
+        return chain(self.archive.read(), self.journal.read())
+    
+    def load_recent_transactions(self, limit: int) -> List[Dict]:
+        """Загрузить последние транзакции (новые первыми)"""
+        recent = self.journal.tail(limit)
+        if len(recent) < limit:
+            recent += self.archive.tail(limit - len(recent))
+        return recent
+    
+    def query_transactions(self, trans_type: Optional[str] = None, tank_id: Optional[str] = None,
+                           column: Optional[int] = None, fuel_type: Optional[str] = None,
+                           since: Optional[str] = None, until: Optional[str] = None,
+                           limit: Optional[int] = None,
+                           cursor: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Выборка транзакций (новые первыми) и курсор следующей страницы
+        
+        Сначала выбираются записи журнала по индексу истории, затем - записи
+        архива; сегменты архива без подходящих записей не распаковываются.
+        """
+        filters = {'trans_type': trans_type, 'tank_id': tank_id, 'column': column, 'fuel_type': fuel_type}
+        return tiered_query(
+            lambda hot_cursor: self.history.query(trans_type, tank_id, column, fuel_type,
+                                                  since, until, limit, hot_cursor),
+            self.archive, filters, since, until, limit, cursor)
+    
+    def compact(self, hot_days: int, cold_days: Optional[int] = None, period: str = 'month',
+                codec: str = 'gzip', now: Optional[datetime] = None) -> Dict:
+        """Перенести старую историю из журнала в архив и удалить устаревшие сегменты
+        
+        Записи старше hot_days дней (целыми периодами period) запечатываются
+        в сегменты архива, журнал переписывается без них. Сегменты, все записи
+        которых старше cold_days дней, удаляются (None - архив хранится всегда).
+        Журнал подменяется, поэтому станция в это время не должна работать
+        с этой директорией данных.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Неизвестный период сегментов: {period}")
+        now = now or datetime.now()
+        cutoff = seal_cutoff(now, hot_days, period)
+        width = PERIODS[period]
+        
+        def is_cold(record: Dict) -> bool:
+            timestamp = record.get('timestamp') or ''
+            return len(timestamp) >= width and timestamp < cutoff
+        
+        sealed = self.archive.seal((record for record in self.journal.read() if is_cold(record)),
+                                   period, codec)
+        moved = 0
+        if sealed:
+            # Сегменты уже записаны: если работа прервётся здесь, повторный запуск их не задвоит
+            moved = self._rewrite_journal(lambda record: not is_cold(record))
+        expired = []
+        if cold_days is not None:
+            expired = self.archive.expire((now - timedelta(days=cold_days)).isoformat())
+        return {'sealed': moved, 'segments': sorted(sealed), 'expired': expired}
+    
+    def _rewrite_journal(self, keep) -> int:
+        """Переписать журнал, оставив записи, для которых keep истинно; вернуть число удалённых"""
+        removed = 0
+        filename, journal_class = LOG_FORMATS[self.log_format]
+        tmp_path = self.journal.filepath + '.tmp'
+        open(tmp_path, 'wb').close()
+        rewritten = journal_class(tmp_path)
+        batch = []
+        for record in self.journal.read():
+            if not keep(record):
+                removed += 1
+                continue
+            batch.append(record)
+            if len(batch) >= 10000:
+                rewritten.append_many(batch)
+                batch = []
+        rewritten.append_many(batch)
+        rewritten.close()
+        self.journal.close()
+        os.replace(tmp_path, self.journal.filepath)
+        # Позиции записей изменились - индекс истории строится заново
+        index_path = self.journal.filepath + '.idx'
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        self.journal = self._open_journal(self.log_format)
+        self.history = HistoryIndex(self.journal, index_path)
+        return removed
     
     def save_statistics(self, stats: Statistics):
         """Сохранить статистику"""
@@ -69,6 +221,59 @@ class DataStorage:
                 }
             )
     
+    def save_rollups(self, rollups: Dict, periods=None):
+        """Сохранить статистику по интервалам
+
+        periods - изменённые интервалы (гранулярность, интервал): переписываются
+        только содержащие их куски. None - переписать всё и удалить лишние куски.
+        """
+        directory = os.path.join(self.data_dir, ROLLUPS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        if periods is None:
+            chunks = {
+                (granularity, period[:ROLLUP_CHUNKS[granularity]])
+                for granularity, buckets in rollups.items() if granularity in ROLLUP_CHUNKS
+                for period in buckets
+            }
+            for name in os.listdir(directory):
+                if not name.endswith('.json'):
+                    continue
+                granularity, _, chunk = name[:-len('.json')].partition('-')
+                if (granularity, chunk) not in chunks:
+                    os.remove(os.path.join(directory, name))
+        else:
+            chunks = {(granularity, period[:ROLLUP_CHUNKS[granularity]]) for granularity, period in periods}
+        for granularity, chunk in sorted(chunks):
+            buckets = {
+                period: bucket for period, bucket in rollups.get(granularity, {}).items()
+                if period.startswith(chunk)
+            }
+            filename = os.path.join(ROLLUPS_DIR, f"{granularity}-{chunk}.json")
+            if buckets:
+                self._save_json(filename, buckets, indent=None, label=ROLLUPS_DIR)
+            elif os.path.exists(os.path.join(self.data_dir, filename)):
+                os.remove(os.path.join(self.data_dir, filename))
+    
+    def load_rollups(self) -> Optional[Dict]:
+        """Загрузить статистику по интервалам (None - ещё не сохранялась)"""
+        directory = os.path.join(self.data_dir, ROLLUPS_DIR)
+        if not os.path.isdir(directory):
+            # Старый формат: всё в одном rollups.json - переложить по кускам
+            legacy = self._load_json('rollups.json')
+            if legacy is not None:
+                self.save_rollups(legacy)
+                os.remove(os.path.join(self.data_dir, 'rollups.json'))
+            return legacy
+        rollups: Dict[str, Dict] = {}
+        for name in sorted(os.listdir(directory)):
+            granularity = name.partition('-')[0]
+            if not name.endswith('.json') or granularity not in ROLLUP_CHUNKS:
+                continue
+            buckets = self._load_json(os.path.join(ROLLUPS_DIR, name), label=ROLLUPS_DIR)
+            if buckets:
+                rollups.setdefault(granularity, {}).update(buckets)
+        return rollups
+    
     def save_emergency_state(self, is_emergency: bool):
         """Сохранить состояние аварийного режима"""
         self._save_json('emergency_state.json', {'is_emergency': is_emergency})
@@ -78,19 +283,67 @@ class DataStorage:
         data = self._load_json('emergency_state.json')
         return data.get('is_emergency', False) if data else False
     
-    def _save_json(self, filename: str, data: Any):
-        """Сохранить данные в JSON файл"""
+    def batch(self):
+        """Группа сохранений (файлы всё равно пишутся по отдельности)"""
+        return nullcontext()
+    
+    def close(self):
+        """Закрыть открытые файлы журналов и сохранить индекс истории"""
+        self.history.save()
+        self.journal.close()
+    
+    def _save_json(self, filename: str, data: Any, indent: Optional[int] = 2,
+                   label: Optional[str] = None):
+        """Сохранить данные в JSON файл (label - имя файла в метриках)"""
         filepath = os.path.join(self.data_dir, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        label = label or filename
+        # Пишем во временный файл и подменяем - файл не останется недописанным
+        tmp_path = filepath + '.tmp'
+        started = time.perf_counter()
+        if indent is None:
+            text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        else:
+            text = json.dumps(data, ensure_ascii=False, indent=indent)
+        encoded = time.perf_counter()
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, filepath)
+        if self.metrics is not None:
+            self.metrics.observe('azs_json_encode_seconds', encoded - started, file=label)
+            self.metrics.observe('azs_file_write_seconds', time.perf_counter() - encoded, file=label)
+            self.metrics.inc('azs_file_writes_total', file=label)
+            self.metrics.inc('azs_file_write_bytes_total', len(text.encode('utf-8')), file=label)
     
-    def _load_json(self, filename: str) -> Any:
+    def _load_json(self, filename: str, label: Optional[str] = None) -> Any:
         """Загрузить данные из JSON файла"""
         filepath = os.path.join(self.data_dir, filename)
+        label = label or filename
         if os.path.exists(filepath):
             try:
+                started = time.perf_counter()
                 with open(filepath, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    text = f.read()
+                read = time.perf_counter()
+                data = json.loads(text)
+                if self.metrics is not None:
+                    self.metrics.observe('azs_file_read_seconds', read - started, file=label)
+                    self.metrics.observe('azs_json_decode_seconds', time.perf_counter() - read, file=label)
+                    self.metrics.inc('azs_file_reads_total', file=label)
+                return data
             except:
                 return None
-        return None
\ No newline at end of file
+        return None
+
+
+def create_storage(data_dir: str = "data", backend: str = "json", log_format: str = "jsonl", metrics=None):
+    """Создать хранилище по названию: "json" - файлы JSON, "sqlite" - база SQLite
+
+    log_format - формат журнала транзакций для "json": "jsonl" или "binary".
+    metrics - сборщик метрик (None - без замеров).
+    """
+    if backend == 'json':
+        return DataStorage(data_dir, log_format, metrics)
+    if backend == 'sqlite':
+        from .sqlite_storage import SQLiteStorage
+        return SQLiteStorage(data_dir, metrics=metrics)
+    raise ValueError(f"Неизвестное хранилище: {backend}")
@@ -2,21 +2,209 @@
 """
 Главный файл системы управления АЗС
 """
+import argparse
+import json
 import sys
 import os
 
 # Добавляем текущую директорию в путь для импорта
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from ui.menu import AZSMenu
+def parse_args():
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Система управления АЗС")
+    parser.add_argument('--fleet-report', metavar='DIR',
+                        help="сводный отчёт по директориям данных станций внутри DIR")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="число процессов для сводного отчёта (по умолчанию - по числу ядер)")
+    parser.add_argument('--json', metavar='FILE',
+                        help="сохранить сводный отчёт, итоги моделирования, воспроизведения или план поставок в JSON-файл")
+    parser.add_argument('--export', metavar='DIR',
+                        help="выгрузить историю транзакций в DIR (CSV и/или колоночный формат)")
+    parser.add_argument('--export-format', choices=['csv', 'columnar', 'all'], default='all',
+                        help="формат выгрузки истории")
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help="транзакций в порции при выгрузке истории")
+    parser.add_argument('--simulate', nargs='?', const='', metavar='SCENARIOS',
+                        help="моделирование пропускной способности (сценарии - JSON-список, по умолчанию - config)")
+    parser.add_argument('--runs', type=int, default=200, help="прогонов на сценарий при моделировании")
+    parser.add_argument('--days', type=int, default=30, help="дней в одном прогоне моделирования")
+    parser.add_argument('--seed', type=int, default=None, help="зерно генератора случайных чисел")
+    parser.add_argument('--replay', nargs='?', const='', metavar='VARIANTS',
+                        help="воспроизвести историю на других ценах и цистернах (варианты - JSON-список)")
+    parser.add_argument('--forecast', action='store_true',
+                        help="прогноз расхода по цистернам и план поставок (по истории продаж)")
+    parser.add_argument('--horizon', type=int, default=168, help="горизонт прогноза, часов")
+    parser.add_argument('--script', metavar='FILE',
+                        help="выполнить команды из файла без диалога ('-' - из stdin), результаты - JSON-строки")
+    parser.add_argument('--compact', action='store_true',
+                        help="перенести старую историю в сжатый архив и удалить устаревшие сегменты (станция должна быть остановлена)")
+    parser.add_argument('--data-dir', default='data', help="директория данных станции")
+    return parser.parse_args()
+
+def fleet_report(args):
+    """Сводный отчёт по сети АЗС"""
+    from reports.fleet import build_fleet_report, format_report
+    
+    report = build_fleet_report(args.fleet_report, args.workers)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+def export_history(args):
+    """Выгрузка истории транзакций"""
+    import config
+    from data.storage import create_storage
+    from reports.export import EXPORTERS, export_history as export
+    
+    formats = list(EXPORTERS) if args.export_format == 'all' else [args.export_format]
+    storage = create_storage(args.data_dir, config.STORAGE_BACKEND, config.TRANSACTION_LOG_FORMAT)
+    try:
+        summary = export(storage.iter_transactions(), args.export, formats, args.chunk_size)
+    finally:
+        storage.close()
+    for name, tables in summary.items():
+        rows = ", ".join(f"{table}: {info['rows']}" for table, info in sorted(tables.items()))
+        print(f"{name}: {rows or 'история пуста'}")
+
+def simulate_capacity(args):
+    """Моделирование пропускной способности станции"""
+    from planning.capacity import Scenario, format_results, simulate
+    
+    if args.simulate:
+        with open(args.simulate, 'r', encoding='utf-8') as f:
+            scenarios = [Scenario.from_dict(data) for data in json.load(f)]
+    else:
+        scenarios = [Scenario()]
+    try:
+        results = simulate(scenarios, args.runs, args.days, args.seed)
+    except RuntimeError as e:
+        print(e)
+        return
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+def replay_history(args):
+    """Воспроизведение истории транзакций на других конфигурациях"""
+    import config
+    from data.storage import create_storage
+    from planning.replay import Variant, format_results, replay
+    
+    variants = []
+    if args.replay:
+        with open(args.replay, 'r', encoding='utf-8') as f:
+            variants = [Variant.from_dict(data) for data in json.load(f)]
+    storage = create_storage(args.data_dir, config.STORAGE_BACKEND, config.TRANSACTION_LOG_FORMAT)
+    try:
+        results = replay(storage.iter_transactions(), variants)
+    except RuntimeError as e:
+        print(e)
+        return
+    finally:
+        storage.close()
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+def forecast_deliveries(args):
+    """Прогноз расхода топлива и план поставок"""
+    import config
+    from data.storage import create_storage
+    from data.models import Tank
+    from planning.forecast import build_delivery_plan, format_plan
+    
+    storage = create_storage(args.data_dir, config.STORAGE_BACKEND, config.TRANSACTION_LOG_FORMAT)
+    try:
+        tanks = storage.load_tanks() or [Tank.from_dict(tank) for tank in config.INITIAL_TANKS]
+        plan = build_delivery_plan(storage.iter_transactions(), tanks, horizon=args.horizon)
+    except RuntimeError as e:
+        print(e)
+        return
+    finally:
+        storage.close()
+    print(format_plan(plan))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+
+def compact_history(args):
+    """Перенос старой истории транзакций в архив"""
+    import config
+    from data.storage import create_storage
+    
+    if config.STORAGE_BACKEND != 'json':
+        print("Архив истории поддерживается только хранилищем json")
+        return
+    storage = create_storage(args.data_dir, config.STORAGE_BACKEND, config.TRANSACTION_LOG_FORMAT)
+    try:
+        summary = storage.compact(config.HISTORY_HOT_DAYS, config.HISTORY_COLD_RETENTION_DAYS,
+                                  config.HISTORY_SEGMENT_PERIOD, config.HISTORY_COMPRESSION)
+    finally:
+        storage.close()
+    print(f"Перенесено в архив: {summary['sealed']} транзакций")
+    if summary['segments']:
+        print(f"Сегменты: {', '.join(summary['segments'])}")
+    if summary['expired']:
+        print(f"Удалены устаревшие сегменты: {', '.join(summary['expired'])}")
+
+def run_script(args):
+    """Пакетное выполнение команд из файла или stdin"""
+    from core.azs_core import AZSCore
+    from ui.script import ScriptRunner
+    
+    # Состояние пишется в фоне раз в интервал и при закрытии, а не после каждой команды
+    azs = AZSCore(args.data_dir, flush_policy='interval')
+    source = sys.stdin if args.script == '-' else open(args.script, 'r', encoding='utf-8')
+    try:
+        summary = ScriptRunner(azs, sys.stdout).run(source)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        azs.close()
+    print(f"Команд: {summary['executed']}, с ошибкой: {summary['failed']}", file=sys.stderr)
+    if summary['failed']:
+        sys.exit(1)
 
 def main():
     """Главная функция программы"""
+    args = parse_args()
+    if args.fleet_report:
+        fleet_report(args)
+        return
+    if args.export:
+        export_history(args)
+        return
+    if args.simulate is not None:
+        simulate_capacity(args)
+        return
+    if args.replay is not None:
+        replay_history(args)
+        return
+    if args.forecast:
+        forecast_deliveries(args)
+        return
+    if args.compact:
+        compact_history(args)
+        return
+    if args.script:
+        run_script(args)
+        return
+    
     print("Загрузка системы управления АЗС...")
     
+    # Меню (и через него ядро АЗС) импортируется только для диалогового режима
+    from ui.menu import AZSMenu
+    
     try:
         menu = AZSMenu()
-        menu.run()
+        try:
+            menu.run()
+        finally:
+            menu.azs.close()
         
         print("Система завершена. Данные сохранены.")
     except KeyboardInterrupt:
@@ -0,0 +1,153 @@
+"""
+Клиент сетевого сервиса АЗС (для кассовых терминалов)
+"""
+import asyncio
+import itertools
+import json
+from typing import Any, Dict, List, Optional
+
+from net.server import MAX_LINE, METHODS
+
+
+class RemoteError(Exception):
+    """Ошибка, которую вернул сервер"""
+
+
+class AZSClient:
+    """Одно долгоживущее соединение с конвейерной отправкой запросов
+
+    call() можно вызывать из многих задач одновременно: запросы уходят сразу,
+    а ответы сопоставляются по id.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765):
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._reader_task: Optional[asyncio.Task] = None
+
+    @property
+    def in_flight(self) -> int:
+        """Сколько запросов ждут ответа"""
+        return len(self._pending)
+
+    async def connect(self):
+        """Открыть соединение"""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, limit=MAX_LINE)
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    async def close(self):
+        """Закрыть соединение"""
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        if self._reader_task is not None:
+            await self._reader_task
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _read_responses(self):
+        """Разбор ответов сервера"""
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if 'error' in response:
+                    future.set_exception(RemoteError(response['error']))
+                else:
+                    future.set_result(response.get('result'))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Соединение с сервером закрыто"))
+            self._pending.clear()
+
+    async def call(self, method: str, **params) -> Any:
+        """Вызвать метод сервиса и дождаться результата"""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        request = {'id': request_id, 'method': method, 'params': params}
+        self._writer.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def serve_customer(self, column: int, fuel_type: str, liters: float) -> List:
+        return await self.call('serve_customer', column=column, fuel_type=fuel_type, liters=liters)
+
+    async def serve_customers_batch(self, sales: List) -> List:
+        return await self.call('serve_customers_batch', sales=sales)
+
+    async def refuel_tank(self, tank_id: str, liters: float) -> List:
+        return await self.call('refuel_tank', tank_id=tank_id, liters=liters)
+
+    async def transfer_fuel(self, from_tank_id: str, to_tank_id: str, liters: float) -> List:
+        return await self.call('transfer_fuel', from_tank_id=from_tank_id, to_tank_id=to_tank_id, liters=liters)
+
+    async def get_column_status(self, column: int) -> Dict:
+        return await self.call('get_column_status', column=column)
+
+    async def get_changed_columns(self, since_version: int = 0) -> List:
+        """[изменившиеся колонки, текущая версия]"""
+        return await self.call('get_changed_columns', since_version=since_version)
+
+    async def get_recent_transactions(self, limit: int = 10) -> List[Dict]:
+        return await self.call('get_recent_transactions', limit=limit)
+
+    async def get_metrics(self) -> Dict:
+        return await self.call('get_metrics')
+
+    async def query_transactions(self, limit: int = 50, cursor: Optional[int] = None, **filters) -> List:
+        """filters: trans_type, column, tank_id, fuel_type, since, until; результат - [транзакции, курсор]"""
+        return await self.call('query_transactions', limit=limit, cursor=cursor, **filters)
+
+
+class AZSClientPool:
+    """Пул соединений: каждый вызов уходит в наименее загруженное соединение"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, size: int = 4):
+        self.clients = [AZSClient(host, port) for _ in range(size)]
+
+    async def connect(self):
+        await asyncio.gather(*(client.connect() for client in self.clients))
+
+    async def close(self):
+        await asyncio.gather(*(client.close() for client in self.clients))
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _pick(self) -> AZSClient:
+        return min(self.clients, key=lambda client: client.in_flight)
+
+    async def call(self, method: str, **params) -> Any:
+        """Вызвать метод сервиса через наименее загруженное соединение"""
+        return await self._pick().call(method, **params)
+
+    def __getattr__(self, name: str):
+        # serve_customer, refuel_tank и т.д. - через наименее загруженное соединение
+        if name not in METHODS or not hasattr(AZSClient, name):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: getattr(self._pick(), name)(*args, **kwargs)
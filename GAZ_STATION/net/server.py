@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Сетевой сервис АЗС для кассовых терминалов
+
+Протокол: TCP, одна JSON-строка на запрос и на ответ.
+  запрос: {"id": 1, "method": "serve_customer", "params": {"column": 1, ...}}
+  ответ:  {"id": 1, "result": ...} или {"id": 1, "error": "..."}
+Соединения долгоживущие, клиент может отправлять запросы не дожидаясь
+ответов (конвейер); ответы одного соединения приходят в порядке запросов.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from core.azs_core import AZSCore
+
+MAX_LINE = 1024 * 1024
+
+
+def _liters(value) -> float:
+    """Количество литров из запроса: конечное положительное число"""
+    liters = float(value)
+    if not (math.isfinite(liters) and liters > 0):
+        raise ValueError(f"количество должно быть положительным числом, получено {value!r}")
+    return liters
+
+
+def _call_serve_customer(azs: AZSCore, params: Dict) -> Any:
+    return azs.serve_customer(int(params['column']), params['fuel_type'], _liters(params['liters']))
+
+
+def _call_serve_customers_batch(azs: AZSCore, params: Dict) -> Any:
+    sales = [(int(column), fuel_type, _liters(liters)) for column, fuel_type, liters in params['sales']]
+    return azs.serve_customers_batch(sales)
+
+
+def _call_refuel_tank(azs: AZSCore, params: Dict) -> Any:
+    return azs.refuel_tank(params['tank_id'], _liters(params['liters']))
+
+
+def _call_transfer_fuel(azs: AZSCore, params: Dict) -> Any:
+    return azs.transfer_fuel(params['from_tank_id'], params['to_tank_id'], _liters(params['liters']))
+
+
+def _call_get_column_status(azs: AZSCore, params: Dict) -> Any:
+    return azs.get_column_status(int(params['column']))
+
+
+def _call_get_changed_columns(azs: AZSCore, params: Dict) -> Any:
+    return azs.get_changed_columns(int(params.get('since_version', 0)))
+
+
+def _call_get_recent_transactions(azs: AZSCore, params: Dict) -> Any:
+    return azs.get_recent_transactions(int(params.get('limit', 10)))
+
+
+def _call_query_transactions(azs: AZSCore, params: Dict) -> Any:
+    column = params.get('column')
+    cursor = params.get('cursor')
+    return azs.query_transactions(
+        trans_type=params.get('trans_type'),
+        column=int(column) if column is not None else None,
+        tank_id=params.get('tank_id'),
+        fuel_type=params.get('fuel_type'),
+        since=params.get('since'),
+        until=params.get('until'),
+        limit=int(params.get('limit', 50)),
+        cursor=int(cursor) if cursor is not None else None
+    )
+
+
+def _call_get_metrics(azs: AZSCore, params: Dict) -> Any:
+    return azs.get_metrics()
+
+
+def _call_ping(azs: AZSCore, params: Dict) -> Any:
+    return 'pong'
+
+
+# Методы, доступные по сети
+METHODS = {
+    'serve_customer': _call_serve_customer,
+    'serve_customers_batch': _call_serve_customers_batch,
+    'refuel_tank': _call_refuel_tank,
+    'transfer_fuel': _call_transfer_fuel,
+    'get_column_status': _call_get_column_status,
+    'get_changed_columns': _call_get_changed_columns,
+    'get_recent_transactions': _call_get_recent_transactions,
+    'query_transactions': _call_query_transactions,
+    'get_metrics': _call_get_metrics,
+    'ping': _call_ping,
+}
+
+
+class AZSServer:
+    """asyncio-сервер поверх AZSCore
+
+    workers=0 - методы AZSCore выполняются прямо в цикле событий (без
+    переключения потоков, минимальная задержка). workers>0 - в пуле потоков;
+    тогда AZSCore должен быть создан с concurrent=True.
+    """
+
+    def __init__(self, azs: AZSCore, host: str = '127.0.0.1', port: int = 8765, workers: int = 0):
+        self.azs = azs
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='azs-worker') if workers else None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.requests_served = 0
+
+    async def start(self):
+        """Начать принимать соединения"""
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_LINE)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """Работать до отмены"""
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        """Закрыть сервер и дождаться завершения"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    async def _execute(self, method: str, params: Dict) -> Any:
+        """Выполнить метод AZSCore"""
+        handler = METHODS[method]
+        if self.executor is None:
+            return handler(self.azs, params)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, handler, self.azs, params)
+
+    async def _process(self, line: bytes) -> Dict:
+        """Обработать одну строку запроса"""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {'id': None, 'error': "Некорректный JSON"}
+        if not isinstance(request, dict):
+            return {'id': None, 'error': "Запрос должен быть JSON-объектом"}
+        request_id = request.get('id')
+        method = request.get('method')
+        if not isinstance(method, str) or method not in METHODS:
+            return {'id': request_id, 'error': f"Неизвестный метод: {method}"}
+        params = request.get('params') or {}
+        if not isinstance(params, dict):
+            return {'id': request_id, 'error': "Некорректные параметры: params должен быть JSON-объектом"}
+        try:
+            result = await self._execute(method, params)
+        except (KeyError, TypeError, ValueError) as e:
+            return {'id': request_id, 'error': f"Некорректные параметры: {e}"}
+        except Exception as e:
+            # Ошибка ядра (например, записи на диск) - ответ с ошибкой, соединение живёт дальше
+            traceback.print_exc()
+            return {'id': request_id, 'error': f"Внутренняя ошибка: {e}"}
+        self.requests_served += 1
+        return {'id': request_id, 'result': result}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обслуживание одного терминала: запросы по очереди, ответы в том же порядке"""
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial  # последняя строка без перевода строки
+                except asyncio.LimitOverrunError:
+                    # Строка длиннее MAX_LINE: отвечаем ошибкой и пропускаем её до конца
+                    response = {'id': None, 'error': f"Запрос длиннее {MAX_LINE} байт"}
+                    writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                    await writer.drain()
+                    await self._skip_line(reader)
+                    continue
+                if not line:
+                    break
+                response = await self._process(line)
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _skip_line(reader: asyncio.StreamReader):
+        """Отбросить данные до конца текущей строки, не держа её в памяти целиком"""
+        while True:
+            try:
+                await reader.readuntil(b'\n')
+                return
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+
+
+async def run_server(args):
+    azs = AZSCore(args.data_dir, persistence=args.persistence, flush_policy=args.policy,
+                  concurrent=args.workers > 0)
+    server = AZSServer(azs, args.host, args.port, args.workers)
+    await server.start()
+    print(f"Сервис АЗС слушает {args.host}:{server.port}")
+    dashboard = None
+    if args.dashboard:
+        from ui.dashboard import Dashboard
+        stop = threading.Event()
+        dashboard = threading.Thread(target=Dashboard(azs, config.DASHBOARD_REFRESH).run, kwargs={'stop': stop},
+                                     name='azs-dashboard', daemon=True)
+        dashboard.start()
+    try:
+        await server.serve_forever()
+    finally:
+        if dashboard is not None:
+            stop.set()
+            dashboard.join()
+        await server.stop()
+        azs.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сетевой сервис АЗС для кассовых терминалов")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--persistence', choices=['full', 'wal'], default=None)
+    parser.add_argument('--policy', choices=['immediate', 'interval', 'count'], default=None)
+    parser.add_argument('--workers', type=int, default=0,
+                        help="потоков для операций (0 - выполнять в цикле событий)")
+    parser.add_argument('--dashboard', action='store_true', help="показывать живую панель состояния")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_server(args))
+    except KeyboardInterrupt:
+        print("\nСервис остановлен")
+
+
+if __name__ == "__main__":
+    main()
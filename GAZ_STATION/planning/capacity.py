@@ -0,0 +1,435 @@
+"""
+Моделирование пропускной способности АЗС методом Монте-Карло
+
+Сценарий - планировка станции (колонки, цистерны, цены) и модель спроса:
+поток клиентов по часам суток, доли видов топлива, распределение объёма
+заправки, время обслуживания и поставки топлива. Моделирование ведётся
+сразу по всем прогонам всех сценариев: каждая строка массивов numpy -
+один прогон станции на заданное число дней, а случайные величины (приходы,
+топливо, литры, время обслуживания) разыгрываются пачками на час вперёд
+для всех строк. Python-цикл идёт только по номеру клиента внутри часа.
+
+Правила как у AZSCore: колонка отпускает топливо из первой включённой
+подключённой цистерны, цистерна отключается при падении ниже min_level и
+после пополнения включается вручную (через reenable_delay часов). Клиент
+выбирает колонку с самой короткой очередью и уезжает, если в ней уже
+max_queue машин. Бензовоз заказывается, когда остаток падает ниже
+reorder_level объёма цистерны, и приезжает через lead_time часов.
+
+Результат по сценарию: распределение длины очереди, которую видит
+приехавший клиент (для пуассоновского потока оно совпадает со средним по
+времени), ожидание, вероятность остановки каждой цистерны по минимальному
+уровню и потерянная выручка по причинам, в том числе из-за отключённых цистерн.
+"""
+from dataclasses import dataclass, field, fields
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для моделирования
+    np = None
+
+import config
+
+# Интенсивность потока клиентов по часам суток, машин в час
+DEFAULT_HOURLY_ARRIVALS = [4, 3, 2, 2, 3, 6, 14, 26, 30, 24, 20, 20,
+                           22, 21, 20, 22, 26, 32, 30, 22, 16, 12, 9, 6]
+DEFAULT_FUEL_MIX = {"АИ-92": 0.35, "АИ-95": 0.4, "АИ-98": 0.05, "ДТ": 0.2}
+
+# Допустимый объём одной заправки, л
+MIN_LITERS = 1.0
+MAX_LITERS = 80.0
+
+# Причины потери клиента
+LOSS_REASONS = ('queue', 'disabled', 'insufficient', 'no_fuel')
+WAIT_BINS = 60              # гистограмма ожидания по минутам (последняя корзина - час и дольше)
+BATCH_ROWS = 20000          # прогонов, моделируемых одновременно
+
+
+@dataclass
+class Scenario:
+    """Вариант станции и спроса для моделирования"""
+    name: str = "config"
+    columns: Dict[int, List[str]] = field(default_factory=lambda: dict(config.COLUMNS_CONFIG))
+    tanks: List[Dict] = field(default_factory=lambda: [dict(tank) for tank in config.INITIAL_TANKS])
+    prices: Dict[str, float] = field(default_factory=lambda: dict(config.FUEL_TYPES))
+    hourly_arrivals: List[float] = field(default_factory=lambda: list(DEFAULT_HOURLY_ARRIVALS))
+    fuel_mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_FUEL_MIX))
+    liters_median: float = 30.0     # л, логнормальное распределение
+    liters_sigma: float = 0.45
+    flow_rate: float = 35.0         # скорость налива, л/мин
+    service_overhead: float = 2.0   # среднее время подъезда и оплаты, мин
+    max_queue: int = 4              # машин у колонки, при которых клиент уезжает
+    reorder_level: float = 0.25     # доля объёма цистерны, при которой заказывается бензовоз
+    lead_time: float = config.DELIVERY_LEAD_TIME      # часов от заказа до приезда бензовоза
+    truck_capacity: float = config.DELIVERY_TRUCK_CAPACITY
+    reenable_delay: float = 1.0     # часов до ручного включения цистерны после пополнения
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Scenario':
+        """Сценарий из словаря (например, из JSON); недостающие поля - по config"""
+        known = {item.name for item in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Неизвестные параметры сценария: {', '.join(sorted(unknown))}")
+        data = dict(data)
+        if 'columns' in data:
+            data['columns'] = {int(column): list(fuels) for column, fuels in data['columns'].items()}
+        if 'hourly_arrivals' in data and len(data['hourly_arrivals']) != 24:
+            raise ValueError("hourly_arrivals - 24 значения, по часам суток")
+        if 'max_queue' in data and (int(data['max_queue']) != data['max_queue'] or data['max_queue'] < 1):
+            raise ValueError("max_queue - целое число машин, не меньше 1")
+        if 'flow_rate' in data and not data['flow_rate'] > 0:
+            raise ValueError("flow_rate - скорость налива, должна быть положительной")
+        return cls(**data)
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Для моделирования нужен numpy (pip install numpy)")
+
+
+def _pack(scenarios: Sequence[Scenario], fuels: List[str]) -> Dict:
+    """Параметры сценариев в виде массивов (сценарий - первая ось)"""
+    n = len(scenarios)
+    n_fuels = len(fuels)
+    n_columns = max(len(s.columns) for s in scenarios)
+    n_tanks = max(len(s.tanks) for s in scenarios)
+    fuel_index = {fuel: i for i, fuel in enumerate(fuels)}
+
+    # Цистерны-кандидаты пары (колонка, топливо) в порядке списка цистерн, как в RoutingIndex
+    routes = []
+    for s in scenarios:
+        column_index = {column: i for i, column in enumerate(s.columns)}
+        pairs: Dict = {}
+        for t, tank in enumerate(s.tanks):
+            for column in tank['connected_to']:
+                if column in column_index and tank['fuel_type'] in s.columns[column]:
+                    pairs.setdefault((column_index[column], fuel_index[tank['fuel_type']]), []).append(t)
+        routes.append(pairs)
+    n_candidates = max([len(tanks) for pairs in routes for tanks in pairs.values()] or [1])
+
+    packed = {
+        'candidates': np.full((n, n_columns, n_fuels, n_candidates), -1, dtype=np.int32),
+        'columns': np.zeros((n, n_columns), dtype=bool),
+        'tank_exists': np.zeros((n, n_tanks), dtype=bool),
+        'max_volume': np.zeros((n, n_tanks)),
+        'volume': np.zeros((n, n_tanks)),
+        'min_level': np.zeros((n, n_tanks)),
+        'enabled': np.zeros((n, n_tanks), dtype=bool),
+        'price': np.zeros((n, n_fuels)),
+        'fuel_cum': np.zeros((n, n_fuels)),
+        'arrivals': np.array([s.hourly_arrivals for s in scenarios], dtype=float),
+    }
+    for name in ('liters_median', 'liters_sigma', 'flow_rate', 'service_overhead', 'max_queue',
+                 'reorder_level', 'lead_time', 'truck_capacity', 'reenable_delay'):
+        packed[name] = np.array([getattr(s, name) for s in scenarios], dtype=float)
+
+    for i, (s, pairs) in enumerate(zip(scenarios, routes)):
+        packed['columns'][i, :len(s.columns)] = True
+        for (column, fuel), tanks in pairs.items():
+            packed['candidates'][i, column, fuel, :len(tanks)] = tanks
+        for t, tank in enumerate(s.tanks):
+            packed['tank_exists'][i, t] = True
+            packed['max_volume'][i, t] = tank['max_volume']
+            packed['volume'][i, t] = tank['current_volume']
+            packed['min_level'][i, t] = tank['min_level']
+            packed['enabled'][i, t] = tank['enabled']
+        for fuel, price in s.prices.items():
+            packed['price'][i, fuel_index[fuel]] = price
+        weights = np.array([s.fuel_mix.get(fuel, 0.0) for fuel in fuels])
+        if weights.sum() <= 0:
+            raise ValueError(f"Сценарий {s.name}: пустая структура спроса по топливу")
+        packed['fuel_cum'][i] = np.cumsum(weights) / weights.sum()
+        packed['fuel_cum'][i, -1] = 1.0
+    return packed
+
+
+class _Batch:
+    """Состояние одновременно моделируемых прогонов (строк)"""
+
+    def __init__(self, packed: Dict, scenario_rows: 'np.ndarray', rng):
+        p = {name: values[scenario_rows] for name, values in packed.items()}
+        self.p = p
+        self.rng = rng
+        rows = len(scenario_rows)
+        self.rows = np.arange(rows)
+        n_columns = p['columns'].shape[1]
+        n_tanks = p['tank_exists'].shape[1]
+        n_fuels = p['price'].shape[1]
+        self.queue_size = int(p['max_queue'].max())
+
+        # Цистерны
+        exists = p['tank_exists']
+        self.volume = p['volume'].copy()
+        self.enabled = p['enabled'].copy()
+        self.reorder_volume = p['max_volume'] * p['reorder_level'][:, None]
+        self.order_at = np.where(exists & (self.volume < self.reorder_volume),
+                                 p['lead_time'][:, None] * 60, np.inf)
+        self.ready_at = np.where(exists & ~self.enabled & (self.volume >= p['min_level']),
+                                 p['reenable_delay'][:, None] * 60, np.inf)
+        self.disabled_at = np.where(exists & ~self.enabled, 0.0, np.nan)
+        self.downtime = np.zeros((rows, n_tanks))
+        self.stockouts = np.zeros((rows, n_tanks), dtype=np.int64)
+        self.deliveries = np.zeros((rows, n_tanks), dtype=np.int64)
+        self.delivered = np.zeros((rows, n_tanks))
+        # Колонка -> цистерна, из которой она отпускает топливо (-1 - нет включённой)
+        self.route = np.full((rows, n_columns, n_fuels), -1, dtype=np.int32)
+        self.offered = (p['candidates'] >= 0).any(axis=(1, 3))      # топливо есть хоть на одной колонке
+        self._update_routes(self.rows)
+
+        # Колонки: время окончания обслуживания последних машин (кольцевой буфер)
+        self.completions = np.full((rows, n_columns, self.queue_size), -np.inf)
+        self.pointer = np.zeros((rows, n_columns), dtype=np.int64)
+        self.free_at = np.zeros((rows, n_columns))
+        self.busy = np.zeros((rows, n_columns))
+
+        # Итоги
+        self.arrived = np.zeros(rows, dtype=np.int64)
+        self.served = np.zeros(rows, dtype=np.int64)
+        self.revenue = np.zeros(rows)
+        self.lost = np.zeros((rows, len(LOSS_REASONS)), dtype=np.int64)
+        self.lost_revenue = np.zeros((rows, len(LOSS_REASONS)))
+        self.lost_disabled_fuel = np.zeros((rows, n_fuels))
+        self.queue_hist = np.zeros((rows, self.queue_size + 1), dtype=np.int64)
+        self.wait_hist = np.zeros((rows, WAIT_BINS + 1), dtype=np.int64)
+        self.wait_sum = np.zeros(rows)
+
+    # --- Поставки и включение цистерн ---
+
+    def _update_routes(self, rows: 'np.ndarray'):
+        """Пересчитать цистерны, из которых отпускают колонки (после включения или отключения цистерн)"""
+        candidates = self.p['candidates'][rows]
+        usable = (candidates >= 0) & self.enabled[rows[:, None, None, None], np.maximum(candidates, 0)]
+        first = np.take_along_axis(candidates, usable.argmax(-1)[..., None], -1)[..., 0]
+        self.route[rows] = np.where(usable.any(-1), first, -1)
+
+    def _events(self, rows: 'np.ndarray', now: 'np.ndarray'):
+        """Применить приезды бензовозов и ручные включения, наступившие в строках rows к моменту now"""
+        p = self.p
+        order_at = self.order_at[rows]
+        due = order_at <= now[:, None]
+        if due.any():
+            r, t = np.nonzero(due)
+            arrived_at = order_at[r, t]
+            r = rows[r]
+            volume = self.volume[r, t]
+            amount = np.minimum(p['truck_capacity'][r], p['max_volume'][r, t] - volume)
+            volume += amount
+            self.volume[r, t] = volume
+            self.delivered[r, t] += amount
+            self.deliveries[r, t] += 1
+            # Бензовоза не хватило до уровня заказа - сразу заказываем следующий
+            self.order_at[r, t] = np.where(volume < self.reorder_volume[r, t],
+                                           arrived_at + p['lead_time'][r] * 60, np.inf)
+            ready = ~self.enabled[r, t] & (volume >= p['min_level'][r, t]) & np.isinf(self.ready_at[r, t])
+            self.ready_at[r[ready], t[ready]] = arrived_at[ready] + p['reenable_delay'][r[ready]] * 60
+        due = self.ready_at[rows] <= now[:, None]
+        if due.any():
+            r, t = np.nonzero(due)
+            r = rows[r]
+            self.enabled[r, t] = True
+            self.downtime[r, t] += self.ready_at[r, t] - self.disabled_at[r, t]
+            self.disabled_at[r, t] = np.nan
+            self.ready_at[r, t] = np.inf
+            self._update_routes(np.unique(r))
+
+    # --- Клиенты ---
+
+    def run_hour(self, hour: int):
+        """Промоделировать час: разыграть клиентов пачкой и обслужить их по порядку"""
+        p, rng = self.p, self.rng
+        rows = len(self.rows)
+        counts = rng.poisson(p['arrivals'][:, hour % 24])
+        width = int(counts.max())
+        if width:
+            # Массивы (номер клиента в часе, строка): срез очередного клиента - непрерывный
+            offsets = rng.random((width, rows))
+            offsets[np.arange(width)[:, None] >= counts] = 2.0  # лишние места - после конца часа
+            times = hour * 60 + np.sort(offsets, axis=0) * 60
+            fuel = (rng.random((width, rows))[:, :, None] >= p['fuel_cum']).sum(-1)
+            fuel = np.minimum(fuel, p['fuel_cum'].shape[1] - 1)
+            normal = rng.standard_normal((width, rows))
+            liters = np.clip(p['liters_median'] * np.exp(p['liters_sigma'] * normal), MIN_LITERS, MAX_LITERS)
+            service = rng.exponential(1.0, (width, rows)) * p['service_overhead'] + liters / p['flow_rate']
+            # Равные очереди у нескольких колонок - клиент выбирает случайно
+            ties = rng.random((width, rows, p['columns'].shape[1])) * 0.5
+            for j in range(width):
+                a = np.flatnonzero(counts > j)
+                self._customer(a, times[j, a], fuel[j, a], liters[j, a], service[j, a], ties[j, a])
+            self.arrived += counts
+        self._events(self.rows, np.full(rows, (hour + 1) * 60.0))
+
+    def _customer(self, a: 'np.ndarray', now, fuel, liters, service, ties):
+        """Очередной клиент в каждой из строк a"""
+        p = self.p
+        self._events(a, now)
+        n = np.arange(len(a))
+        price = p['price'][a, fuel] * liters
+
+        route = self.route[a, :, fuel]                                   # (клиенты, колонки)
+        has_tank = route >= 0
+        in_system = (self.completions[a] > now[:, None, None]).sum(-1)
+        best = np.where(has_tank, in_system + ties, np.inf).argmin(-1)
+        queue = in_system[n, best]
+        has_best = has_tank[n, best]
+        tank = route[n, best]
+        offered = self.offered[a, fuel]
+
+        self.queue_hist[a[has_best], queue[has_best]] += 1
+        balked = has_best & (queue >= p['max_queue'][a])
+        candidate = has_best & ~balked
+        insufficient = candidate & (liters > self.volume[a, np.maximum(tank, 0)])
+        served = candidate & ~insufficient
+        losses = (balked, offered & ~has_best, insufficient, ~offered)
+        for reason, mask in enumerate(losses):
+            if mask.any():
+                self.lost[a[mask], reason] += 1
+                self.lost_revenue[a[mask], reason] += price[mask]
+        disabled = losses[1]
+        if disabled.any():
+            self.lost_disabled_fuel[a[disabled], fuel[disabled]] += price[disabled]
+        if not served.any():
+            return
+
+        idx, column, tank, t = a[served], best[served], tank[served], now[served]
+        service, liters = service[served], liters[served]
+        start = np.maximum(t, self.free_at[idx, column])
+        finish = start + service
+        self.completions[idx, column, self.pointer[idx, column]] = finish
+        self.pointer[idx, column] = (self.pointer[idx, column] + 1) % self.queue_size
+        self.free_at[idx, column] = finish
+        self.busy[idx, column] += service
+        wait = start - t
+        self.wait_sum[idx] += wait
+        self.wait_hist[idx, np.minimum(wait.astype(np.int64), WAIT_BINS)] += 1
+        self.served[idx] += 1
+        self.revenue[idx] += price[served]
+
+        volume = self.volume[idx, tank] - liters
+        self.volume[idx, tank] = volume
+        low = volume < p['min_level'][idx, tank]
+        if low.any():
+            self.enabled[idx[low], tank[low]] = False
+            self.disabled_at[idx[low], tank[low]] = t[low]
+            self.stockouts[idx[low], tank[low]] += 1
+            self._update_routes(idx[low])
+        reorder = (volume < self.reorder_volume[idx, tank]) & np.isinf(self.order_at[idx, tank])
+        if reorder.any():
+            self.order_at[idx[reorder], tank[reorder]] = t[reorder] + p['lead_time'][idx[reorder]] * 60
+
+    def finish(self, horizon: float):
+        """Закрыть прогоны: учесть простой цистерн, отключённых до конца периода"""
+        self._events(self.rows, np.full(len(self.rows), horizon))
+        still = ~np.isnan(self.disabled_at)
+        self.downtime[still] += horizon - self.disabled_at[still]
+
+
+def _percentile(histogram: 'np.ndarray', q: float) -> int:
+    """Перцентиль q (0..100) по гистограмме с единичными корзинами"""
+    total = histogram.sum()
+    if not total:
+        return 0
+    return int(np.searchsorted(np.cumsum(histogram), total * q / 100))
+
+
+def _summarize(scenario: Scenario, batch: _Batch, rows: slice, runs: int, days: int,
+               fuels: List[str]) -> Dict:
+    """Итоги сценария по его прогонам"""
+    horizon = days * 1440
+    per_day = runs * days
+    queue_hist = batch.queue_hist[rows].sum(0)[:scenario.max_queue + 1]
+    wait_hist = batch.wait_hist[rows].sum(0)
+    served = int(batch.served[rows].sum())
+    seen = queue_hist.sum()
+    lost = batch.lost[rows].sum(0)
+    lost_revenue = batch.lost_revenue[rows].sum(0)
+    lost_fuel = batch.lost_disabled_fuel[rows].sum(0)
+    stockouts = batch.stockouts[rows]
+    return {
+        'name': scenario.name,
+        'runs': runs,
+        'days': days,
+        'cars_per_day': float(batch.arrived[rows].sum() / per_day),
+        'served_per_day': served / per_day,
+        'revenue_per_day': float(batch.revenue[rows].sum() / per_day),
+        'lost': {
+            reason: {'cars_per_day': float(lost[i] / per_day), 'revenue_per_day': float(lost_revenue[i] / per_day)}
+            for i, reason in enumerate(LOSS_REASONS)
+        },
+        'lost_to_disabled_by_fuel': {
+            fuel: float(lost_fuel[i] / per_day) for i, fuel in enumerate(fuels) if lost_fuel[i]
+        },
+        'queue_length': {
+            'distribution': (queue_hist / seen).tolist() if seen else [],
+            'mean': float((queue_hist * np.arange(len(queue_hist))).sum() / seen) if seen else 0.0,
+            'p95': _percentile(queue_hist, 95),
+        },
+        'wait_minutes': {
+            'mean': float(batch.wait_sum[rows].sum() / served) if served else 0.0,
+            'p50': _percentile(wait_hist, 50),
+            'p95': _percentile(wait_hist, 95),
+        },
+        'column_utilization': {
+            column: float(batch.busy[rows, i].sum() / (runs * horizon))
+            for i, column in enumerate(scenario.columns)
+        },
+        'tanks': {
+            tank['id']: {
+                'stockout_probability': float((stockouts[:, t] > 0).mean()),
+                'stockouts_per_run': float(stockouts[:, t].mean()),
+                'downtime_share': float(batch.downtime[rows, t].sum() / (runs * horizon)),
+                'deliveries_per_run': float(batch.deliveries[rows, t].mean()),
+                'delivered_per_run': float(batch.delivered[rows, t].mean()),
+            }
+            for t, tank in enumerate(scenario.tanks)
+        },
+    }
+
+
+def simulate(scenarios: Sequence[Scenario], runs: int = 200, days: int = 30,
+             seed: Optional[int] = None, batch_rows: int = BATCH_ROWS) -> List[Dict]:
+    """Промоделировать сценарии: runs прогонов по days дней каждый; итоги по сценариям"""
+    _require_numpy()
+    if runs <= 0 or days <= 0:
+        raise ValueError("Число прогонов и дней должно быть положительным")
+    fuels = sorted({fuel for s in scenarios for fuel in list(s.prices) + list(s.fuel_mix)}
+                   | {tank['fuel_type'] for s in scenarios for tank in s.tanks}
+                   | {fuel for s in scenarios for fuels in s.columns.values() for fuel in fuels})
+    packed = _pack(scenarios, fuels)
+    rng = np.random.default_rng(seed)
+    per_batch = max(1, batch_rows // runs)
+    results = []
+    for first in range(0, len(scenarios), per_batch):
+        chunk = range(first, min(first + per_batch, len(scenarios)))
+        batch = _Batch(packed, np.repeat(np.array(chunk), runs), rng)
+        for hour in range(days * 24):
+            batch.run_hour(hour)
+        batch.finish(days * 1440.0)
+        for k, i in enumerate(chunk):
+            results.append(_summarize(scenarios[i], batch, slice(k * runs, (k + 1) * runs), runs, days, fuels))
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    """Итоги моделирования в виде текста"""
+    lines = ["=" * 60, "МОДЕЛИРОВАНИЕ ПРОПУСКНОЙ СПОСОБНОСТИ", "=" * 60]
+    for result in results:
+        lost = result['lost']
+        lines.append(f"\n{result['name']} ({result['runs']} прогонов x {result['days']} дн.)")
+        lines.append(f"  Клиентов в день: {result['cars_per_day']:.1f}, обслужено: {result['served_per_day']:.1f}")
+        lines.append(f"  Выручка в день: {result['revenue_per_day']:,.0f} руб.")
+        losses = ", ".join(f"{reason} {loss['cars_per_day']:.1f} маш. / {loss['revenue_per_day']:,.0f} руб."
+                           for reason, loss in lost.items() if loss['cars_per_day'])
+        lines.append(f"  Потери в день: {losses or 'нет'}")
+        for fuel, revenue in result['lost_to_disabled_by_fuel'].items():
+            lines.append(f"    из-за отключённых цистерн {fuel}: {revenue:,.0f} руб./день")
+        queue = result['queue_length']
+        lines.append(f"  Очередь при подъезде: средняя {queue['mean']:.2f}, p95 {queue['p95']}; "
+                     f"ожидание: среднее {result['wait_minutes']['mean']:.1f} мин, p95 {result['wait_minutes']['p95']} мин")
+        lines.append("  Загрузка колонок: " + ", ".join(
+            f"{column}: {share:.0%}" for column, share in result['column_utilization'].items()))
+        for tank_id, tank in result['tanks'].items():
+            lines.append(f"  {tank_id:10} остановка: {tank['stockout_probability']:6.1%}, "
+                         f"простой {tank['downtime_share']:6.1%}, поставок {tank['deliveries_per_run']:.1f}")
+    return "\n".join(lines)
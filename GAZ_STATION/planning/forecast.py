@@ -0,0 +1,245 @@
+"""
+Прогноз расхода топлива по цистернам и план поставок
+
+Профиль спроса цистерны - средний расход за каждый час недели (168 значений).
+История продаж читается один раз, дальше всё считается массивами numpy
+сразу по всем цистернам: литры суммируются по (цистерна, час недели) и
+делятся на число прошедших часов этого часа недели с первой продажи
+цистерны. Старые недели весят меньше (период полураспада half_life недель),
+чтобы профиль следовал за изменением спроса.
+
+Прогноз разворачивает профиль на horizon часов вперёд, накапливает расход
+и находит момент, когда остаток опустится ниже min_level - тогда
+Tank.remove_fuel отключит цистерну.
+
+План поставок: бензовоз приезжает как можно позже, но до того, как остаток
+опустится ниже min_level плюс страховой запас, и не раньше чем через
+lead_time часов от текущего момента. Каждой цистерне рейса достаётся
+столько, сколько помещается до max_volume с учётом уже запланированных
+поставок; остаток бензовоза отдаётся цистернам, которым поставка понадобится
+в пределах consolidation часов (самым срочным первыми).
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для прогноза
+    np = None
+
+import config
+from data.models import Tank
+
+HOURS_PER_WEEK = 168
+MIN_DROP = 500.0            # л, меньше в цистерну не сливают
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Для прогноза нужен numpy (pip install numpy)")
+
+
+def hour_of_week(hours: 'np.ndarray') -> 'np.ndarray':
+    """Час недели (0 - понедельник 00:00) по номеру часа от 1970-01-01 (четверг)"""
+    return (hours // 24 + 3) % 7 * 24 + hours % 24
+
+
+def _epoch_hour(moment: datetime) -> int:
+    return int(np.datetime64(moment.replace(minute=0, second=0, microsecond=0), 'h').astype(np.int64))
+
+
+def sales_arrays(records: Iterable[Dict], tank_ids: Sequence[str]) -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+    """Продажи из истории: (номер цистерны, номер часа от 1970 года, литры)"""
+    index = {tank_id: i for i, tank_id in enumerate(tank_ids)}
+    tanks, timestamps, liters = [], [], []
+    for record in records:
+        if record.get('type') != 'sale':
+            continue
+        details = record.get('details') or {}
+        tank = index.get(details.get('tank_id'))
+        if tank is None:
+            continue
+        tanks.append(tank)
+        timestamps.append(record['timestamp'])
+        liters.append(details['liters'])
+    hours = np.array(timestamps, dtype='datetime64[us]').astype('datetime64[h]').astype(np.int64)
+    return np.array(tanks, dtype=np.int64), hours, np.array(liters, dtype=float)
+
+
+def fit_profiles(tanks: 'np.ndarray', hours: 'np.ndarray', liters: 'np.ndarray', n_tanks: int,
+                 now_hour: int, half_life: float = 4.0) -> 'np.ndarray':
+    """Средний расход цистерн по часам недели: массив (цистерна, час недели), л/ч"""
+    profile = np.zeros((n_tanks, HOURS_PER_WEEK))
+    past = hours < now_hour
+    tanks, hours, liters = tanks[past], hours[past], liters[past]
+    if not len(hours):
+        return profile
+    decay = np.log(2) / (half_life * HOURS_PER_WEEK)
+    weights = np.exp(-decay * (now_hour - hours))
+    demand = np.bincount(tanks * HOURS_PER_WEEK + hour_of_week(hours), weights=liters * weights,
+                         minlength=n_tanks * HOURS_PER_WEEK).reshape(n_tanks, HOURS_PER_WEEK)
+
+    # Число прошедших часов каждого часа недели с первой продажи цистерны (с теми же весами):
+    # суффиксные суммы весов часов с шагом в неделю
+    start = int(hours.min())
+    span = now_hour - start
+    weeks = -(-span // HOURS_PER_WEEK)
+    hour_weights = np.zeros(weeks * HOURS_PER_WEEK)
+    hour_weights[:span] = np.exp(-decay * (now_hour - np.arange(start, now_hour)))
+    suffix = hour_weights.reshape(weeks, HOURS_PER_WEEK)[::-1].cumsum(0)[::-1].ravel()
+    first = np.full(n_tanks, now_hour)
+    np.minimum.at(first, tanks, hours)
+    slots = np.arange(HOURS_PER_WEEK)
+    position = (first - start)[:, None] + (slots - hour_of_week(first)[:, None]) % HOURS_PER_WEEK
+    exposure = np.where(position < span, suffix[np.minimum(position, len(suffix) - 1)], 0.0)
+    np.divide(demand, exposure, out=profile, where=exposure > 0)
+    return profile
+
+
+def forecast_levels(profile: 'np.ndarray', volume: 'np.ndarray', min_level: 'np.ndarray',
+                    now_hour: int, horizon: int) -> Tuple['np.ndarray', 'np.ndarray']:
+    """Расход по часам (цистерна, час) и часы до падения ниже min_level (inf - не упадёт за horizon)"""
+    demand = profile[:, hour_of_week(now_hour + np.arange(horizon))]
+    spent = demand.cumsum(1)
+    below = volume[:, None] - spent < min_level[:, None]
+    hit = below.any(1)
+    hour = below.argmax(1)
+    rows = np.arange(len(volume))
+    # Внутри часа расход считаем равномерным
+    before = spent[rows, hour] - demand[rows, hour]
+    fraction = np.divide(volume - min_level - before, demand[rows, hour],
+                         out=np.zeros(len(volume)), where=demand[rows, hour] > 0)
+    hours_left = np.where(volume < min_level, 0.0, np.where(hit, hour + np.clip(fraction, 0, 1), np.inf))
+    return demand, hours_left
+
+
+def plan_deliveries(demand: 'np.ndarray', volume: 'np.ndarray', min_level: 'np.ndarray',
+                    max_volume: 'np.ndarray', enabled: 'np.ndarray', truck_capacity: float, lead_time: int,
+                    safety_stock: 'np.ndarray', consolidation: int) -> List[Dict]:
+    """Рейсы бензовоза на горизонте прогноза
+
+    Возвращает [{'hour', 'late', 'drops': [(цистерна, литры, включить после слива)]}].
+    """
+    n_tanks, horizon = demand.shape
+    # Остаток в начале каждого часа (с поставками этого часа); в конце часа - за вычетом расхода
+    start_levels = volume[:, None] - np.concatenate([np.zeros((n_tanks, 1)), demand.cumsum(1)[:, :-1]], 1)
+    threshold = (min_level + safety_stock)[:, None]
+    hours = np.arange(horizon)
+    covered = np.zeros(n_tanks, dtype=np.int64)     # до этого часа нехватка уже учтена в плане
+    disabled = ~enabled
+    trips = []
+    while True:
+        below = (start_levels - demand < threshold) & (hours >= covered[:, None])
+        need = np.where(below.any(1), below.argmax(1), horizon)
+        urgent = int(need.min())
+        hour = max(urgent, lead_time)
+        if urgent >= horizon or hour >= horizon:
+            break
+        room = max_volume - start_levels[:, hour:].max(1)
+        left = truck_capacity
+        drops = []
+        for tank in np.argsort(need, kind='stable'):
+            if need[tank] > hour + consolidation or left < MIN_DROP:
+                break
+            amount = float(min(room[tank], left))
+            if amount < MIN_DROP:
+                continue
+            # Опустилась ниже min_level до приезда бензовоза - отключится, включать вручную
+            ends = start_levels[tank, covered[tank]:hour] - demand[tank, covered[tank]:hour]
+            enable = bool(disabled[tank] or (ends < min_level[tank]).any())
+            disabled[tank] = False
+            start_levels[tank, hour:] += amount
+            covered[tank] = hour
+            left -= amount
+            drops.append((int(tank), amount, enable))
+        covered[need.argmin()] = max(covered[need.argmin()], hour + 1)
+        if drops:
+            trips.append({'hour': hour, 'late': urgent < hour, 'drops': drops})
+    trips.sort(key=lambda trip: trip['hour'])
+    return trips
+
+
+def build_delivery_plan(records: Iterable[Dict], tanks: List[Tank], now: Optional[datetime] = None,
+                        horizon: int = HOURS_PER_WEEK, half_life: float = 4.0,
+                        truck_capacity: Optional[float] = None, lead_time: Optional[int] = None,
+                        safety_stock: Optional[float] = None, consolidation: int = 24) -> Dict:
+    """Прогноз по цистернам и план поставок
+
+    records - история транзакций (например, storage.iter_transactions()),
+    tanks - текущее состояние цистерн.
+    """
+    _require_numpy()
+    if truck_capacity is None:
+        truck_capacity = config.DELIVERY_TRUCK_CAPACITY
+    if lead_time is None:
+        lead_time = config.DELIVERY_LEAD_TIME
+    if safety_stock is None:
+        safety_stock = config.DELIVERY_SAFETY_STOCK
+    now = now or datetime.now()
+    now_hour = _epoch_hour(now)
+    start = now.replace(minute=0, second=0, microsecond=0)
+
+    tank_ids = [tank.id for tank in tanks]
+    volume = np.array([tank.current_volume for tank in tanks], dtype=float)
+    min_level = np.array([tank.min_level for tank in tanks], dtype=float)
+    max_volume = np.array([tank.max_volume for tank in tanks], dtype=float)
+    enabled = np.array([tank.enabled for tank in tanks], dtype=bool)
+
+    profile = fit_profiles(*sales_arrays(records, tank_ids), len(tanks), now_hour, half_life)
+    demand, hours_left = forecast_levels(profile, volume, min_level, now_hour, horizon)
+    trips = plan_deliveries(demand, volume, min_level, max_volume, enabled, truck_capacity, lead_time,
+                            max_volume * safety_stock, consolidation)
+
+    forecast = []
+    for i, tank in enumerate(tanks):
+        below_at = None if np.isinf(hours_left[i]) else (now + timedelta(hours=float(hours_left[i]))).isoformat()
+        forecast.append({
+            'tank_id': tank.id,
+            'fuel_type': tank.fuel_type,
+            'volume': tank.current_volume,
+            'enabled': tank.enabled,
+            'demand_per_day': float(profile[i].sum() / 7),
+            'forecast_liters': float(demand[i].sum()),
+            'hours_to_min_level': None if np.isinf(hours_left[i]) else float(hours_left[i]),
+            'below_min_level_at': below_at,
+            'profile': profile[i].round(2).tolist(),
+        })
+    schedule = []
+    for trip in trips:
+        at = start + timedelta(hours=trip['hour'])
+        schedule.append({
+            'at': at.isoformat(),
+            'late': trip['late'],
+            'liters': sum(amount for _, amount, _ in trip['drops']),
+            'drops': [{'tank_id': tank_ids[tank], 'liters': round(amount, 1), 'enable_after': enable}
+                      for tank, amount, enable in trip['drops']],
+        })
+    return {
+        'created': now.isoformat(),
+        'horizon_hours': horizon,
+        'truck_capacity': truck_capacity,
+        'forecast': forecast,
+        'schedule': schedule,
+    }
+
+
+def format_plan(plan: Dict) -> str:
+    """Прогноз и план поставок в виде текста"""
+    lines = ["=" * 60, f"ПРОГНОЗ РАСХОДА НА {plan['horizon_hours']} Ч И ПЛАН ПОСТАВОК", "=" * 60]
+    for tank in plan['forecast']:
+        if tank['below_min_level_at'] is None:
+            outlook = "запаса хватит"
+        else:
+            outlook = f"ниже минимума {tank['below_min_level_at'][:16].replace('T', ' ')}"
+        state = "" if tank['enabled'] else " (отключена)"
+        lines.append(f"{tank['tank_id']:10} {tank['volume']:8.0f} л, {tank['demand_per_day']:7.0f} л/сут - "
+                     f"{outlook}{state}")
+    lines.append("")
+    if not plan['schedule']:
+        lines.append("Поставки на горизонте прогноза не нужны")
+    for trip in plan['schedule']:
+        drops = ", ".join(f"{drop['tank_id']} {drop['liters']:.0f} л" + (" + включить" if drop['enable_after'] else "")
+                          for drop in trip['drops'])
+        late = " ОПОЗДАНИЕ" if trip['late'] else ""
+        lines.append(f"{trip['at'][:16].replace('T', ' ')}{late}: {drops}")
+    return "\n".join(lines)
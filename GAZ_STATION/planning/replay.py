@@ -0,0 +1,399 @@
+"""
+Воспроизведение истории транзакций на другой конфигурации АЗС ("что если")
+
+Вариант - другая таблица цен, другой набор цистерн (объёмы, подключение к
+колонкам) или другие пороги min_level. Записанные транзакции прогоняются
+через модель с правилами AZSCore, целиком в памяти и без сохранения
+состояния: продажа идёт из первой включённой цистерны, подключённой к
+колонке, цистерна отключается при падении ниже min_level, пополнения,
+перекачки, ручные включения и аварийный режим повторяют записанные
+действия оператора. Спрос не меняется: клиент приезжает к той же колонке
+за тем же числом литров, что и в истории.
+
+История читается в колоночное хранилище (data.history_store), дальше всё
+считается массивами numpy. Продажи между двумя другими событиями идут
+пачкой: пока маршруты колонок не меняются, объёмы цистерн перед каждой
+продажей - накопленные суммы литров по цистерне. По ним сразу находится
+первая продажа, после которой цистерна отключится (или которой не хватит
+топлива); продажи до неё учитываются одним сложением, а пачка
+продолжается после неё с пересчитанными маршрутами.
+
+Итоги по варианту: выручка, отказы в продаже по причинам, автоматические
+отключения цистерн и отклонённые действия оператора. Первый вариант -
+текущая конфигурация, с ним сравниваются остальные.
+"""
+from dataclasses import dataclass, field, fields
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для воспроизведения
+    np = None
+
+import config
+from data.binlog import KIND_EMERGENCY, KIND_REFUEL, KIND_SALE, KIND_TOGGLE, KIND_TRANSFER
+from data.history_store import NONE, ColumnarHistory
+
+# Причины отказа в продаже (как у AZSCore._dispense)
+REFUSAL_REASONS = ('emergency', 'unavailable', 'insufficient', 'unknown_fuel')
+MIN_WINDOW = 256            # продаж в пачке после отключения цистерны
+MAX_WINDOW = 65536          # пачка удваивается, пока цистерны не отключаются
+COLUMNS = ('kinds', 'columns', 'fuels', 'tanks', 'targets', 'actions', 'liters', 'amounts', 'flags')
+
+
+@dataclass
+class Variant:
+    """Конфигурация АЗС для воспроизведения истории"""
+    name: str = "config"
+    prices: Dict[str, float] = field(default_factory=lambda: dict(config.FUEL_TYPES))
+    # Цистерны в начале истории (по умолчанию INITIAL_TANKS - с них АЗС начинает работу)
+    tanks: List[Dict] = field(default_factory=lambda: [dict(tank) for tank in config.INITIAL_TANKS])
+    min_levels: Dict[str, float] = field(default_factory=dict)   # min_level по id цистерны поверх tanks
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Variant':
+        """Вариант из словаря (например, из JSON); цены дополняются ценами config"""
+        known = {item.name for item in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Неизвестные параметры варианта: {', '.join(sorted(unknown))}")
+        data = dict(data)
+        if 'prices' in data:
+            data['prices'] = {**config.FUEL_TYPES, **data['prices']}
+        variant = cls(**data)
+        tank_ids = {tank['id'] for tank in variant.tanks}
+        missing = set(variant.min_levels) - tank_ids
+        if missing:
+            raise ValueError(f"Вариант {variant.name}: нет цистерн {', '.join(sorted(missing))}")
+        return variant
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Для воспроизведения истории нужен numpy (pip install numpy)")
+
+
+class _Events:
+    """Записанные транзакции в массивах numpy"""
+
+    def __init__(self, history: ColumnarHistory):
+        columns, self.strings = history.columns_snapshot(COLUMNS)
+        arrays = {name: np.frombuffer(values, dtype=values.typecode) for name, values in columns.items()}
+        self.kinds = arrays['kinds']
+        self.tanks = arrays['tanks']
+        self.targets = arrays['targets']
+        self.actions = arrays['actions']
+        self.liters = arrays['liters']
+        self.flags = arrays['flags']
+        self.count = len(self.kinds)
+        # Позиции событий, меняющих состояние (между ними - пачки продаж)
+        self.others = np.flatnonzero(self.kinds != KIND_SALE)
+
+        # Продажи: пара (колонка, топливо) и вид топлива - номерами в своих таблицах
+        sale = self.kinds == KIND_SALE
+        fuels = arrays['fuels'].astype(np.int64)
+        keys = arrays['columns'].astype(np.int64) * (NONE + 1) + fuels
+        pair_keys, pair = np.unique(np.where(sale, keys, -1), return_inverse=True)
+        fuel_codes, fuel = np.unique(np.where(sale, fuels, -1), return_inverse=True)
+        self.pair = pair.astype(np.int64)
+        self.pairs = [(int(key) // (NONE + 1), self.string(int(key) % (NONE + 1))) for key in pair_keys]
+        self.fuel = fuel.astype(np.int64)
+        self.fuel_names = [self.string(int(code)) if code >= 0 else None for code in fuel_codes]
+        self.recorded = np.where(sale, arrays['amounts'], 0.0)
+
+    def string(self, code: int) -> Optional[str]:
+        return None if code == NONE or code >= len(self.strings) else self.strings[code]
+
+
+class _Replay:
+    """Состояние одного варианта при воспроизведении"""
+
+    def __init__(self, events: _Events, variant: Variant):
+        self.events = events
+        self.variant = variant
+        tanks = variant.tanks
+        self.tank_ids = [tank['id'] for tank in tanks]
+        index = {tank_id: t for t, tank_id in enumerate(self.tank_ids)}
+        n_tanks = len(tanks)
+        self.fuel_types = [tank['fuel_type'] for tank in tanks]
+        self.max_volume = np.array([tank['max_volume'] for tank in tanks], dtype=float)
+        self.volume = np.array([tank['current_volume'] for tank in tanks], dtype=float)
+        self.min_level = np.array([variant.min_levels.get(tank['id'], tank['min_level']) for tank in tanks],
+                                  dtype=float)
+        self.enabled = np.array([tank['enabled'] for tank in tanks], dtype=bool)
+        self.emergency = False
+
+        # Код строки истории -> номер цистерны варианта (-1 - такой цистерны нет)
+        self.tank_of_code = np.full(len(events.strings) + 1, -1, dtype=np.int64)
+        for code, value in enumerate(events.strings):
+            if value in index:
+                self.tank_of_code[code] = index[value]
+
+        # Цистерны-кандидаты пары (колонка, топливо) в порядке списка цистерн, как в RoutingIndex
+        routes = [[t for t, tank in enumerate(tanks) if tank['fuel_type'] == fuel_type
+                   and column in tank['connected_to']] for column, fuel_type in events.pairs]
+        width = max([len(candidates) for candidates in routes] or [1]) or 1
+        self.candidates = np.full((len(routes), width), -1, dtype=np.int64)
+        for p, candidates in enumerate(routes):
+            self.candidates[p, :len(candidates)] = candidates
+        self.route = np.full(len(routes), -1, dtype=np.int64)
+        self.routes_dirty = True
+
+        self.price = np.array([variant.prices.get(fuel_type, 0.0) if fuel_type is not None else 0.0
+                               for fuel_type in events.fuel_names], dtype=float)
+        n_fuels = len(events.fuel_names)
+        self.served = np.zeros(n_fuels, dtype=np.int64)
+        self.served_liters = np.zeros(n_fuels)
+        self.revenue = np.zeros(n_fuels)
+        self.refused = np.zeros((len(REFUSAL_REASONS), n_fuels), dtype=np.int64)
+        self.refused_liters = np.zeros((len(REFUSAL_REASONS), n_fuels))
+        self.refused_revenue = np.zeros((len(REFUSAL_REASONS), n_fuels))
+        self.auto_disables = np.zeros(n_tanks, dtype=np.int64)
+        self.rejected = {'refuel': 0, 'transfer': 0, 'tank_toggle': 0}
+        self.unmatched = 0      # действия с цистернами, которых нет в варианте
+        self.skipped = 0        # нетиповые записи истории
+
+    # --- Продажи ---
+
+    def _update_routes(self):
+        """Первая включённая цистерна каждой пары (колонка, топливо)"""
+        candidates = self.candidates
+        usable = (candidates >= 0) & self.enabled[np.maximum(candidates, 0)]
+        first = np.take_along_axis(candidates, usable.argmax(1)[:, None], 1)[:, 0]
+        self.route = np.where(usable.any(1), first, -1)
+        self.routes_dirty = False
+
+    def _refuse(self, reason: str, sales: 'np.ndarray'):
+        """Учесть отказ в продажах с номерами sales"""
+        if not len(sales):
+            return
+        e = self.events
+        r = REFUSAL_REASONS.index(reason)
+        fuel = e.fuel[sales]
+        liters = e.liters[sales]
+        n_fuels = len(self.price)
+        # Несостоявшаяся выручка - по цене варианта, для топлива без цены - по записанной
+        price = self.price[fuel]
+        lost = np.where(price > 0, liters * price, e.recorded[sales])
+        self.refused[r] += np.bincount(fuel, minlength=n_fuels)
+        self.refused_liters[r] += np.bincount(fuel, liters, minlength=n_fuels)
+        self.refused_revenue[r] += np.bincount(fuel, lost, minlength=n_fuels)
+
+    def _serve(self, sales: 'np.ndarray'):
+        """Учесть выручку продаж sales (объёмы цистерн обновляет вызывающий)"""
+        if not len(sales):
+            return
+        e = self.events
+        fuel = e.fuel[sales]
+        liters = e.liters[sales]
+        n_fuels = len(self.price)
+        self.served += np.bincount(fuel, minlength=n_fuels)
+        self.served_liters += np.bincount(fuel, liters, minlength=n_fuels)
+        self.revenue += np.bincount(fuel, liters * self.price[fuel], minlength=n_fuels)
+
+    def sales(self, lo: int, hi: int):
+        """Воспроизвести продажи с номерами [lo, hi) (других событий между ними нет)"""
+        e = self.events
+        window = MIN_WINDOW
+        while lo < hi:
+            if self.emergency:
+                self._refuse('emergency', np.arange(lo, hi))
+                return
+            if self.routes_dirty:
+                self._update_routes()
+            end = min(hi, lo + window)
+            sales = np.arange(lo, end)
+            tank = self.route[e.pair[lo:end]]
+            liters = e.liters[lo:end]
+            has_tank = tank >= 0
+            priced = self.price[e.fuel[lo:end]] > 0
+            consuming = has_tank & priced
+
+            # Объём цистерны до и после каждой продажи. Литры вычитаются по одной продаже,
+            # как в Tank.remove_fuel, чтобы сравнения с min_level совпадали с AZSCore до бита
+            before = np.full(len(sales), np.inf)
+            after = np.full(len(sales), np.inf)
+            min_level = np.full(len(sales), -np.inf)
+            groups = [(t, np.flatnonzero(tank == t)) for t in np.unique(tank[has_tank]).tolist()]
+            for t, members in groups:
+                used = np.where(consuming[members], liters[members], 0.0)
+                levels = np.subtract.accumulate(np.r_[self.volume[t], used])
+                before[members] = levels[:-1]
+                after[members] = levels[1:]
+                min_level[members] = self.min_level[t]
+            insufficient = has_tank & (liters > before)
+            disables = consuming & ~insufficient & (after < min_level)
+            breaks = np.flatnonzero((consuming & insufficient) | disables)
+
+            # Продажи до первой, после которой меняется состояние, учитываются пачкой
+            cut = breaks[0] if len(breaks) else len(sales)
+            ok = slice(0, cut)
+            self._refuse('unavailable', sales[ok][~has_tank[ok]])
+            self._refuse('insufficient', sales[ok][has_tank[ok] & ~priced[ok] & insufficient[ok]])
+            self._refuse('unknown_fuel', sales[ok][has_tank[ok] & ~priced[ok] & ~insufficient[ok]])
+            self._serve(sales[ok][consuming[ok]])
+            if len(breaks):
+                if insufficient[cut]:
+                    self._refuse('insufficient', sales[cut:cut + 1])
+                else:
+                    # Продажа, после которой цистерна отключается
+                    t = tank[cut]
+                    self._serve(sales[cut:cut + 1])
+                    self.enabled[t] = False
+                    self.auto_disables[t] += 1
+                    self.routes_dirty = True
+                    cut += 1
+            for t, members in groups:
+                done = members[members < cut]
+                if len(done):
+                    self.volume[t] = after[done[-1]]
+            if len(breaks):
+                lo += int(breaks[0]) + 1
+                window = MIN_WINDOW
+            else:
+                lo = end
+                window = min(window * 2, MAX_WINDOW)
+
+    # --- Остальные события ---
+
+    def _tank(self, code: int) -> int:
+        return int(self.tank_of_code[min(code, len(self.tank_of_code) - 1)])
+
+    def event(self, i: int):
+        """Воспроизвести событие i (не продажу)"""
+        e = self.events
+        kind = e.kinds[i]
+        liters = float(e.liters[i])
+        if kind == KIND_REFUEL:
+            t = self._tank(e.tanks[i])
+            if t < 0:
+                self.unmatched += 1
+                return
+            if self.emergency or self.volume[t] + liters > self.max_volume[t]:
+                self.rejected['refuel'] += 1
+                return
+            self.volume[t] += liters
+        elif kind == KIND_TRANSFER:
+            source, target = self._tank(e.tanks[i]), self._tank(e.targets[i])
+            if source < 0 or target < 0:
+                self.unmatched += 1
+                return
+            if (self.emergency or self.fuel_types[source] != self.fuel_types[target]
+                    or not self.enabled[source] or liters > self.volume[source]
+                    or self.volume[target] + liters > self.max_volume[target]):
+                self.rejected['transfer'] += 1
+                return
+            self.volume[source] -= liters
+            self.volume[target] += liters
+            if self.volume[source] < self.min_level[source]:
+                self.enabled[source] = False
+                self.auto_disables[source] += 1
+                self.routes_dirty = True
+        elif kind == KIND_TOGGLE:
+            t = self._tank(e.tanks[i])
+            if t < 0:
+                self.unmatched += 1
+                return
+            if e.flags[i] and self.volume[t] < self.min_level[t]:
+                self.rejected['tank_toggle'] += 1
+                return
+            self.enabled[t] = bool(e.flags[i])
+            self.routes_dirty = True
+        elif kind == KIND_EMERGENCY:
+            action = e.string(int(e.actions[i]))
+            if action == 'activated':
+                self.emergency = True
+                self.enabled[:] = False
+                self.routes_dirty = True
+            elif action == 'deactivated':
+                self.emergency = False
+        else:
+            self.skipped += 1
+
+    def run(self):
+        lo = 0
+        for i in self.events.others.tolist():
+            self.sales(lo, i)
+            self.event(i)
+            lo = i + 1
+        self.sales(lo, self.events.count)
+
+    def summary(self) -> Dict:
+        e = self.events
+        fuels = [(f, name) for f, name in enumerate(e.fuel_names) if name is not None]
+        return {
+            'name': self.variant.name,
+            'sales': int(self.served.sum() + self.refused.sum()),
+            'served': int(self.served.sum()),
+            'liters': float(self.served_liters.sum()),
+            'revenue': float(self.revenue.sum()),
+            'revenue_by_fuel': {name: float(self.revenue[f]) for f, name in fuels if self.served[f]},
+            'refused': {
+                reason: {'sales': int(self.refused[r].sum()), 'liters': float(self.refused_liters[r].sum()),
+                         'revenue': float(self.refused_revenue[r].sum())}
+                for r, reason in enumerate(REFUSAL_REASONS)
+            },
+            'auto_disables': {tank_id: int(count) for tank_id, count in zip(self.tank_ids, self.auto_disables)},
+            'rejected': dict(self.rejected),
+            'unmatched': self.unmatched,
+            'skipped': self.skipped,
+            'final_volumes': {tank_id: float(volume) for tank_id, volume in zip(self.tank_ids, self.volume)},
+        }
+
+
+def replay(history: Union[ColumnarHistory, Iterable[Dict]], variants: Sequence[Variant] = ()) -> List[Dict]:
+    """Воспроизвести историю на текущей конфигурации и на вариантах variants
+
+    history - колоночное хранилище (AZSCore.get_history()) или поток
+    транзакций (storage.iter_transactions()). Первый результат - текущая
+    конфигурация, у остальных есть 'delta' - разница с ней.
+    """
+    _require_numpy()
+    if not isinstance(history, ColumnarHistory):
+        history = ColumnarHistory.from_records(history)
+    events = _Events(history)
+    recorded = float(events.recorded.sum())
+    results = []
+    for variant in [Variant()] + list(variants):
+        state = _Replay(events, variant)
+        state.run()
+        result = state.summary()
+        result['recorded_revenue'] = recorded
+        results.append(result)
+    baseline = results[0]
+    for result in results[1:]:
+        result['delta'] = {
+            'revenue': result['revenue'] - baseline['revenue'],
+            'served': result['served'] - baseline['served'],
+            'refused': {reason: result['refused'][reason]['sales'] - baseline['refused'][reason]['sales']
+                        for reason in REFUSAL_REASONS},
+            'auto_disables': sum(result['auto_disables'].values()) - sum(baseline['auto_disables'].values()),
+        }
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    """Итоги воспроизведения в виде текста"""
+    lines = ["=" * 60, "ВОСПРОИЗВЕДЕНИЕ ИСТОРИИ НА ДРУГИХ КОНФИГУРАЦИЯХ", "=" * 60]
+    if results:
+        lines.append(f"Продаж в истории: {results[0]['sales']}, "
+                     f"записанная выручка: {results[0]['recorded_revenue']:,.2f} руб.")
+    for result in results:
+        lines.append(f"\n{result['name']}")
+        lines.append(f"  Продано: {result['served']} ({result['liters']:,.1f} л), "
+                     f"выручка: {result['revenue']:,.2f} руб.")
+        refused = ", ".join(f"{reason} {values['sales']} ({values['revenue']:,.0f} руб.)"
+                            for reason, values in result['refused'].items() if values['sales'])
+        lines.append(f"  Отказы: {refused or 'нет'}")
+        disables = ", ".join(f"{tank_id}: {count}" for tank_id, count in result['auto_disables'].items() if count)
+        lines.append(f"  Автоотключения цистерн: {disables or 'нет'}")
+        rejected = ", ".join(f"{action} {count}" for action, count in result['rejected'].items() if count)
+        if rejected or result['unmatched']:
+            lines.append(f"  Отклонено действий оператора: {rejected or 'нет'}; "
+                         f"с отсутствующими цистернами: {result['unmatched']}")
+        delta = result.get('delta')
+        if delta:
+            refused_delta = sum(delta['refused'].values())
+            lines.append(f"  Разница с текущей конфигурацией: выручка {delta['revenue']:+,.2f} руб., "
+                         f"отказов {refused_delta:+d}, автоотключений {delta['auto_disables']:+d}")
+    return "\n".join(lines)
@@ -0,0 +1,243 @@
+"""
+Выгрузка истории транзакций в CSV и в колоночный формат
+
+История читается потоком и обрабатывается порциями по chunk_size записей,
+поэтому память не зависит от размера истории. Поля details раскладываются
+в типизированные колонки: у каждого типа транзакции своя таблица.
+Транзакции, которые не подходят под схему своего типа (нет поля, лишнее
+поле, значение другого типа), попадают в таблицу other с details в виде
+JSON - значения не обрезаются и не приводятся.
+
+CSV: по файлу <тип>.csv на таблицу.
+Колоночный формат: директория <тип>/ на таблицу, файл на колонку и общий
+manifest.json. Числа - массивы little-endian (i64 - целые, f64 - дробные,
+u8 - логические), строки - текст UTF-8, по значению в JSON-кодировке на строку.
+manifest.json пишется только после успешной выгрузки; CSV-файлы прерванной
+выгрузки удаляются.
+"""
+import csv
+import json
+import os
+import sys
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+COMMON_COLUMNS = [('id', 'str'), ('type', 'str'), ('timestamp', 'str')]
+# Колонки details по типам транзакций
+TYPE_COLUMNS = {
+    'sale': [('column', 'int'), ('fuel_type', 'str'), ('tank_id', 'str'), ('liters', 'float'),
+             ('price_per_liter', 'float'), ('total_price', 'float')],
+    'refuel': [('tank_id', 'str'), ('liters_added', 'float'), ('new_volume', 'float')],
+    'transfer': [('from_tank', 'str'), ('to_tank', 'str'), ('fuel_type', 'str'), ('liters', 'float')],
+    'tank_toggle': [('tank_id', 'str'), ('action', 'str'), ('new_state', 'bool'), ('volume', 'float')],
+    'emergency': [('action', 'str'), ('event_timestamp', 'str')],
+}
+# Колонки, имя которых отличается от ключа details (чтобы не совпадать с общими)
+DETAIL_KEYS = {('emergency', 'event_timestamp'): 'timestamp'}
+OTHER_TABLE = 'other'
+OTHER_COLUMNS = [('details', 'str')]
+
+# Типы колонок -> (код array, расширение файла)
+ARRAY_TYPES = {'int': ('q', 'i64'), 'float': ('d', 'f64'), 'bool': ('B', 'u8')}
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def table_columns(table: str) -> List[Tuple[str, str]]:
+    """Колонки таблицы: (имя, тип)"""
+    return COMMON_COLUMNS + (OTHER_COLUMNS if table == OTHER_TABLE else TYPE_COLUMNS[table])
+
+
+def convert(kind: str, value):
+    """Значение для колонки типа kind без потерь; TypeError, если не подходит"""
+    if kind == 'str' and isinstance(value, str):
+        return value
+    if kind == 'bool' and isinstance(value, bool):
+        return value
+    if isinstance(value, bool):
+        raise TypeError(value)
+    if kind == 'int' and isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        return value
+    if kind == 'float' and isinstance(value, (int, float)) and float(value) == value:
+        return float(value)
+    raise TypeError(value)
+
+
+def flatten(record: Dict) -> Tuple[str, list]:
+    """Таблица и строка значений для транзакции"""
+    trans_type = record.get('type')
+    details = record.get('details')
+    columns = TYPE_COLUMNS.get(trans_type)
+    if columns is not None and isinstance(details, dict) and len(details) == len(columns):
+        try:
+            row = [convert('str', record['id']), trans_type, convert('str', record['timestamp'])]
+            for name, kind in columns:
+                row.append(convert(kind, details[DETAIL_KEYS.get((trans_type, name), name)]))
+            return trans_type, row
+        except (KeyError, TypeError):
+            pass
+    return OTHER_TABLE, [record.get('id'), trans_type, record.get('timestamp'),
+                         json.dumps(details, ensure_ascii=False)]
+
+
+def iter_chunks(records: Iterable[Dict], chunk_size: int) -> Iterable[Dict[str, List[list]]]:
+    """Порции строк по таблицам: не более chunk_size транзакций в порции"""
+    chunk: Dict[str, List[list]] = {}
+    count = 0
+    for record in records:
+        table, row = flatten(record)
+        chunk.setdefault(table, []).append(row)
+        count += 1
+        if count >= chunk_size:
+            yield chunk
+            chunk, count = {}, 0
+    if chunk:
+        yield chunk
+
+
+class CSVExporter:
+    """Запись таблиц в файлы <тип>.csv"""
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.files = {}
+        self.writers = {}
+        self.rows: Dict[str, int] = {}
+
+    def write(self, table: str, rows: List[list]):
+        writer = self.writers.get(table)
+        if writer is None:
+            f = open(os.path.join(self.out_dir, f"{table}.csv"), 'w', encoding='utf-8', newline='')
+            self.files[table] = f
+            writer = self.writers[table] = csv.writer(f)
+            writer.writerow([name for name, _ in table_columns(table)])
+        writer.writerows(rows)
+        self.rows[table] = self.rows.get(table, 0) + len(rows)
+
+    def close(self, complete: bool = True) -> Dict:
+        """Закрыть файлы; недописанные файлы прерванной выгрузки удаляются"""
+        for table, f in self.files.items():
+            f.close()
+            if not complete:
+                os.remove(os.path.join(self.out_dir, f"{table}.csv"))
+        if not complete:
+            return {}
+        return {table: {'file': f"{table}.csv", 'rows': rows} for table, rows in self.rows.items()}
+
+
+class ColumnarExporter:
+    """Запись таблиц по колонкам: файл на колонку и manifest.json"""
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.files: Dict[str, list] = {}     # таблица -> открытые файлы колонок
+        self.rows: Dict[str, int] = {}
+        # Манифест прошлой выгрузки не должен описывать перезаписываемые файлы
+        manifest = os.path.join(out_dir, 'manifest.json')
+        if os.path.exists(manifest):
+            os.remove(manifest)
+
+    @staticmethod
+    def column_file(name: str, kind: str) -> str:
+        return f"{name}.{ARRAY_TYPES[kind][1] if kind in ARRAY_TYPES else 'txt'}"
+
+    def _open_table(self, table: str) -> list:
+        table_dir = os.path.join(self.out_dir, table)
+        os.makedirs(table_dir, exist_ok=True)
+        return [open(os.path.join(table_dir, self.column_file(name, kind)), 'wb')
+                for name, kind in table_columns(table)]
+
+    def write(self, table: str, rows: List[list]):
+        files = self.files.get(table)
+        if files is None:
+            files = self.files[table] = self._open_table(table)
+        for index, ((name, kind), f) in enumerate(zip(table_columns(table), files)):
+            values = [row[index] for row in rows]
+            if kind in ARRAY_TYPES:
+                data = array(ARRAY_TYPES[kind][0], values)
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                f.write(data.tobytes())
+            else:
+                f.write(''.join(json.dumps(value, ensure_ascii=False) + '\n' for value in values).encode('utf-8'))
+        self.rows[table] = self.rows.get(table, 0) + len(rows)
+
+    def close(self, complete: bool = True) -> Dict:
+        """Закрыть файлы колонок; манифест - только если выгрузка завершена"""
+        tables = {}
+        for table, files in self.files.items():
+            for f in files:
+                f.close()
+            tables[table] = {
+                'rows': self.rows[table],
+                'columns': [
+                    {'name': name, 'type': kind, 'file': f"{table}/{self.column_file(name, kind)}"}
+                    for name, kind in table_columns(table)
+                ]
+            }
+        manifest = {
+            'format': 'azs-columnar',
+            'version': 1,
+            'created': datetime.now().isoformat(),
+            'byteorder': 'little',
+            'tables': tables,
+        }
+        if complete:
+            with open(os.path.join(self.out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return tables
+
+
+EXPORTERS = {'csv': CSVExporter, 'columnar': ColumnarExporter}
+
+
+def export_history(records: Iterable[Dict], out_dir: str, formats: Iterable[str] = ('csv',),
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, Dict]:
+    """Выгрузить историю в out_dir (csv/ и columnar/ по выбранным форматам)
+
+    records - поток транзакций, например storage.iter_transactions().
+    Возвращает по каждому формату число строк в таблицах.
+    """
+    exporters = {}
+    for name in formats:
+        if name not in EXPORTERS:
+            raise ValueError(f"Неизвестный формат выгрузки: {name}")
+        format_dir = os.path.join(out_dir, name)
+        os.makedirs(format_dir, exist_ok=True)
+        exporters[name] = EXPORTERS[name](format_dir)
+    try:
+        for chunk in iter_chunks(records, chunk_size):
+            for table, rows in chunk.items():
+                for exporter in exporters.values():
+                    exporter.write(table, rows)
+    except BaseException:
+        # Файлы закрываются, но недописанная выгрузка не получает манифеста
+        for exporter in exporters.values():
+            exporter.close(complete=False)
+        raise
+    return {name: exporter.close() for name, exporter in exporters.items()}
+
+
+def read_column(manifest_dir: str, column: Dict, start: int = 0, count: Optional[int] = None) -> list:
+    """Прочитать значения колонки из колоночной выгрузки (для проверки и простых загрузчиков)"""
+    path = os.path.join(manifest_dir, column['file'])
+    kind = column['type']
+    if kind in ARRAY_TYPES:
+        data = array(ARRAY_TYPES[kind][0])
+        with open(path, 'rb') as f:
+            f.seek(start * data.itemsize)
+            raw = f.read() if count is None else f.read(count * data.itemsize)
+        data.frombytes(raw)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        return [bool(value) for value in data] if kind == 'bool' else data.tolist()
+    values = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f):
+            if index < start:
+                continue
+            if count is not None and len(values) >= count:
+                break
+            values.append(json.loads(line))
+    return values
@@ -0,0 +1,228 @@
+"""
+Сводный отчёт по сети АЗС
+
+Каждая станция хранит свою директорию данных (как data/ у DataStorage).
+Отчёт находит эти директории, параллельно в нескольких процессах сводит
+по каждой цистерны, статистику и историю транзакций в небольшой
+частичный итог, а затем объединяет частичные итоги в один отчёт.
+Директории станций только читаются. Для станций в режиме сохранения wal
+к снимку цистерн и статистики доприменяется state.wal, как при запуске АЗС.
+"""
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from data.binlog import BinaryTransactionLog
+from data.journal import TransactionJournal, WriteAheadLog
+from data.models import Statistics, Tank
+from data.segments import SegmentArchive
+
+# Файлы, по которым директория опознаётся как директория данных станции
+STATION_MARKERS = ('tanks.json', 'statistics.json', 'transactions.jsonl', 'transactions.bin', 'azs.db')
+
+
+def discover_stations(root: str) -> List[str]:
+    """Найти директории данных станций внутри root"""
+    stations = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if any(marker in filenames for marker in STATION_MARKERS):
+            stations.append(dirpath)
+            dirnames.clear()  # вложенных станций в директории станции нет
+        else:
+            dirnames.sort()
+    return sorted(stations)
+
+
+def empty_summary() -> Dict:
+    """Пустой частичный итог"""
+    return {
+        'stations': 0,
+        'failed': [],
+        'total_cars': 0,
+        'total_income': 0.0,
+        'fuel': {},        # fuel_type: {'liters', 'income'} - по статистике станций
+        'columns': {},     # колонка: литров по истории продаж
+        'tanks': {},       # fuel_type: {'count', 'capacity', 'volume', 'disabled', 'below_min', 'sold'}
+        'transactions': 0,
+    }
+
+
+def _load_json(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _iter_history(station_dir: str) -> Iterator[Dict]:
+    """История транзакций станции (архив и журнал или старый transactions.json)"""
+    yield from SegmentArchive(os.path.join(station_dir, 'archive')).read()
+    for journal in (BinaryTransactionLog(os.path.join(station_dir, 'transactions.bin')),
+                    TransactionJournal(os.path.join(station_dir, 'transactions.jsonl'))):
+        if journal.exists():
+            yield from journal.read()
+            return
+    legacy = os.path.join(station_dir, 'transactions.json')
+    if os.path.exists(legacy):
+        yield from _load_json(legacy) or []
+
+
+def _add_tank(summary: Dict, fuel_type: str, max_volume: float, current_volume: float,
+              min_level: float, enabled: bool):
+    """Учесть цистерну в частичном итоге"""
+    totals = summary['tanks'].setdefault(fuel_type, {
+        'count': 0, 'capacity': 0.0, 'volume': 0.0, 'disabled': 0, 'below_min': 0, 'sold': 0.0
+    })
+    totals['count'] += 1
+    totals['capacity'] += max_volume
+    totals['volume'] += current_volume
+    totals['disabled'] += not enabled
+    totals['below_min'] += current_volume < min_level
+
+
+def _summarize_sqlite(db_path: str, summary: Dict):
+    """Частичный итог по станции с хранилищем SQLite: агрегаты считает сама база"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for fuel_type, max_volume, current_volume, min_level, enabled in conn.execute(
+                "SELECT fuel_type, max_volume, current_volume, min_level, enabled FROM tanks"):
+            _add_tank(summary, fuel_type, max_volume, current_volume, min_level, bool(enabled))
+        totals = conn.execute("SELECT total_cars, total_income FROM statistics").fetchone()
+        if totals:
+            summary['total_cars'], summary['total_income'] = totals
+        for fuel_type, liters, income in conn.execute("SELECT fuel_type, liters, income FROM fuel_stats"):
+            summary['fuel'][fuel_type] = {'liters': liters, 'income': income}
+        summary['transactions'] = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        for column, liters in conn.execute(
+                "SELECT column_no, SUM(json_extract(details, '$.liters')) FROM transactions "
+                "WHERE type = 'sale' GROUP BY column_no"):
+            summary['columns'][column] = liters
+        for fuel_type, liters in conn.execute(
+                "SELECT t.fuel_type, SUM(json_extract(h.details, '$.liters')) FROM transactions h "
+                "JOIN tanks t ON t.id = h.tank_id WHERE h.type = 'sale' GROUP BY t.fuel_type"):
+            summary['tanks'][fuel_type]['sold'] += liters
+    finally:
+        conn.close()
+
+
+def summarize_station(station_dir: str) -> Dict:
+    """Частичный итог по одной станции (выполняется в процессе-обработчике)"""
+    summary = empty_summary()
+    db_path = os.path.join(station_dir, 'azs.db')
+    try:
+        if os.path.exists(db_path):
+            _summarize_sqlite(db_path, summary)
+            summary['stations'] = 1
+            return summary
+
+        tanks_path = os.path.join(station_dir, 'tanks.json')
+        tanks = [Tank.from_dict(tank)
+                 for tank in (_load_json(tanks_path) if os.path.exists(tanks_path) else None) or []]
+        stats_path = os.path.join(station_dir, 'statistics.json')
+        saved = (_load_json(stats_path) if os.path.exists(stats_path) else None) or {}
+        stats = Statistics(total_cars=saved.get('total_cars', 0), total_income=saved.get('total_income', 0.0),
+                           fuel_stats=dict(saved.get('fuel_stats', {})))
+        # Операции после последнего снимка есть только в журнале изменений
+        tanks_by_id = {tank.id: tank for tank in tanks}
+        for record in WriteAheadLog(os.path.join(station_dir, 'state.wal')).read():
+            WriteAheadLog.apply_state(record, tanks_by_id, stats)
+
+        tank_fuel = {}
+        for tank in tanks:
+            tank_fuel[tank.id] = tank.fuel_type
+            _add_tank(summary, tank.fuel_type, tank.max_volume, tank.current_volume,
+                      tank.min_level, tank.enabled)
+
+        summary['total_cars'] = stats.total_cars
+        summary['total_income'] = stats.total_income
+        for fuel_type, values in stats.fuel_stats.items():
+            summary['fuel'][fuel_type] = {'liters': values['liters'], 'income': values['income']}
+
+        columns = summary['columns']
+        for record in _iter_history(station_dir):
+            summary['transactions'] += 1
+            if record.get('type') != 'sale':
+                continue
+            details = record['details']
+            liters = details['liters']
+            columns[details['column']] = columns.get(details['column'], 0.0) + liters
+            fuel_type = tank_fuel.get(details.get('tank_id'))
+            if fuel_type is not None:
+                summary['tanks'][fuel_type]['sold'] += liters
+    except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+        failed = empty_summary()
+        failed['failed'].append(f"{station_dir}: {e}")
+        return failed
+
+    summary['stations'] = 1
+    return summary
+
+
+def merge_summaries(total: Dict, part: Dict) -> Dict:
+    """Добавить частичный итог к общему"""
+    total['stations'] += part['stations']
+    total['failed'].extend(part['failed'])
+    total['total_cars'] += part['total_cars']
+    total['total_income'] += part['total_income']
+    total['transactions'] += part['transactions']
+    for fuel_type, values in part['fuel'].items():
+        fuel = total['fuel'].setdefault(fuel_type, {'liters': 0.0, 'income': 0.0})
+        fuel['liters'] += values['liters']
+        fuel['income'] += values['income']
+    for column, liters in part['columns'].items():
+        total['columns'][column] = total['columns'].get(column, 0.0) + liters
+    for fuel_type, values in part['tanks'].items():
+        tanks = total['tanks'].setdefault(fuel_type, dict.fromkeys(values, 0))
+        for key, value in values.items():
+            tanks[key] += value
+    return total
+
+
+def build_fleet_report(root: str, workers: Optional[int] = None) -> Dict:
+    """Собрать сводный отчёт по всем станциям в root"""
+    stations = discover_stations(root)
+    report = empty_summary()
+    if not stations:
+        return report
+    if workers == 1:
+        for station_dir in stations:
+            merge_summaries(report, summarize_station(station_dir))
+        return report
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Крупные порции уменьшают накладные расходы на передачу задач между процессами
+        chunksize = max(1, len(stations) // ((workers or os.cpu_count() or 1) * 4))
+        for part in pool.map(summarize_station, stations, chunksize=chunksize):
+            merge_summaries(report, part)
+    return report
+
+
+def format_report(report: Dict) -> str:
+    """Текстовое представление сводного отчёта"""
+    lines = [
+        "--- Сводный отчёт по сети АЗС ---",
+        f"Станций: {report['stations']}",
+        f"Обслужено автомобилей: {report['total_cars']}",
+        f"Общий доход: {report['total_income']:,.2f} ₽",
+        f"Транзакций в истории: {report['transactions']}",
+        "",
+        "Продано топлива:",
+    ]
+    for fuel_type, values in sorted(report['fuel'].items()):
+        lines.append(f"{fuel_type:6} - {values['liters']:12,.1f} л ({values['income']:16,.2f} ₽)")
+
+    lines += ["", "Отпущено по колонкам (по истории продаж):"]
+    for column, liters in sorted(report['columns'].items(), key=lambda item: int(item[0])):
+        lines.append(f"Колонка {column}: {liters:12,.1f} л")
+
+    lines += ["", "Цистерны:"]
+    for fuel_type, tanks in sorted(report['tanks'].items()):
+        fill = tanks['volume'] / tanks['capacity'] * 100 if tanks['capacity'] else 0.0
+        turnover = tanks['sold'] / tanks['capacity'] if tanks['capacity'] else 0.0
+        lines.append(f"{fuel_type:6} - цистерн: {tanks['count']:5} | заполнение: {fill:5.1f}% | "
+                     f"оборот: {turnover:6.2f} объёма | отключено: {tanks['disabled']} | "
+                     f"ниже порога: {tanks['below_min']}")
+
+    if report['failed']:
+        lines += ["", "Не удалось прочитать:"]
+        lines += [f" - {error}" for error in report['failed']]
+    return "\n".join(lines)
@@ -0,0 +1,174 @@
+"""
+Живая панель состояния АЗС для терминала
+
+Панель показывает цистерны, колонки, аварийный режим и последние продажи и
+обновляется сама раз в refresh секунд. Изменения берутся из ленты
+AZSCore.feed, а не из хранилища: за тик читаются только новые события.
+Экран размечен на ячейки с постоянным местом и шириной; на терминал
+выводятся только ячейки, текст которых изменился (с переводом курсора
+ANSI-последовательностью), так что в спокойное время панель почти ничего
+не пишет.
+"""
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from core.azs_core import AZSCore
+from core.feed import EMERGENCY, TANK, TRANSACTION
+import config
+
+CSI = "\033["
+WIDTH = 78
+BAR_WIDTH = 20
+RECENT_SALES = 8
+
+Cell = Tuple[int, int]  # (строка, столбец) на экране, с единицы
+
+
+class Dashboard:
+    """Живая панель: состояние из ленты изменений, перерисовка изменившихся ячеек"""
+
+    def __init__(self, azs: AZSCore, refresh: float = 1.0, out=None, recent: int = RECENT_SALES):
+        self.azs = azs
+        self.refresh = refresh
+        self.out = out or sys.stdout
+        self.recent = recent
+        self.screen: Dict[Cell, str] = {}
+        self.bottom = 1
+        self._resync()
+
+    # --- Состояние ---
+
+    def _resync(self):
+        """Прочитать полное состояние (при запуске и если панель отстала от ленты)"""
+        # Номер берём до чтения: события после него применятся повторно, значения в них абсолютные
+        self.seq = self.azs.feed.seq
+        self.tanks = {
+            tank.id: {'fuel_type': tank.fuel_type, 'volume': tank.current_volume, 'max_volume': tank.max_volume,
+                      'min_level': tank.min_level, 'enabled': tank.enabled}
+            for tank in self.azs.tanks
+        }
+        self.routes: Dict[Tuple[int, str], list] = {}
+        for tank in self.azs.tanks:
+            for column in tank.connected_to:
+                self.routes.setdefault((column, tank.fuel_type), []).append(tank.id)
+        self.emergency = self.azs.is_emergency
+        self.sales = deque(maxlen=self.recent)
+        for record in reversed(self.azs.get_recent_transactions(self.recent * 4)):
+            if record.get('type') == 'sale':
+                self.sales.appendleft(self._sale_row(record['timestamp'], record['details']))
+
+    @staticmethod
+    def _sale_row(timestamp: str, details: Dict) -> str:
+        return (f"{timestamp[11:19]}  колонка {details['column']}  {details['fuel_type']:6} "
+                f"{details['liters']:8.2f} л  {details['total_price']:10.2f} руб.")
+
+    def apply_changes(self) -> bool:
+        """Применить новые события ленты; True - что-то изменилось"""
+        events, self.seq, lost = self.azs.feed.since(self.seq)
+        if lost:
+            self._resync()
+            return True
+        for _, kind, data in events:
+            if kind == TANK:
+                tank_id, volume, enabled = data
+                tank = self.tanks.get(tank_id)
+                if tank is not None:
+                    tank['volume'] = volume
+                    tank['enabled'] = enabled
+            elif kind == EMERGENCY:
+                self.emergency = data
+            elif kind == TRANSACTION and data.type == 'sale':
+                self.sales.appendleft(self._sale_row(data.timestamp, data.details))
+        return bool(events)
+
+    # --- Экран ---
+
+    def _fuel_available(self, column: int, fuel_type: str) -> bool:
+        return any(self.tanks[tank_id]['enabled'] for tank_id in self.routes.get((column, fuel_type), ()))
+
+    def frame(self) -> Dict[Cell, str]:
+        """Текст всех ячеек экрана"""
+        cells: Dict[Cell, str] = {}
+
+        def put(row: int, col: int, width: int, text: str):
+            cells[(row, col)] = text[:width].ljust(width)
+
+        put(1, 1, 60, "АЗС <<СеверНефть>> - состояние станции")
+        put(1, WIDTH - 7, 8, datetime.now().strftime('%H:%M:%S'))
+        put(2, 1, WIDTH, "=" * WIDTH)
+        put(3, 1, WIDTH, "!!! АВАРИЙНЫЙ РЕЖИМ - все операции заблокированы !!!" if self.emergency
+            else "Режим: нормальная работа")
+
+        row = 5
+        put(row, 1, WIDTH, "Цистерны")
+        for tank_id, tank in self.tanks.items():
+            row += 1
+            filled = round(BAR_WIDTH * tank['volume'] / tank['max_volume']) if tank['max_volume'] else 0
+            filled = min(max(filled, 0), BAR_WIDTH)
+            if tank['volume'] < tank['min_level']:
+                warning = " (ниже порога)"
+            elif tank['volume'] < tank['min_level'] * 2:
+                warning = " (низкий)"
+            else:
+                warning = ""
+            put(row, 1, 10, tank_id)
+            put(row, 12, 6, tank['fuel_type'])
+            put(row, 19, BAR_WIDTH + 2, "[" + "#" * filled + "." * (BAR_WIDTH - filled) + "]")
+            put(row, 42, 18, f"{tank['volume']:8.0f} / {tank['max_volume']:.0f} л")
+            put(row, 61, 18, ("ВКЛ" if tank['enabled'] else "ВЫКЛ") + warning)
+
+        row += 2
+        put(row, 1, WIDTH, "Колонки")
+        columns = list(config.COLUMNS_CONFIG.items())
+        half = (len(columns) + 1) // 2
+        for i, (column, fuels) in enumerate(columns):
+            marks = "  ".join(f"{fuel} {'✓' if self._fuel_available(column, fuel) else '✗'}" for fuel in fuels)
+            put(row + 1 + i % half, 1 if i < half else WIDTH // 2 + 1, WIDTH // 2, f"{column}: {marks}")
+        row += half + 2
+
+        put(row, 1, WIDTH, "Последние продажи")
+        for i in range(self.recent):
+            put(row + 1 + i, 1, WIDTH, self.sales[i] if i < len(self.sales) else "")
+        row += self.recent + 2
+        put(row, 1, WIDTH, f"Обновление раз в {self.refresh:g} с. Ctrl+C - выход")
+        self.bottom = row
+        return cells
+
+    def draw(self) -> int:
+        """Вывести изменившиеся ячейки; вернуть их число"""
+        frame = self.frame()
+        parts = [f"{CSI}{row};{col}H{text}" for (row, col), text in frame.items()
+                 if self.screen.get((row, col)) != text]
+        # Ячейки, которых больше нет (например, после пересчёта состояния), стираем
+        parts.extend(f"{CSI}{row};{col}H{' ' * len(text)}" for (row, col), text in self.screen.items()
+                     if (row, col) not in frame)
+        self.screen = frame
+        if parts:
+            self.out.write("".join(parts) + f"{CSI}{self.bottom + 1};1H")
+            self.out.flush()
+        return len(parts)
+
+    def run(self, duration: Optional[float] = None, stop: Optional[threading.Event] = None):
+        """Показывать панель до Ctrl+C, события stop или истечения duration секунд"""
+        wait = stop.wait if stop is not None else time.sleep
+        deadline = None if duration is None else time.monotonic() + duration
+        # Экран очищаем один раз, дальше только перерисовка ячеек; курсор прячем
+        self.out.write(f"{CSI}?25l{CSI}2J")
+        self.screen = {}
+        try:
+            while stop is None or not stop.is_set():
+                started = time.monotonic()
+                self.apply_changes()
+                self.draw()
+                if deadline is not None and started >= deadline:
+                    break
+                wait(max(0.0, self.refresh - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.out.write(f"{CSI}{self.bottom + 1};1H{CSI}?25h\n")
+            self.out.flush()
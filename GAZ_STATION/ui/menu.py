@@ -2,8 +2,10 @@
 Модуль пользовательского интерфейса (меню)
 """
 import os
+from datetime import datetime
 from typing import Dict, List
 from core.azs_core import AZSCore
+from utils.validators import validate_integer
 import config
 
 class AZSMenu:  # ВАЖНО: класс должен называться именно AZSMenu
@@ -15,7 +17,11 @@ class AZSMenu:  # ВАЖНО: класс должен называться им
     
     def clear_screen(self):
         """Очистить экран консоли"""
-        os.system('cls' if os.name == 'nt' else 'clear')
+        if os.name == 'nt':
+            os.system('cls')
+        else:
+            # ANSI: очистить экран и вернуть курсор в начало (без запуска оболочки)
+            print("\033[2J\033[H", end="", flush=True)
     
     def print_header(self):
         """Вывести заголовок АЗС"""
@@ -58,6 +64,7 @@ class AZSMenu:  # ВАЖНО: класс должен называться им
         print("7) Управление цистернами")
         print("8) Состояние колонок")
         print("9) EMERGENCY - аварийная ситуация")
+        print("10) Живая панель состояния")
         print("0) Выход")
         
         return input("\n> ")
@@ -157,7 +164,7 @@ class AZSMenu:  # ВАЖНО: класс должен называться им
         print("--- Состояние цистерн ---\n")
         
         print("Доступные цистерны:")
-        for i, tank in enumerate(self.azs.tanks, 1):
+        for i, tank in enumerate(self.azs.snapshot().tanks.values(), 1):
             status = "ВКЛ" if tank.enabled else "ВЫКЛ"
             warning = ""
             
@@ -218,7 +225,8 @@ class AZSMenu:  # ВАЖНО: класс должен называться им
         self.clear_screen()
         print("--- Баланс и статистика ---\n")
         
-        stats = self.azs.stats
+        # Снимок: продажи в других потоках не изменят цифры посреди вывода
+        stats = self.azs.snapshot().stats
         
         print(f"Обслужено автомобилей: {stats.total_cars}")
         print(f"Общий доход: {stats.total_income:,.2f} ₽\n")
@@ -233,40 +241,100 @@ class AZSMenu:  # ВАЖНО: класс должен называться им
             else:
                 print(f"{fuel_type:6} -    0.0 л (       0.00 ₽)")
         
+        # Продажи за сегодня по часам - из корзин статистики, без чтения истории
+        today = datetime.now().date().isoformat()
+        hours = self.azs.get_rollups('hour', 'fuel', since=today)
+        if hours:
+            print("\nСегодня по часам:")
+            for period, metrics in hours:
+                print(f"{period[11:13]}:00 - {metrics['liters']:7.1f} л "
+                      f"({metrics['income']:10,.2f} ₽, продаж: {metrics['sales']})")
+        
         self.wait_for_enter()
     
     def show_history(self):
-        """Показать историю операций"""
-        self.clear_screen()
-        print("--- История операций ---\n")
-        
-        transactions = self.azs.get_recent_transactions(15)
+        """Показать историю операций (с фильтром и постраничным просмотром)"""
+        filters = {}
+        cursor = None
         
-        if not transactions:
-            print("История операций пуста")
-        else:
-            for trans in transactions:
-                trans_type = trans['type']
-                timestamp = trans['timestamp'][:19].replace('T', ' ')
-                details = trans['details']
-                
-                if trans_type == 'sale':
-                    print(f"[{timestamp}] Продажа: {details['liters']} л {details['fuel_type']} "
-                          f"на колонке {details['column']} за {details['total_price']:.2f} ₽")
-                elif trans_type == 'refuel':
-                    print(f"[{timestamp}] Пополнение: +{details['liters_added']} л в {details['tank_id']} "
-                          f"(новый объем: {details['new_volume']} л)")
-                elif trans_type == 'transfer':
-                    print(f"[{timestamp}] Перекачка: {details['liters']} л {details['fuel_type']} "
-                          f"из {details['from_tank']} в {details['to_tank']}")
-                elif trans_type == 'tank_toggle':
-                    state = "ВКЛ" if details['new_state'] else "ВЫКЛ"
-                    print(f"[{timestamp}] Цистерна {details['tank_id']} {details['action']} ({state})")
-                elif trans_type == 'emergency':
-                    action = "активирован" if details['action'] == 'activated' else "деактивирован"
-                    print(f"[{timestamp}] Аварийный режим {action}")
-        
-        self.wait_for_enter()
+        while True:
+            self.clear_screen()
+            print("--- История операций ---\n")
+            if filters:
+                print("Фильтр: " + ", ".join(f"{name}={value}" for name, value in filters.items()) + "\n")
+            
+            transactions, next_cursor = self.azs.query_transactions(limit=15, cursor=cursor, **filters)
+            
+            if not transactions:
+                print("Операции не найдены" if filters else "История операций пуста")
+            else:
+                for trans in transactions:
+                    self._print_transaction(trans)
+            
+            print("\nДействия:")
+            if next_cursor is not None:
+                print("1) Следующая страница")
+            print("2) Задать фильтр")
+            print("3) Назад")
+            
+            action = input("\nВыберите действие: ").strip()
+            if action == '1' and next_cursor is not None:
+                cursor = next_cursor
+            elif action == '2':
+                filters = self._ask_history_filters()
+                cursor = None
+            else:
+                return
+    
+    def _ask_history_filters(self) -> Dict:
+        """Запросить фильтр истории (пустой ввод - без ограничения)"""
+        print("\nОставьте поле пустым, чтобы не ограничивать выборку")
+        filters = {}
+        trans_type = input("Тип (sale, refuel, transfer, tank_toggle, emergency): ").strip()
+        if trans_type:
+            filters['trans_type'] = trans_type
+        column = input("Колонка: ").strip()
+        if column:
+            valid, number = validate_integer(column, 1, len(config.COLUMNS_CONFIG))
+            if valid:
+                filters['column'] = number
+            else:
+                print("ОШИБКА: Неверный номер колонки - не учитывается")
+        tank_id = input("Цистерна: ").strip()
+        if tank_id:
+            filters['tank_id'] = tank_id
+        fuel_type = input("Вид топлива: ").strip()
+        if fuel_type:
+            filters['fuel_type'] = fuel_type
+        since = input("С (ГГГГ-ММ-ДД[ ЧЧ:ММ]): ").strip()
+        if since:
+            filters['since'] = since.replace(' ', 'T')
+        until = input("По (не включая, ГГГГ-ММ-ДД[ ЧЧ:ММ]): ").strip()
+        if until:
+            filters['until'] = until.replace(' ', 'T')
+        return filters
+    
+    def _print_transaction(self, trans: Dict):
+        """Вывести одну строку истории"""
+        trans_type = trans['type']
+        timestamp = trans['timestamp'][:19].replace('T', ' ')
+        details = trans['details']
+        
+        if trans_type == 'sale':
+            print(f"[{timestamp}] Продажа: {details['liters']} л {details['fuel_type']} "
+                  f"на колонке {details['column']} за {details['total_price']:.2f} ₽")
+        elif trans_type == 'refuel':
+            print(f"[{timestamp}] Пополнение: +{details['liters_added']} л в {details['tank_id']} "
+                  f"(новый объем: {details['new_volume']} л)")
+        elif trans_type == 'transfer':
+            print(f"[{timestamp}] Перекачка: {details['liters']} л {details['fuel_type']} "
+                  f"из {details['from_tank']} в {details['to_tank']}")
+        elif trans_type == 'tank_toggle':
+            state = "ВКЛ" if details['new_state'] else "ВЫКЛ"
+            print(f"[{timestamp}] Цистерна {details['tank_id']} {details['action']} ({state})")
+        elif trans_type == 'emergency':
+            action = "активирован" if details['action'] == 'activated' else "деактивирован"
+            print(f"[{timestamp}] Аварийный режим {action}")
     
     def transfer_fuel_menu(self):
         """Меню перекачки топлива"""
@@ -444,6 +512,11 @@ class AZSMenu:  # ВАЖНО: класс должен называться им
         
         self.wait_for_enter()
     
+    def show_dashboard(self):
+        """Живая панель состояния (выход - Ctrl+C)"""
+        from ui.dashboard import Dashboard
+        Dashboard(self.azs, config.DASHBOARD_REFRESH).run()
+    
     def emergency_menu(self):
         """Меню аварийной ситуации"""
         self.clear_screen()
@@ -550,6 +623,9 @@ class AZSMenu:  # ВАЖНО: класс должен называться им
             elif choice == '9':
                 self.emergency_menu()
             
+            elif choice == '10':
+                self.show_dashboard()
+            
             else:
                 print("Неверный выбор. Попробуйте еще раз.")
                 self.wait_for_enter()
\ No newline at end of file
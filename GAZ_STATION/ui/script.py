@@ -0,0 +1,146 @@
+"""
+Пакетное выполнение команд АЗС без диалога (скрипт или поток stdin)
+
+Одна команда на строку, слова через пробел; пустые строки и строки с #
+пропускаются:
+  sale КОЛОНКА ТОПЛИВО ЛИТРЫ
+  refuel ЦИСТЕРНА ЛИТРЫ
+  transfer ИСТОЧНИК ПРИЕМНИК ЛИТРЫ
+  enable ЦИСТЕРНА / disable ЦИСТЕРНА
+  emergency on|off
+Аргументы проверяются так же, как в меню (utils.validators). Идущие подряд
+продажи выполняются пачкой через serve_customers_batch, остальные команды -
+по одной, но между ними не пишутся файлы состояния: AZSCore для скрипта
+создаётся с отложенной записью, и состояние сохраняется раз в интервал и в
+конце. На каждую строку-команду выводится JSON-строка с результатом.
+"""
+import json
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple
+
+from core.azs_core import AZSCore
+from utils.validators import validate_integer, validate_positive_number
+import config
+
+BATCH_SIZE = 1000  # продаж в одной пачке
+
+USAGE = {
+    'sale': "sale КОЛОНКА ТОПЛИВО ЛИТРЫ",
+    'refuel': "refuel ЦИСТЕРНА ЛИТРЫ",
+    'transfer': "transfer ИСТОЧНИК ПРИЕМНИК ЛИТРЫ",
+    'enable': "enable ЦИСТЕРНА",
+    'disable': "disable ЦИСТЕРНА",
+    'emergency': "emergency on|off",
+}
+
+
+class ScriptError(ValueError):
+    """Некорректная строка скрипта"""
+
+
+def parse_sale(args: List[str]) -> Tuple[int, str, float]:
+    """Аргументы продажи: (колонка, топливо, литры)"""
+    if len(args) != 3:
+        raise ScriptError(f"Ожидается: {USAGE['sale']}")
+    valid, column = validate_integer(args[0], 1, len(config.COLUMNS_CONFIG))
+    if not valid:
+        raise ScriptError(f"Неверный номер колонки: {args[0]}")
+    if args[1] not in config.FUEL_TYPES:
+        raise ScriptError(f"Неизвестный вид топлива: {args[1]}")
+    return column, args[1], _liters(args[2])
+
+
+def _liters(value: str) -> float:
+    valid, liters = validate_positive_number(value)
+    if not valid:
+        raise ScriptError(f"Количество должно быть положительным числом: {value}")
+    return liters
+
+
+def _arguments(command: str, args: List[str], count: int):
+    if len(args) != count:
+        raise ScriptError(f"Ожидается: {USAGE[command]}")
+
+
+class ScriptRunner:
+    """Выполнение команд скрипта над AZSCore с выводом результатов в JSON-строках"""
+
+    def __init__(self, azs: AZSCore, out: TextIO, batch_size: int = BATCH_SIZE):
+        self.azs = azs
+        self.out = out
+        self.batch_size = batch_size
+        # Продажи, ждущие выполнения пачкой, и ошибки разбора между ними: (строка, продажа или ошибка)
+        self._pending: List[Tuple[int, object]] = []
+        self._sales: List[Tuple[int, str, float]] = []
+        self.executed = 0
+        self.failed = 0
+
+    def run(self, lines: Iterable[str]) -> Dict:
+        """Выполнить все команды; вернуть число выполненных и неудачных"""
+        for number, line in enumerate(lines, 1):
+            words = line.split()
+            if not words or words[0].startswith('#'):
+                continue
+            command, args = words[0].lower(), words[1:]
+            if command == 'sale':
+                try:
+                    sale = parse_sale(args)
+                except ScriptError as e:
+                    self._pending.append((number, e))
+                else:
+                    self._pending.append((number, sale))
+                    self._sales.append(sale)
+                # Считаем и ошибочные строки - буфер и задержка вывода не растут без предела
+                if len(self._pending) >= self.batch_size:
+                    self._flush_sales()
+                continue
+            self._flush_sales()
+            try:
+                success, message = self._execute(command, args)
+            except ScriptError as e:
+                success, message = False, str(e)
+            self._emit(number, command, success, message)
+        self._flush_sales()
+        return {'executed': self.executed, 'failed': self.failed}
+
+    def _execute(self, command: str, args: List[str]) -> Tuple[bool, str]:
+        """Выполнить команду, кроме продажи"""
+        if command == 'refuel':
+            _arguments(command, args, 2)
+            return self.azs.refuel_tank(args[0], _liters(args[1]))
+        if command == 'transfer':
+            _arguments(command, args, 3)
+            return self.azs.transfer_fuel(args[0], args[1], _liters(args[2]))
+        if command in ('enable', 'disable'):
+            _arguments(command, args, 1)
+            return self.azs.toggle_tank(args[0], command == 'enable')
+        if command == 'emergency':
+            if args == ['on']:
+                return self.azs.trigger_emergency()
+            if args == ['off']:
+                return self.azs.deactivate_emergency()
+            raise ScriptError(f"Ожидается: {USAGE[command]}")
+        raise ScriptError(f"Неизвестная команда: {command}")
+
+    def _flush_sales(self):
+        """Выполнить накопленные продажи одной пачкой и вывести результаты по порядку строк"""
+        if not self._pending:
+            return
+        results = iter(self.azs.serve_customers_batch(self._sales) if self._sales else ())
+        for number, sale in self._pending:
+            if isinstance(sale, ScriptError):
+                self._emit(number, 'sale', False, str(sale))
+            else:
+                success, message, total_price = next(results)
+                self._emit(number, 'sale', success, message, total_price)
+        self._pending = []
+        self._sales = []
+
+    def _emit(self, number: int, command: str, success: bool, message: str,
+              total_price: Optional[float] = None):
+        self.executed += 1
+        if not success:
+            self.failed += 1
+        result = {'line': number, 'command': command, 'ok': success, 'message': message}
+        if total_price is not None:
+            result['total_price'] = total_price
+        self.out.write(json.dumps(result, ensure_ascii=False) + "\n")